@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+上传带宽限制与上传时段模块
+- 令牌桶限速：所有上传线程共用一个令牌桶，总上传速度不超过设定值，
+  避免占满乡镇办公室共用的上行带宽
+- 上传时段：大文件只在指定时段（例如夜间）上传，其余时间排队等待
+"""
+
+import time
+import threading
+
+
+class TokenBucket:
+    """线程安全的令牌桶（单位：字节）"""
+
+    def __init__(self, rate, burst=None, clock=time.monotonic, sleep=time.sleep):
+        """
+        Args:
+            rate: 每秒字节数，0表示不限速
+            burst: 桶容量（字节），默认为1秒的流量
+            clock: 时钟函数（测试时可替换）
+            sleep: 等待函数（测试时可替换）
+        """
+        self.clock = clock
+        self.sleep = sleep
+        self._lock = threading.Lock()
+        self.set_rate(rate, burst)
+
+    def set_rate(self, rate, burst=None):
+        """修改限速（运行中也可修改）"""
+        with self._lock:
+            self.rate = max(0.0, float(rate))
+            self.burst = float(burst) if burst else self.rate
+            self._tokens = self.burst
+            self._last = self.clock()
+
+    def consume(self, amount):
+        """
+        取出 amount 个令牌，令牌不足时等待
+
+        令牌可以透支：当前调用者按透支量等待，后来者排在其后，
+        多个线程同时上传时总速度仍然不超过 rate。
+        """
+        if self.rate <= 0 or amount <= 0:
+            return
+        with self._lock:
+            now = self.clock()
+            self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            self._tokens -= amount
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0
+        if wait > 0:
+            self.sleep(wait)
+
+
+class ThrottledReader:
+    """
+    限速的文件流：每次读取前从令牌桶取出对应的字节数
+
+    支持 seek/tell，oss2 可据此得到数据长度，普通上传和分片上传都可以使用。
+    """
+
+    def __init__(self, fileobj, bucket):
+        """
+        Args:
+            fileobj: 以二进制方式打开的文件或 io.BytesIO
+            bucket: TokenBucket
+        """
+        self.fileobj = fileobj
+        self.bucket = bucket
+
+    def read(self, size=-1):
+        data = self.fileobj.read(size)
+        self.bucket.consume(len(data))
+        return data
+
+    def seek(self, offset, whence=0):
+        return self.fileobj.seek(offset, whence)
+
+    def tell(self):
+        return self.fileobj.tell()
+
+    def close(self):
+        self.fileobj.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+
+def parse_clock(text):
+    """把 "HH:MM" 转换为当天的分钟数"""
+    hour, minute = text.strip().split(':')
+    hour, minute = int(hour), int(minute)
+    if not (0 <= hour <= 24 and 0 <= minute < 60) or hour * 60 + minute > 24 * 60:
+        raise ValueError(f"无效的时间: {text}")
+    return hour * 60 + minute
+
+
+class UploadWindow:
+    """每天的上传时段，例如 "22:00-06:00"（可跨越午夜）"""
+
+    # 等待时每次最多休眠的秒数（期间修改系统时间也能及时响应）
+    POLL_INTERVAL = 60
+
+    def __init__(self, spec, now=None, sleep=None):
+        """
+        Args:
+            spec: "HH:MM-HH:MM"
+            now: 返回当前本地时间（time.struct_time）的函数，默认 time.localtime
+            sleep: 等待函数（测试时可替换），默认 time.sleep
+
+        Raises:
+            ValueError: 格式错误
+        """
+        try:
+            start, end = spec.split('-')
+            self.start = parse_clock(start)
+            self.end = parse_clock(end)
+        except ValueError:
+            raise ValueError(f"上传时段格式应为 HH:MM-HH:MM: {spec}")
+        if self.start == self.end:
+            raise ValueError(f"上传时段的开始和结束时间相同: {spec}")
+        self.spec = spec.strip()
+        self.now = now or time.localtime
+        self.sleep = sleep
+
+    def _minutes(self):
+        now = self.now()
+        return now.tm_hour * 60 + now.tm_min + now.tm_sec / 60
+
+    def is_open(self):
+        """当前是否在上传时段内"""
+        minutes = self._minutes()
+        if self.start < self.end:
+            return self.start <= minutes < self.end
+        return minutes >= self.start or minutes < self.end
+
+    def seconds_until_open(self):
+        """距离上传时段开始的秒数，已在时段内时为0"""
+        if self.is_open():
+            return 0
+        return ((self.start - self._minutes()) % (24 * 60)) * 60
+
+    def wait(self, cancel_event=None):
+        """
+        等待直到进入上传时段
+
+        Args:
+            cancel_event: 可选，threading.Event，设置后停止等待
+
+        Returns:
+            是否已进入上传时段（被取消时为False）
+        """
+        while not self.is_open():
+            if cancel_event is not None and cancel_event.is_set():
+                return False
+            seconds = min(self.POLL_INTERVAL, max(1, self.seconds_until_open()))
+            if self.sleep is None and cancel_event is not None:
+                # 在取消事件上等待，取消时立即返回
+                cancel_event.wait(seconds)
+            else:
+                (self.sleep or time.sleep)(seconds)
+        return True
+
+    def __str__(self):
+        return self.spec
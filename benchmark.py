@@ -0,0 +1,450 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+性能基准测试
+以示例目录“西沟乡麻地沟村（资料扫描）”为模板生成指定规模的村/乡目录树，
+依次测量目录扫描、二维码生成、PDF生成、index.html生成和（模拟延迟的）OSS上传，
+输出吞吐量、p50/p95耗时和进程峰值内存的JSON报告，便于不同版本之间对比。
+
+用法示例：
+    python benchmark.py --households 200 --output bench.json
+    python benchmark.py --type 乡 --villages 5 --households 50 --latency-ms 30
+    python benchmark.py --compare bench.json
+    python benchmark.py --local-oss --failure-rate 0.05 --throttle-rate 0.02
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import platform
+import tempfile
+import threading
+from types import SimpleNamespace
+from reportlab.lib.pagesizes import A4
+
+from oss_helper import OSSConfig, OSSUploader
+from engine import DocumentProcessor
+from scanner import scan_directories, count_images
+from local_oss import LocalBucket
+import qr_render
+
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "西沟乡麻地沟村（资料扫描）")
+
+# 对比基准时，吞吐量下降或p95耗时上升超过该比例视为退化
+DEFAULT_REGRESSION_THRESHOLD = 0.10
+
+
+class LatencyBucket:
+    """模拟OSS Bucket：每次请求注入固定延迟，可选按带宽计算传输时间，只计算ETag不保存内容"""
+
+    def __init__(self, latency=0.02, bandwidth=None):
+        """
+        Args:
+            latency: 每次请求的延迟（秒）
+            bandwidth: 模拟带宽（字节/秒），None表示不限
+        """
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.put_count = 0
+        self.bytes_received = 0
+        self._lock = threading.Lock()
+
+    def _transfer(self, data):
+        delay = self.latency
+        if self.bandwidth:
+            delay += len(data) / self.bandwidth
+        time.sleep(delay)
+        with self._lock:
+            self.put_count += 1
+            self.bytes_received += len(data)
+        return SimpleNamespace(etag=hashlib.md5(data).hexdigest().upper())
+
+    def put_object_from_file(self, key, filename):
+        with open(filename, 'rb') as f:
+            return self._transfer(f.read())
+
+    def put_object(self, key, data):
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        return self._transfer(data)
+
+
+def make_benchmark_config(work_dir, concurrency):
+    """构造基准测试使用的OSS配置（不读取本地 oss_config.json）"""
+    config = OSSConfig(config_file=os.path.join(work_dir, "oss_config.json"))
+    config.access_key_id = "benchmark"
+    config.access_key_secret = "benchmark"
+    config.endpoint = "oss-cn-beijing.aliyuncs.com"
+    config.bucket_name = "benchmark-bucket"
+    config.upload_concurrency = concurrency
+    config.checkpoint_dir = os.path.join(work_dir, ".oss_checkpoints")
+    return config
+
+
+def load_template(template_dir):
+    """
+    读取模板目录中的家庭目录及其图片
+
+    Returns:
+        [(家庭目录名, [图片路径, ...]), ...]
+    """
+    template = []
+    for index in scan_directories(template_dir, "村"):
+        if index.images:
+            template.append((index.name, [image.path for image in index.images]))
+    if not template:
+        raise ValueError(f"模板目录中没有图片: {template_dir}")
+    return template
+
+
+def _place_file(src, dst):
+    """优先使用硬链接，避免大规模目录树占用磁盘；不支持时复制"""
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
+def generate_tree(template, root_dir, dir_type="村", households=100, villages=1):
+    """
+    按模板生成合成目录树
+
+    Args:
+        template: load_template() 的结果
+        root_dir: 输出根目录
+        dir_type: "村"（根目录/家庭）或"乡"（根目录/村/家庭）
+        households: 每个村的家庭目录数量
+        villages: 村数量（仅乡结构使用）
+
+    Returns:
+        生成的图片文件数量
+    """
+    if dir_type == "村":
+        parents = [root_dir]
+    else:
+        parents = [os.path.join(root_dir, f"第{v + 1}村") for v in range(villages)]
+
+    file_count = 0
+    for parent in parents:
+        for i in range(households):
+            name, images = template[i % len(template)]
+            household = f"{name}{i + 1:04d}"
+            household_dir = os.path.join(parent, household)
+            os.makedirs(household_dir, exist_ok=True)
+            for image in images:
+                file_name = os.path.basename(image).replace(name, household, 1)
+                _place_file(image, os.path.join(household_dir, file_name))
+                file_count += 1
+    return file_count
+
+
+def percentile(values, fraction):
+    """最近秩百分位数"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(fraction * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+
+def peak_rss_mb():
+    """进程峰值常驻内存（MB）；平台不支持时返回None"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 单位为KB，macOS 单位为字节
+    if sys.platform == 'darwin':
+        return round(peak / (1024 * 1024), 1)
+    return round(peak / 1024, 1)
+
+
+def summarize(durations, elapsed, units=None, unit_name=None, total_bytes=None):
+    """
+    汇总一项测量
+
+    Args:
+        durations: 每次调用的耗时（秒）
+        elapsed: 该项测量的总墙钟时间（秒）
+        units: 处理的单位数量（例如文件数），默认等于调用次数
+        unit_name: 单位名称
+        total_bytes: 传输的字节数（可选）
+    """
+    calls = len(durations)
+    units = calls if units is None else units
+    result = {
+        'calls': calls,
+        'elapsed_s': round(elapsed, 4),
+        'throughput_per_s': round(units / elapsed, 2) if elapsed > 0 else None,
+        'unit': unit_name or 'call',
+        'p50_ms': round(percentile(durations, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(durations, 0.95) * 1000, 3),
+        'max_ms': round(max(durations) * 1000, 3) if durations else 0.0,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+    if units != calls:
+        result['units'] = units
+    if total_bytes is not None:
+        result['mb_per_s'] = round(total_bytes / (1024 * 1024) / elapsed, 2) if elapsed > 0 else None
+    return result
+
+
+def _timed(func, *args, **kwargs):
+    """执行一次调用并返回 (结果, 耗时)"""
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def run_benchmark(root_dir, dir_type, work_dir, latency=0.02, bandwidth=None, concurrency=None,
+                  qr_size_mm=50, scan_repeat=5, process_pool=False, process_workers=None,
+                  local_oss=False, failure_rate=0.0, throttle_rate=0.0):
+    """
+    对一棵目录树运行各项测量
+
+    process_pool 为True时二维码和PDF在进程池中生成（逐个调用，测量的是单次耗时）
+    local_oss 为True时上传到本地OSS模拟器（保存对象，可注入随机故障和限流，测量重试的影响）
+
+    Returns:
+        {测量项: 汇总结果}
+    """
+    processor = DocumentProcessor(log=lambda message: None, process_pool=process_pool,
+                                  process_workers=process_workers)
+    config = make_benchmark_config(work_dir, concurrency or OSSConfig.DEFAULT_UPLOAD_CONCURRENCY)
+    if local_oss:
+        config.retry_base_delay = 0.05
+        bucket = LocalBucket(os.path.join(work_dir, "oss", dir_type), latency, bandwidth,
+                             failure_rate=failure_rate, throttle_rate=throttle_rate, seed=0)
+    else:
+        bucket = LatencyBucket(latency, bandwidth)
+    uploader = OSSUploader(config, bucket=bucket)
+    results = {}
+
+    # 目录扫描（重复多次，取每次的耗时）
+    durations = []
+    start = time.perf_counter()
+    for _ in range(scan_repeat):
+        _, duration = _timed(processor.get_target_directories, root_dir, dir_type)
+        durations.append(duration)
+    indexes = scan_directories(root_dir, dir_type)
+    results['get_target_directories'] = summarize(
+        durations, time.perf_counter() - start, units=len(indexes) * scan_repeat, unit_name='directory'
+    )
+
+    # 上传（每次调用上传一个目录）
+    file_count, total_bytes = count_images(indexes)
+    uploaded = {}
+    failed_files = 0
+    durations = []
+    start = time.perf_counter()
+    for index in indexes:
+        prefix = f"{os.path.basename(root_dir)}/{index.name}"
+        (success, fail, files), duration = _timed(
+            uploader.upload_directory, index.path, prefix, files=index.images
+        )
+        uploaded[index.path] = files
+        failed_files += fail
+        durations.append(duration)
+    results['upload_directory'] = summarize(
+        durations, time.perf_counter() - start, units=file_count, unit_name='file', total_bytes=total_bytes
+    )
+    if local_oss:
+        results['upload_directory']['failed_files'] = failed_files
+        results['upload_directory']['injected_errors'] = dict(bucket.errors)
+
+    # index.html
+    durations = []
+    start = time.perf_counter()
+    for index in indexes:
+        _, duration = _timed(processor.generate_index_html, index.path, uploaded[index.path], index.name)
+        durations.append(duration)
+    results['generate_index_html'] = summarize(durations, time.perf_counter() - start, unit_name='directory')
+
+    # 二维码（清空缓存，测量真实渲染）
+    qr_render.clear_cache()
+    urls = {index.path: processor.build_default_oss_url(index.path, root_dir) for index in indexes}
+    qr_paths = {index.path: os.path.join(index.path, f"{index.name}_qr.png") for index in indexes}
+    durations = []
+    start = time.perf_counter()
+    for index in indexes:
+        _, duration = _timed(processor.generate_qrcode, urls[index.path], qr_paths[index.path], qr_size_mm)
+        durations.append(duration)
+    results['generate_qrcode'] = summarize(durations, time.perf_counter() - start, unit_name='directory')
+
+    # PDF：矢量二维码与插入PNG两种方式
+    for name, vector in (('create_pdf_with_qrcode', True), ('create_pdf_with_qrcode_raster', False)):
+        durations = []
+        start = time.perf_counter()
+        for index in indexes:
+            pdf_path = os.path.join(index.path, f"{index.name}_qr.pdf")
+            _, duration = _timed(
+                processor.create_pdf_with_qrcode, qr_paths[index.path], pdf_path, A4, qr_size_mm, 10, 10,
+                urls[index.path] if vector else None
+            )
+            durations.append(duration)
+        results[name] = summarize(durations, time.perf_counter() - start, unit_name='directory')
+
+    processor.close()
+    return results
+
+
+def compare_reports(baseline, current, threshold=DEFAULT_REGRESSION_THRESHOLD):
+    """
+    对比两份报告
+
+    Returns:
+        (对比说明行列表, 是否存在退化)
+    """
+    lines = []
+    regressed = False
+    for dir_type, stages in current.get('results', {}).items():
+        base_stages = baseline.get('results', {}).get(dir_type, {})
+        for stage, result in stages.items():
+            base = base_stages.get(stage)
+            if not base:
+                continue
+            notes = []
+            if base.get('throughput_per_s') and result.get('throughput_per_s'):
+                ratio = result['throughput_per_s'] / base['throughput_per_s']
+                notes.append(f"吞吐量 x{ratio:.2f}")
+                if ratio < 1 - threshold:
+                    regressed = True
+                    notes.append("⚠ 退化")
+            if base.get('p95_ms') and result.get('p95_ms'):
+                ratio = result['p95_ms'] / base['p95_ms']
+                notes.append(f"p95 x{ratio:.2f}")
+                if ratio > 1 + threshold:
+                    regressed = True
+                    notes.append("⚠ 退化")
+            lines.append(f"[{dir_type}] {stage}: " + "，".join(notes))
+    return lines, regressed
+
+
+def build_parser():
+    """构建命令行参数解析器"""
+    parser = argparse.ArgumentParser(description="文档二维码生成器性能基准测试")
+    parser.add_argument("--type", dest="dir_types", choices=["村", "乡", "全部"], default="全部",
+                        help="测试的目录结构，默认村和乡都测试")
+    parser.add_argument("--households", type=int, default=100, help="每个村的家庭目录数量，默认100")
+    parser.add_argument("--villages", type=int, default=3, help="乡结构中的村数量，默认3")
+    parser.add_argument("--template", default=TEMPLATE_DIR, help="模板目录，默认使用示例目录")
+    parser.add_argument("--latency-ms", type=float, default=20, help="模拟OSS每次请求的延迟（毫秒），默认20")
+    parser.add_argument("--bandwidth-mbps", type=float, default=0, help="模拟上传带宽（Mbit/s），0表示不限")
+    parser.add_argument("--concurrency", type=int, default=None, help="并发上传数，默认使用配置默认值")
+    parser.add_argument("--local-oss", action="store_true",
+                        help="上传到本地OSS模拟器（对象保存在工作目录中），可配合故障注入参数")
+    parser.add_argument("--failure-rate", type=float, default=0,
+                        help="本地OSS模拟器随机返回500错误的概率，默认0")
+    parser.add_argument("--throttle-rate", type=float, default=0,
+                        help="本地OSS模拟器随机返回503限流的概率，默认0")
+    parser.add_argument("--qr-size", type=float, default=50, help="二维码大小（毫米），默认50")
+    parser.add_argument("--process-pool", action="store_true", help="二维码和PDF在进程池中生成")
+    parser.add_argument("--workers", type=int, default=None, help="进程池的进程数，默认CPU核数")
+    parser.add_argument("--scan-repeat", type=int, default=5, help="目录扫描重复次数，默认5")
+    parser.add_argument("--work-dir", default=None, help="合成目录树位置，默认使用临时目录")
+    parser.add_argument("--keep", action="store_true", help="保留合成目录树")
+    parser.add_argument("--output", default=None, help="JSON报告输出路径，默认打印到标准输出")
+    parser.add_argument("--compare", default=None, help="与指定的基准JSON报告对比")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_REGRESSION_THRESHOLD,
+                        help="对比时视为退化的变化比例，默认0.10")
+    return parser
+
+
+def main(argv=None):
+    """
+    基准测试入口
+
+    Returns:
+        进程退出码：0 正常，1 对比发现退化，2 参数错误
+    """
+    args = build_parser().parse_args(argv)
+
+    if not os.path.isdir(args.template):
+        print(f"错误：模板目录不存在: {args.template}", file=sys.stderr)
+        return 2
+    if args.households < 1 or args.villages < 1:
+        print("错误：家庭目录数量和村数量必须大于0", file=sys.stderr)
+        return 2
+
+    template = load_template(args.template)
+    dir_types = ["村", "乡"] if args.dir_types == "全部" else [args.dir_types]
+    bandwidth = args.bandwidth_mbps * 1000 * 1000 / 8 if args.bandwidth_mbps > 0 else None
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="wendang_bench_")
+    os.makedirs(work_dir, exist_ok=True)
+
+    report = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'params': {
+            'households': args.households,
+            'villages': args.villages,
+            'latency_ms': args.latency_ms,
+            'bandwidth_mbps': args.bandwidth_mbps,
+            'concurrency': args.concurrency or OSSConfig.DEFAULT_UPLOAD_CONCURRENCY,
+            'qr_size_mm': args.qr_size,
+            'process_pool': args.process_pool,
+            'local_oss': args.local_oss,
+            'failure_rate': args.failure_rate,
+            'throttle_rate': args.throttle_rate,
+        },
+        'trees': {},
+        'results': {},
+    }
+
+    try:
+        for dir_type in dir_types:
+            root_dir = os.path.join(work_dir, f"基准{dir_type}")
+            if os.path.exists(root_dir):
+                shutil.rmtree(root_dir)
+            file_count = generate_tree(template, root_dir, dir_type, args.households, args.villages)
+            report['trees'][dir_type] = {'root_dir': root_dir, 'files': file_count}
+            print(f"[{dir_type}] 生成 {file_count} 个文件，开始测量...", file=sys.stderr)
+
+            report['results'][dir_type] = run_benchmark(
+                root_dir, dir_type, work_dir,
+                latency=args.latency_ms / 1000,
+                bandwidth=bandwidth,
+                concurrency=args.concurrency,
+                qr_size_mm=args.qr_size,
+                scan_repeat=max(1, args.scan_repeat),
+                process_pool=args.process_pool,
+                process_workers=args.workers,
+                local_oss=args.local_oss,
+                failure_rate=args.failure_rate,
+                throttle_rate=args.throttle_rate,
+            )
+    finally:
+        if not args.keep and not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    report['peak_rss_mb'] = peak_rss_mb()
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + "\n")
+        print(f"报告已保存: {args.output}", file=sys.stderr)
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        lines, regressed = compare_reports(baseline, report, args.threshold)
+        for line in lines:
+            print(line, file=sys.stderr)
+        if regressed:
+            return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
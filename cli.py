@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+命令行入口（无界面批处理）
+适用于没有图形界面的服务器上运行夜间批处理任务。
+
+示例:
+    python cli.py "西沟乡麻地沟村（资料扫描）" --type 村 --page-size A4 --upload
+    python cli.py /data/某乡 --type 乡 --upload-only --concurrency 16
+    python cli.py /data/某乡 --type 乡 --upload --watch
+"""
+
+import os
+import sys
+import signal
+import argparse
+import multiprocessing
+from oss_helper import OSSConfig
+from engine import DocumentProcessor, PAGE_SIZES, resolve_page_size
+from qr_render import ERROR_CORRECTION_LEVELS, DEFAULT_ERROR_CORRECTION
+from scanner import DIR_TYPE_DEPTHS
+from bandwidth import UploadWindow
+from progress import ProgressReporter
+from tracing import start_tracing, stop_tracing
+from watch import WatchDaemon, DEFAULT_DEBOUNCE, DEFAULT_POLL_INTERVAL
+from derivatives import FORMATS as DERIVATIVE_FORMATS, DEFAULT_FORMAT as DEFAULT_DERIVATIVE_FORMAT
+from normalize import (DEFAULT_FORMAT as DEFAULT_NORMALIZE_FORMAT, DEFAULT_QUALITY as DEFAULT_NORMALIZE_QUALITY,
+                       DEFAULT_MAX_DIMENSION)
+
+
+def log_to_stdout(message):
+    """输出一行日志（整行写入，避免多线程输出交错）"""
+    sys.stdout.write(f"{message}\n")
+    sys.stdout.flush()
+
+
+def write_to_stderr(line):
+    """输出一行到标准错误（进度JSON行与日志分开）"""
+    sys.stderr.write(f"{line}\n")
+    sys.stderr.flush()
+
+
+def finish_tracing(args):
+    """结束跟踪，保存跟踪文件和性能分析结果，并把汇总输出到标准错误"""
+    tracer = stop_tracing()
+    if tracer is None:
+        return
+    try:
+        if args.trace:
+            tracer.write_chrome_trace(args.trace)
+        if args.profile:
+            tracer.write_profile(args.profile)
+    except Exception as e:
+        write_to_stderr(f"保存跟踪文件失败: {e}")
+    write_to_stderr(tracer.summary(max(1, args.trace_top)))
+
+
+def build_parser():
+    """构建命令行参数解析器"""
+    parser = argparse.ArgumentParser(
+        description="为目录中的图片生成二维码和PDF，并上传到阿里云OSS"
+    )
+    parser.add_argument("root_dir", help="根目录路径")
+    parser.add_argument("--type", dest="dir_type", choices=list(DIR_TYPE_DEPTHS.keys()), default="村",
+                        help="目录结构：村（二级）、乡（三级）或自动（任意深度的最深一级目录），默认村")
+
+    pdf_group = parser.add_argument_group("PDF设置")
+    pdf_group.add_argument("--page-size", choices=list(PAGE_SIZES.keys()), default="A4",
+                           help="页面尺寸，默认A4")
+    pdf_group.add_argument("--landscape", action="store_true", help="横向页面")
+    pdf_group.add_argument("--width", type=float, default=210, help="自定义宽度(mm)，默认210")
+    pdf_group.add_argument("--height", type=float, default=297, help="自定义高度(mm)，默认297")
+    pdf_group.add_argument("--batch-pdf", choices=["single", "tile"], default=None,
+                           help="同时生成合并PDF：single每页一个二维码，tile按页面拼版并标注目录名")
+    pdf_group.add_argument("--batch-pdf-path", default=None,
+                           help="合并PDF路径，默认为根目录下的“根目录名_qr_all.pdf”")
+    pdf_group.add_argument("--no-dir-pdf", action="store_true",
+                           help="不为每个目录生成单独的PDF（需配合 --batch-pdf 使用）")
+
+    qr_group = parser.add_argument_group("二维码设置")
+    qr_group.add_argument("--qr-size", type=float, default=50, help="二维码大小(mm)，默认50")
+    qr_group.add_argument("--x", type=float, default=10, help="X坐标(mm)，默认10")
+    qr_group.add_argument("--y", type=float, default=10, help="Y坐标(mm)，默认10")
+    qr_group.add_argument("--qr-level", choices=list(ERROR_CORRECTION_LEVELS.keys()),
+                          default=DEFAULT_ERROR_CORRECTION, help=f"纠错级别，默认{DEFAULT_ERROR_CORRECTION}")
+    qr_group.add_argument("--raster-qr", action="store_true",
+                          help="PDF中插入二维码PNG图片，而不是矢量绘制")
+
+    oss_group = parser.add_argument_group("OSS设置")
+    oss_group.add_argument("--config", default=OSSConfig.CONFIG_FILE,
+                           help=f"OSS配置文件路径，默认 {OSSConfig.CONFIG_FILE}")
+    oss_group.add_argument("--upload", action="store_true", help="生成二维码前上传图片到OSS")
+    oss_group.add_argument("--upload-only", action="store_true", help="仅上传到OSS，不生成二维码和PDF")
+    oss_group.add_argument("--retry-failed", action="store_true",
+                           help="只重新上传上次重试后仍然失败的文件（记录在根目录的 .wendang_failed.json）")
+    oss_group.add_argument("--concurrency", type=int, default=None,
+                           help="每个目录的并发上传数，默认使用配置文件中的值")
+    oss_group.add_argument("--bandwidth-limit", type=float, default=None, metavar="KB/S",
+                           help="总上传带宽上限（KB/s，所有并发上传共用），0为不限速，默认使用配置文件中的值")
+    oss_group.add_argument("--upload-window", default=None, metavar="HH:MM-HH:MM",
+                           help="上传时段，例如 22:00-06:00；时段外大文件排队等待，默认使用配置文件中的值")
+    oss_group.add_argument("--upload-window-min-mb", type=float, default=None,
+                           help="不小于该大小（MB）的文件才受上传时段限制，默认使用配置文件中的值")
+    oss_group.add_argument("--skip-existing", action="store_true",
+                           help="上传前列举OSS上的已有文件，跳过大小和MD5相同的文件")
+    oss_group.add_argument("--no-derivatives", action="store_true",
+                           help="上传时不生成缩略图，图片浏览页面直接加载原图")
+    oss_group.add_argument("--derivative-format", choices=list(DERIVATIVE_FORMATS.keys()),
+                           default=DEFAULT_DERIVATIVE_FORMAT, help="缩略图格式，默认webp")
+    oss_group.add_argument("--no-dedup", action="store_true",
+                           help="不进行跨目录去重（默认内容相同的文件只上传一次，其余副本使用OSS服务端复制）")
+    oss_group.add_argument("--normalize", action="store_true",
+                           help="上传前压缩图片：按EXIF方向旋转、缩小、转换格式并去除元数据（结果缓存在 .normalized 中）")
+    oss_group.add_argument("--normalize-format", choices=list(DERIVATIVE_FORMATS.keys()),
+                           default=DEFAULT_NORMALIZE_FORMAT, help=f"压缩后的格式，默认{DEFAULT_NORMALIZE_FORMAT}")
+    oss_group.add_argument("--normalize-quality", type=int, default=DEFAULT_NORMALIZE_QUALITY,
+                           help=f"压缩质量(1-100)，默认{DEFAULT_NORMALIZE_QUALITY}")
+    oss_group.add_argument("--max-dimension", type=int, default=DEFAULT_MAX_DIMENSION,
+                           help=f"压缩后长边像素上限，0为不缩小，默认{DEFAULT_MAX_DIMENSION}")
+
+    run_group = parser.add_argument_group("运行设置")
+    run_group.add_argument("--max-in-flight", type=int, default=None,
+                           help=f"同时处理的最大目录数，默认 {DocumentProcessor.PIPELINE_MAX_IN_FLIGHT}")
+    run_group.add_argument("--process-pool", action="store_true",
+                           help="二维码和PDF在多个进程中生成，充分利用多核CPU")
+    run_group.add_argument("--workers", type=int, default=None,
+                           help="进程池的进程数（也用于生成缩略图），默认CPU核数")
+    run_group.add_argument("--full", action="store_true",
+                           help="全量处理，不跳过未变化的图片和生成物")
+    run_group.add_argument("--no-resume", action="store_true",
+                           help="不从上次被取消或中断的运行处继续，重新处理全部目录")
+    run_group.add_argument("--progress-json", type=float, default=0, metavar="SECONDS",
+                           help="每隔指定秒数向标准错误输出一行JSON格式的进度（完成百分比、速度、剩余时间），默认不输出")
+
+    watch_group = parser.add_argument_group("监视模式")
+    watch_group.add_argument("--watch", action="store_true",
+                             help="处理完成后持续监视根目录，只处理有新增或变化图片的目录（Ctrl+C 退出）")
+    watch_group.add_argument("--debounce", type=float, default=DEFAULT_DEBOUNCE, metavar="SECONDS",
+                             help=f"目录在指定秒数内没有新文件后才处理，默认{DEFAULT_DEBOUNCE:g}")
+    watch_group.add_argument("--watch-backend", choices=["auto", "inotify", "poll"], default="auto",
+                             help="监视方式：auto（Linux上使用inotify，否则定时扫描）、inotify、poll，默认auto")
+    watch_group.add_argument("--poll-interval", type=float, default=DEFAULT_POLL_INTERVAL, metavar="SECONDS",
+                             help=f"定时扫描的间隔秒数，默认{DEFAULT_POLL_INTERVAL:g}")
+
+    trace_group = parser.add_argument_group("跟踪与性能分析")
+    trace_group.add_argument("--trace", default=None, metavar="FILE",
+                             help="记录各阶段和各文件操作的耗时，保存为Chrome跟踪文件（chrome://tracing 或 Perfetto 打开）")
+    trace_group.add_argument("--profile", default=None, metavar="FILE",
+                             help="同时使用 cProfile 分析所有线程，结果保存到指定文件（pstats格式）")
+    trace_group.add_argument("--trace-memory", action="store_true",
+                             help="同时使用 tracemalloc 统计内存分配最多的代码行")
+    trace_group.add_argument("--trace-top", type=int, default=10, metavar="N",
+                             help="跟踪汇总中列出最慢的目录和文件的数量，默认10")
+    return parser
+
+
+def main(argv=None):
+    """
+    命令行主函数
+
+    Returns:
+        退出码：0 全部成功，1 有目录处理失败，2 参数错误，130 被 Ctrl+C 取消
+    """
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.root_dir):
+        print(f"错误: 根目录不存在: {args.root_dir}", file=sys.stderr)
+        return 2
+
+    if args.no_dir_pdf and not args.batch_pdf:
+        print("错误: --no-dir-pdf 需要配合 --batch-pdf 使用", file=sys.stderr)
+        return 2
+
+    if args.watch and (args.batch_pdf or args.retry_failed):
+        # 监视模式每次只处理变化的目录，合并PDF会只包含这些目录
+        print("错误: --watch 不能与 --batch-pdf 或 --retry-failed 同时使用", file=sys.stderr)
+        return 2
+
+    try:
+        page_size = resolve_page_size(
+            args.page_size, "横向" if args.landscape else "纵向", args.width, args.height
+        )
+    except ValueError as e:
+        print(f"错误: {e}", file=sys.stderr)
+        return 2
+
+    oss_config = OSSConfig(args.config)
+    if args.concurrency:
+        oss_config.upload_concurrency = max(1, args.concurrency)
+    if args.bandwidth_limit is not None:
+        oss_config.bandwidth_limit_kb = max(0.0, args.bandwidth_limit)
+    if args.upload_window is not None:
+        oss_config.upload_window = args.upload_window.strip()
+    if args.upload_window_min_mb is not None:
+        oss_config.upload_window_min_mb = max(0.0, args.upload_window_min_mb)
+    if oss_config.upload_window:
+        try:
+            UploadWindow(oss_config.upload_window)
+        except ValueError as e:
+            print(f"错误: {e}", file=sys.stderr)
+            return 2
+
+    if (args.upload or args.upload_only or args.retry_failed) and not oss_config.is_valid():
+        print(f"错误: OSS未配置，请检查配置文件 {args.config}", file=sys.stderr)
+        return 2
+
+    processor = DocumentProcessor(
+        oss_config,
+        log=log_to_stdout,
+        max_in_flight=args.max_in_flight,
+        qr_vector=not args.raster_qr,
+        qr_error_correction=args.qr_level,
+        derivatives=not args.no_derivatives,
+        derivative_format=args.derivative_format,
+        process_pool=args.process_pool,
+        process_workers=args.workers,
+        skip_existing=args.skip_existing,
+        normalize=args.normalize,
+        normalize_format=args.normalize_format,
+        normalize_quality=args.normalize_quality,
+        normalize_max_dimension=args.max_dimension,
+        dedup=not args.no_dedup
+    )
+    incremental = not args.full
+    resume = not args.no_resume
+
+    def run(directories=None):
+        """运行一次，directories 为监视模式下需要处理的目录；返回出错的目录数"""
+        if args.retry_failed:
+            _, failed_count = processor.retry_failed_uploads(args.root_dir)
+        elif args.upload_only:
+            _, failed_count = processor.upload_all_directories(args.root_dir, args.dir_type, incremental, resume,
+                                                               directories)
+        else:
+            _, _, failed_count = processor.process_all_directories(
+                args.root_dir, args.dir_type, page_size, args.qr_size, args.x, args.y,
+                auto_upload=args.upload, incremental=incremental, batch_layout=args.batch_pdf,
+                batch_pdf_path=args.batch_pdf_path, per_directory_pdf=not args.no_dir_pdf, resume=resume,
+                directories=directories
+            )
+        return failed_count
+
+    daemon = None
+    if args.watch:
+        daemon = WatchDaemon(args.root_dir, args.dir_type, run, debounce=args.debounce,
+                             backend=args.watch_backend, poll_interval=args.poll_interval, log=log_to_stdout)
+
+    # 第一次 Ctrl+C 取消运行（进行中的文件上传完成后退出，下次运行从中断处继续），再按一次立即退出
+    def on_interrupt(signum, frame):
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+        processor.cancel()
+        if daemon is not None:
+            daemon.stop()
+
+    try:
+        previous_handler = signal.signal(signal.SIGINT, on_interrupt)
+    except ValueError:
+        # 不在主线程中运行时无法设置信号处理
+        previous_handler = None
+
+    reporter = None
+    if args.progress_json > 0:
+        reporter = ProgressReporter(processor.progress, write_to_stderr, args.progress_json)
+        reporter.start()
+
+    tracing = bool(args.trace or args.profile or args.trace_memory)
+    if tracing:
+        start_tracing(profile=bool(args.profile), memory=args.trace_memory)
+
+    try:
+        if daemon is not None:
+            # 先开始监视再处理现有目录，处理期间放入的文件也不会遗漏
+            try:
+                daemon.start()
+            except OSError as e:
+                print(f"错误: 无法监视根目录: {e}", file=sys.stderr)
+                return 2
+        failed_count = run()
+        if daemon is not None and not processor.cancelled:
+            daemon.run()
+        if processor.cancelled:
+            return 130
+        return 1 if failed_count else 0
+    finally:
+        if daemon is not None:
+            daemon.close()
+        if tracing:
+            finish_tracing(args)
+        if reporter is not None:
+            reporter.stop()
+        if previous_handler is not None:
+            signal.signal(signal.SIGINT, previous_handler)
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+CPU密集任务进程池
+二维码渲染、PDF生成、缩略图等图片处理在多个进程中执行，充分利用多核。
+任务参数只传递路径和少量参数，结果只返回文件大小等元数据，
+像素数据不在进程之间传递。
+"""
+
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from reportlab.lib.units import mm
+from qr_render import render_qr_png, draw_qr_vector
+
+
+def default_workers():
+    """默认进程数：CPU核数"""
+    return os.cpu_count() or 1
+
+
+class CPUPool:
+    """按需创建的进程池；进程数为1时直接在当前进程中执行"""
+
+    def __init__(self, workers=None):
+        """
+        Args:
+            workers: 进程数，默认CPU核数
+        """
+        self.workers = max(1, int(workers or default_workers()))
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self):
+        """底层ProcessPoolExecutor；进程数为1时为None"""
+        if self.workers <= 1:
+            return None
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            return self._executor
+
+    def submit(self, func, *args):
+        """
+        提交任务
+
+        Returns:
+            Future；进程数为1时返回已完成的Future
+        """
+        executor = self.executor
+        if executor is not None:
+            return executor.submit(func, *args)
+
+        future = Future()
+        try:
+            future.set_result(func(*args))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def run(self, func, *args):
+        """提交任务并等待结果（任务中的异常原样抛出）"""
+        return self.submit(func, *args).result()
+
+    def close(self):
+        """关闭进程池（下次提交任务时重新创建）"""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+
+
+def qrcode_task(url, output_path, size_px, error_correction):
+    """
+    渲染二维码PNG并写入文件
+
+    Returns:
+        (输出路径, 文件大小)
+    """
+    png_data = render_qr_png(url, size_px, error_correction)
+    with open(output_path, 'wb') as f:
+        f.write(png_data)
+    return output_path, len(png_data)
+
+
+def pdf_task(pdf_path, page_size, qr_size_mm, x_mm, y_mm, qr_url, qr_image_path, error_correction):
+    """
+    生成包含一个二维码的PDF；提供 qr_url 时以矢量绘制，否则插入 qr_image_path 图片
+
+    Returns:
+        (输出路径, 文件大小)
+    """
+    from reportlab.pdfgen import canvas
+    c = canvas.Canvas(pdf_path, pagesize=page_size)
+
+    # 将毫米转换为点（ReportLab使用点作为单位）
+    qr_size = qr_size_mm * mm
+    x_pos = x_mm * mm
+    y_pos = y_mm * mm
+
+    # 在PDF上绘制二维码
+    if qr_url:
+        draw_qr_vector(c, qr_url, x_pos, y_pos, qr_size, error_correction)
+    else:
+        c.drawImage(qr_image_path, x_pos, y_pos, width=qr_size, height=qr_size)
+
+    c.save()
+    return pdf_path, os.path.getsize(pdf_path)
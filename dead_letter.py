@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+上传失败列表模块
+重试用完仍然失败的文件记录在根目录下的 .wendang_failed.json 中，
+“重试失败文件”只重新上传这些文件所在的目录，无需重新处理整个乡镇。
+"""
+
+import os
+import json
+import time
+import threading
+
+
+class DeadLetterList:
+    """根目录级别的上传失败列表"""
+
+    FILE_NAME = ".wendang_failed.json"
+
+    def __init__(self, root_dir, file_name=None):
+        """
+        Args:
+            root_dir: 根目录路径，失败列表保存在该目录下
+            file_name: 文件名，默认 FILE_NAME
+        """
+        self.root_dir = os.path.abspath(root_dir)
+        self.path = os.path.join(self.root_dir, file_name or self.FILE_NAME)
+        self.entries = {}
+        self._lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        """从文件加载失败列表"""
+        if not os.path.exists(self.path):
+            return
+
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for entry in json.load(f):
+                    self.entries[entry['path']] = entry
+        except Exception as e:
+            print(f"加载失败列表失败: {e}")
+
+    def save(self):
+        """保存失败列表；列表为空时删除文件"""
+        with self._lock:
+            entries = sorted(self.entries.values(), key=lambda entry: entry['path'])
+            try:
+                if not entries:
+                    if os.path.exists(self.path):
+                        os.remove(self.path)
+                    return
+                tmp_path = self.path + ".tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(entries, f, ensure_ascii=False, indent=2)
+                os.replace(tmp_path, self.path)
+            except Exception as e:
+                print(f"保存失败列表失败: {e}")
+
+    def _key(self, path):
+        """使用相对根目录的路径作为键"""
+        rel_path = os.path.relpath(os.path.abspath(path), self.root_dir)
+        return rel_path.replace(os.sep, '/')
+
+    def add(self, local_path, oss_path, error):
+        """
+        记录一个上传失败的文件
+
+        Args:
+            local_path: 本地文件路径
+            oss_path: 目标OSS路径
+            error: 错误信息
+        """
+        key = self._key(local_path)
+        with self._lock:
+            entry = self.entries.get(key, {'path': key, 'attempts': 0})
+            entry.update({
+                'oss_path': oss_path,
+                'error': str(error),
+                'attempts': entry['attempts'] + 1,
+                'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+            })
+            self.entries[key] = entry
+
+    def remove(self, local_path):
+        """文件上传成功后从列表中移除"""
+        with self._lock:
+            self.entries.pop(self._key(local_path), None)
+
+    def discard_directory(self, directory):
+        """移除某个目录下的全部记录（目录已被删除时）"""
+        prefix = self._key(directory) + '/'
+        with self._lock:
+            for key in [key for key in self.entries if key.startswith(prefix)]:
+                del self.entries[key]
+
+    def directories(self):
+        """
+        包含失败文件的目录
+
+        Returns:
+            目录绝对路径列表（按路径排序）
+        """
+        with self._lock:
+            keys = list(self.entries)
+        directories = {os.path.dirname(os.path.join(self.root_dir, *key.split('/'))) for key in keys}
+        return sorted(directories)
+
+    def __len__(self):
+        with self._lock:
+            return len(self.entries)
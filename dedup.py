@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+跨目录去重模块
+同一份身份证、土地证常被扫描进多个家庭目录。一次运行中按内容（MD5 + 大小）建立索引：
+相同内容第一次出现时正常上传，之后的副本使用OSS服务端复制（CopyObject），不再重复传输。
+增量清单中已上传且本地文件未变化的文件也加入索引，以前运行上传过的内容同样可以复制。
+
+一个对象被重新上传或被复制覆盖时，索引中以它为来源的旧记录随即删除；复制时还以来源
+对象的ETag作为条件，来源内容已不是记录的内容时复制失败，改为正常上传。索引记录上传时
+OSS返回的ETag（分片上传的对象为“哈希-分片数”，不等于内容MD5），未知时使用内容MD5。
+"""
+
+import os
+import threading
+from manifest import file_md5
+
+
+# OSS CopyObject 支持的最大对象（1GB），更大的文件正常上传
+COPY_MAX_SIZE = 1024 * 1024 * 1024
+
+
+class ContentIndex:
+    """一次运行的内容索引（线程安全）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (MD5, 大小) → {'key': 已上传的完整对象路径（上传中为None）, 'etag': 该对象的ETag,
+        #               'done': 上传结束事件}
+        self._entries = {}
+        # 完整对象路径 → 以该对象为复制来源的 (MD5, 大小)
+        self._sources = {}
+        # (路径, 大小, 修改时间) → MD5
+        self._hashes = {}
+        self.copied_files = 0
+        self.bytes_saved = 0
+
+    def hash(self, path, size, mtime_ns):
+        """
+        计算文件MD5（同一文件在一次运行中只计算一次）
+
+        Args:
+            path: 文件路径
+            size: 文件大小
+            mtime_ns: 修改时间（纳秒）
+        """
+        key = (path, size, mtime_ns)
+        with self._lock:
+            md5 = self._hashes.get(key)
+        if md5 is None:
+            md5 = file_md5(path)
+            with self._lock:
+                self._hashes[key] = md5
+        return md5
+
+    def _forget(self, key, keep=None):
+        """对象 key 的内容将变为 keep 以外的内容：删除以它为来源的记录（调用方需持有锁）"""
+        entry_key = self._sources.get(key)
+        if entry_key is None or entry_key == keep:
+            return
+        del self._sources[key]
+        entry = self._entries.get(entry_key)
+        if entry is not None and entry['key'] == key:
+            del self._entries[entry_key]
+
+    def _set_source(self, entry_key, key, etag):
+        """把对象 key 登记为 entry_key 内容的复制来源（调用方需持有锁）"""
+        self._forget(key, keep=entry_key)
+        entry = self._entries[entry_key]
+        if entry['key'] is not None and entry['key'] != key:
+            self._sources.pop(entry['key'], None)
+        entry['key'] = key
+        # ETag 统一为不带引号的大写形式，未知时普通上传的ETag即内容MD5
+        entry['etag'] = (etag or entry_key[0]).strip('"').upper()
+        self._sources[key] = entry_key
+
+    def add(self, md5, size, key, etag=None, replace=False):
+        """
+        登记OSS上已有的对象（例如清单中的记录、跳过上传的文件、重新上传的文件）
+
+        Args:
+            md5: 内容MD5（十六进制）
+            size: 大小
+            key: 完整的OSS对象路径
+            etag: 对象的ETag，未知时为None
+            replace: 已有记录时是否替换（原对象复制失败后重新上传时使用）
+        """
+        entry_key = (md5.lower(), size)
+        with self._lock:
+            self._forget(key, keep=entry_key)
+            entry = self._entries.get(entry_key)
+            if entry is None:
+                done = threading.Event()
+                done.set()
+                self._entries[entry_key] = {'key': None, 'etag': None, 'done': done}
+                self._set_source(entry_key, key, etag)
+            elif replace and entry['key'] is not None:
+                self._set_source(entry_key, key, etag)
+
+    def forget(self, key):
+        """对象 key 将被写入不经过索引的内容（例如空文件、超过复制上限的文件），不再作为复制来源"""
+        with self._lock:
+            self._forget(key)
+
+    def seed_from_manifest(self, manifest):
+        """
+        把增量清单中已上传的文件加入索引
+
+        只登记本地文件大小和修改时间仍与记录一致的文件：本地文件已改写时，
+        其对象会在本次运行中被重新上传，记录的MD5不能再作为复制依据。
+        """
+        for record in manifest.uploaded_files():
+            if not (record.get('md5') and record.get('oss_key') and record.get('size') is not None):
+                continue
+            try:
+                stat = os.stat(os.path.join(manifest.root_dir, record['path']))
+            except (OSError, KeyError):
+                continue
+            if stat.st_size == record['size'] and stat.st_mtime_ns == record.get('mtime_ns'):
+                self.add(record['md5'], record['size'], record['oss_key'], record.get('etag'))
+
+    def acquire(self, md5, size, key):
+        """
+        上传前查询相同内容
+
+        相同内容正在由其他线程上传时等待其结束：上传成功则复制，失败则由当前线程上传。
+        对象 key 的内容即将改变，以它为来源的旧记录同时删除。
+
+        Args:
+            md5: 内容MD5
+            size: 大小
+            key: 本次上传的完整对象路径
+
+        Returns:
+            (复制来源的对象路径, 来源对象的ETag, 是否由当前线程上传)：
+            来源为None且需要上传时，上传结束后必须调用 release()
+        """
+        entry_key = (md5.lower(), size)
+        while True:
+            with self._lock:
+                self._forget(key, keep=entry_key)
+                entry = self._entries.get(entry_key)
+                if entry is None:
+                    self._entries[entry_key] = {'key': None, 'etag': None, 'done': threading.Event()}
+                    return None, None, True
+                if entry['key'] is not None:
+                    if entry['key'] == key:
+                        return None, None, False
+                    return entry['key'], entry['etag'], False
+                done = entry['done']
+            done.wait()
+
+    def release(self, md5, size, key, etag=None):
+        """
+        acquire() 返回需要上传后，上传结束时调用
+
+        Args:
+            key: 上传成功时为对象路径，失败时为None（等待中的下一个副本将改为上传）
+            etag: 上传成功时OSS返回的ETag
+        """
+        entry_key = (md5.lower(), size)
+        with self._lock:
+            entry = self._entries.get(entry_key)
+            if entry is None:
+                return
+            if key is None:
+                del self._entries[entry_key]
+            else:
+                self._set_source(entry_key, key, etag)
+            entry['done'].set()
+
+    def record_copy(self, size):
+        """记录一次服务端复制节省的上传字节数"""
+        with self._lock:
+            self.copied_files += 1
+            self.bytes_saved += size
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+派生图片模块
+为图片浏览页面生成缩略图和中等尺寸图片（WebP/JPEG），原图只在点击放大时加载。
+- JPEG 使用 Pillow 的 draft() 在解码时直接按 1/2、1/4、1/8 缩小，大图无需完整解码
+- 按 EXIF 方向信息旋转后输出，派生图片不保留元数据
+- 多张图片在进程池中并行处理，充分利用多核
+"""
+
+import os
+from scanner import ImageFile
+from cpu_pool import CPUPool
+
+
+# 派生图片保存在目录下的隐藏子目录中，不会被当作原始图片扫描
+DERIVATIVE_DIR = ".derivatives"
+
+# 派生图片种类：长边像素、压缩质量
+DERIVATIVE_SIZES = {
+    'thumb': 400,
+    'medium': 1280,
+}
+DERIVATIVE_QUALITY = {
+    'thumb': 75,
+    'medium': 82,
+}
+
+# 输出格式：Pillow格式名、扩展名
+FORMATS = {
+    'webp': ('WEBP', '.webp'),
+    'jpeg': ('JPEG', '.jpg'),
+}
+DEFAULT_FORMAT = 'webp'
+
+
+def derivative_path(directory, kind, name, fmt=DEFAULT_FORMAT):
+    """派生图片的本地路径：目录/.derivatives/种类/原文件名.扩展名"""
+    return os.path.join(directory, DERIVATIVE_DIR, kind, name + FORMATS[fmt][1])
+
+
+def render_derivatives(src_path, targets, fmt=DEFAULT_FORMAT):
+    """
+    为一张图片生成多个尺寸的派生图片（在工作进程中执行）
+
+    Args:
+        src_path: 原图路径
+        targets: [(种类, 输出路径), ...]
+        fmt: 输出格式 webp/jpeg
+
+    Returns:
+        [(种类, 输出路径, 文件大小, 修改时间纳秒), ...]
+    """
+    from PIL import Image, ImageOps
+    pil_format, _ = FORMATS[fmt]
+    largest = max(DERIVATIVE_SIZES[kind] for kind, _ in targets)
+
+    with Image.open(src_path) as img:
+        # JPEG解码时直接缩小到不小于最大派生尺寸的比例
+        if img.format == 'JPEG' and max(img.size) > largest:
+            scale = largest / max(img.size)
+            img.draft('RGB', (int(img.width * scale) + 1, int(img.height * scale) + 1))
+        img = ImageOps.exif_transpose(img)
+
+        if fmt == 'jpeg' or img.mode not in ('RGB', 'RGBA'):
+            img = img.convert('RGBA' if fmt == 'webp' and 'A' in img.getbands() else 'RGB')
+
+        results = []
+        # 从大到小依次缩小，后一个尺寸基于前一个结果计算
+        for kind, output_path in sorted(targets, key=lambda t: DERIVATIVE_SIZES[t[0]], reverse=True):
+            max_px = DERIVATIVE_SIZES[kind]
+            img.thumbnail((max_px, max_px), Image.Resampling.LANCZOS, reducing_gap=2.0)
+
+            os.makedirs(os.path.dirname(output_path), exist_ok=True)
+            tmp_path = output_path + ".tmp"
+            img.save(tmp_path, format=pil_format, quality=DERIVATIVE_QUALITY[kind], optimize=True)
+            os.replace(tmp_path, output_path)
+
+            stat = os.stat(output_path)
+            results.append((kind, output_path, stat.st_size, stat.st_mtime_ns))
+
+    return results
+
+
+class DerivativeGenerator:
+    """派生图片生成器，在进程池中生成"""
+
+    def __init__(self, fmt=DEFAULT_FORMAT, kinds=None, workers=None, pool=None):
+        """
+        Args:
+            fmt: 输出格式 webp/jpeg
+            kinds: 生成的种类列表，默认 DERIVATIVE_SIZES 中的全部
+            workers: 进程数，默认CPU核数；1表示在当前进程中生成
+            pool: 可选，共用的CPUPool；提供时忽略workers，close()不关闭该进程池
+        """
+        if fmt not in FORMATS:
+            raise ValueError(f"不支持的派生图片格式: {fmt}")
+        self.fmt = fmt
+        self.kinds = list(kinds or DERIVATIVE_SIZES)
+        self._owns_pool = pool is None
+        self.pool = pool if pool is not None else CPUPool(workers)
+
+    def generate(self, directory, images, on_error=None):
+        """
+        为目录中的图片生成派生图片；已存在且比原图新的派生图片直接沿用
+
+        Args:
+            directory: 目录路径
+            images: 图片列表（scanner.ImageFile）
+            on_error: 出错回调 (image, exception)
+
+        Returns:
+            {种类: [ImageFile, ...]}，文件名为“原文件名.扩展名”，顺序与images一致
+        """
+        pending = []
+        done = {}
+        for image in images:
+            targets = []
+            for kind in self.kinds:
+                output_path = derivative_path(directory, kind, image.name, self.fmt)
+                try:
+                    stat = os.stat(output_path)
+                    if stat.st_mtime_ns >= image.mtime_ns:
+                        done[(image.name, kind)] = (output_path, stat.st_size, stat.st_mtime_ns)
+                        continue
+                except OSError:
+                    pass
+                targets.append((kind, output_path))
+            if targets:
+                pending.append((image, targets))
+
+        futures = [
+            (image, self.pool.submit(render_derivatives, image.path, targets, self.fmt))
+            for image, targets in pending
+        ]
+
+        for image, future in futures:
+            try:
+                results = future.result()
+            except Exception as e:
+                if on_error:
+                    on_error(image, e)
+                continue
+            for kind, output_path, size, mtime_ns in results:
+                done[(image.name, kind)] = (output_path, size, mtime_ns)
+
+        generated = {kind: [] for kind in self.kinds}
+        for image in images:
+            for kind in self.kinds:
+                entry = done.get((image.name, kind))
+                if entry:
+                    output_path, size, mtime_ns = entry
+                    generated[kind].append(ImageFile(os.path.basename(output_path), output_path, size, mtime_ns))
+        return generated
+
+    def close(self):
+        """关闭自有的进程池（下次生成时重新创建）"""
+        if self._owns_pool:
+            self.pool.close()
@@ -0,0 +1,1202 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+文档处理引擎（无界面）
+负责目录扫描、图片上传、二维码/PDF/index.html生成等全部处理逻辑，
+图形界面和命令行入口都通过 DocumentProcessor 调用。
+"""
+
+import os
+import threading
+from reportlab.lib.pagesizes import A3, A4, A5, landscape
+from reportlab.lib.units import mm
+from urllib.parse import quote
+from oss_helper import OSSConfig, OSSUploader
+from pipeline import Stage, StagedPipeline
+from manifest import Manifest
+from dead_letter import DeadLetterList
+from dedup import ContentIndex
+from progress import ProgressTracker
+from run_checkpoint import RunCheckpoint
+from tracing import span
+from qr_render import DEFAULT_ERROR_CORRECTION
+from pdf_batch import BatchPDFWriter
+from scanner import scan_directory, scan_directories, count_images
+from gallery import write_index_html, TEMPLATE_VERSION as GALLERY_TEMPLATE_VERSION
+from cpu_pool import CPUPool, qrcode_task, pdf_task
+from derivatives import (DerivativeGenerator, DEFAULT_FORMAT as DEFAULT_DERIVATIVE_FORMAT,
+                         DERIVATIVE_DIR, DERIVATIVE_SIZES)
+from normalize import (ImageNormalizer, DEFAULT_FORMAT as DEFAULT_NORMALIZE_FORMAT,
+                       DEFAULT_QUALITY as DEFAULT_NORMALIZE_QUALITY, DEFAULT_MAX_DIMENSION)
+
+
+# 页面尺寸映射
+PAGE_SIZES = {
+    "A3": A3,
+    "A4": A4,
+    "A5": A5,
+    "自定义": None
+}
+
+
+def resolve_page_size(page_size_name, orientation="纵向", custom_width_mm=None, custom_height_mm=None):
+    """
+    根据名称和方向计算页面尺寸
+    
+    Args:
+        page_size_name: "A3"、"A4"、"A5" 或 "自定义"
+        orientation: "纵向" 或 "横向"
+        custom_width_mm: 自定义宽度（毫米）
+        custom_height_mm: 自定义高度（毫米）
+        
+    Returns:
+        (宽度, 高度)，单位为点
+        
+    Raises:
+        ValueError: 页面尺寸名称无效或自定义尺寸不是数字
+    """
+    if page_size_name == "自定义":
+        width = float(custom_width_mm) * mm
+        height = float(custom_height_mm) * mm
+        # 应用方向
+        if orientation == "横向":
+            width, height = height, width
+        return (width, height)
+    
+    if page_size_name not in PAGE_SIZES:
+        raise ValueError(f"未知的页面尺寸: {page_size_name}")
+    
+    page_size = PAGE_SIZES[page_size_name]
+    # 应用方向
+    if orientation == "横向":
+        page_size = landscape(page_size)
+    return page_size
+
+
+class DocumentProcessor:
+    """文档处理引擎"""
+    
+    # 流水线中同时处理的最大目录数
+    PIPELINE_MAX_IN_FLIGHT = 8
+    # 各阶段线程数
+    PIPELINE_WORKERS = {'scan': 2, 'upload': 2, 'qrcode': 2, 'pdf': 2}
+    
+    def __init__(self, oss_config=None, oss_uploader=None, log=None,
+                 max_in_flight=None, stage_workers=None, qr_vector=True,
+                 qr_error_correction=DEFAULT_ERROR_CORRECTION, derivatives=True,
+                 derivative_format=DEFAULT_DERIVATIVE_FORMAT, process_pool=False, process_workers=None,
+                 skip_existing=False, normalize=False, normalize_format=DEFAULT_NORMALIZE_FORMAT,
+                 normalize_quality=DEFAULT_NORMALIZE_QUALITY, normalize_max_dimension=DEFAULT_MAX_DIMENSION,
+                 dedup=True, defer_oss=False):
+        """
+        Args:
+            oss_config: OSSConfig对象，默认从配置文件加载
+            oss_uploader: OSSUploader对象，默认在配置有效时自动创建
+            log: 日志函数，接收一条消息字符串，默认输出到标准输出
+            max_in_flight: 流水线中同时处理的最大目录数
+            stage_workers: 各阶段线程数，字典，键为 scan/upload/qrcode/pdf
+            qr_vector: PDF中是否以矢量绘制二维码（否则插入二维码PNG图片）
+            qr_error_correction: 二维码纠错级别 L/M/Q/H
+            derivatives: 上传时是否生成并上传缩略图/中等尺寸图片，供图片浏览页面使用
+            derivative_format: 派生图片格式 webp/jpeg
+            process_pool: 二维码和PDF生成是否在进程池中执行（缩略图始终使用进程池）
+            process_workers: 进程池的进程数，默认CPU核数
+            skip_existing: 上传前列举OSS上的已有对象，跳过大小和MD5相同的文件
+            normalize: 上传前压缩图片（按EXIF旋转、缩小、转换为JPEG/WebP、去除元数据）
+            normalize_format: 压缩后的格式 jpeg/webp
+            normalize_quality: 压缩质量 1-100
+            normalize_max_dimension: 长边像素上限，0为不缩小
+            dedup: 上传时跨目录去重，内容相同的文件只上传一次，其余副本使用OSS服务端复制
+            defer_oss: 初始化时不创建上传器（导入oss2、建立认证），
+                       由 prepare_oss_uploader() 在后台预热或在开始运行时创建
+        """
+        self.oss_config = oss_config if oss_config is not None else OSSConfig()
+        
+        # 取消运行：处理引擎和上传器共用同一个事件
+        self.cancel_event = threading.Event()
+        
+        self.oss_uploader = oss_uploader
+        self._uploader_lock = threading.Lock()
+        if oss_uploader is not None:
+            oss_uploader.cancel_event = self.cancel_event
+        elif not defer_oss:
+            self.prepare_oss_uploader()
+        
+        self._log = log or print
+        self.max_in_flight = max_in_flight or self.PIPELINE_MAX_IN_FLIGHT
+        self.stage_workers = dict(self.PIPELINE_WORKERS)
+        if stage_workers:
+            self.stage_workers.update(stage_workers)
+        self.qr_vector = qr_vector
+        self.qr_error_correction = qr_error_correction
+        self.derivatives = derivatives
+        self.derivative_format = derivative_format
+        self._derivative_generator = None
+        self._derivative_lock = threading.Lock()
+        self.process_pool = process_pool
+        self.cpu_pool = CPUPool(process_workers)
+        self.skip_existing = skip_existing
+        self.normalize = normalize
+        self.normalize_format = normalize_format
+        self.normalize_quality = normalize_quality
+        self.normalize_max_dimension = normalize_max_dimension
+        self.dedup = dedup
+        self.content_index = None
+        # 当前运行的进度（界面和命令行定时读取）
+        self.progress = ProgressTracker()
+    
+    def log(self, message):
+        """输出日志信息"""
+        self._log(message)
+    
+    def cancel(self):
+        """
+        取消当前运行（可从其他线程调用）
+        
+        不再开始新的目录和文件，进行中的文件上传完成后结束；
+        已完成的工作记录在运行断点和清单中，再次运行时从中断处继续。
+        """
+        if not self.cancel_event.is_set():
+            self.cancel_event.set()
+            self.log("正在取消，等待进行中的任务结束...")
+    
+    def prepare_oss_uploader(self):
+        """
+        创建OSS上传器，已创建或配置无效时直接返回（可从其他线程调用）
+        
+        Returns:
+            OSSUploader，配置无效时为None
+        """
+        with self._uploader_lock:
+            if self.oss_uploader is None and self.oss_config.is_valid():
+                uploader = OSSUploader(self.oss_config)
+                uploader.cancel_event = self.cancel_event
+                self.oss_uploader = uploader
+            return self.oss_uploader
+    
+    def reset_oss_uploader(self):
+        """
+        OSS配置修改后重新创建上传器（可从其他线程调用）
+        
+        与 prepare_oss_uploader() 使用同一把锁：正在进行的后台预热结束后才丢弃它创建的上传器，
+        预热不会用修改前的配置覆盖新的上传器。
+        
+        Returns:
+            OSSUploader，配置无效时为None
+        """
+        with self._uploader_lock:
+            self.oss_uploader = None
+        return self.prepare_oss_uploader()
+    
+    def reset_cancel(self):
+        """
+        开始新的运行前清除取消状态
+        
+        延迟创建的上传器在此创建；上传器可能已被替换，重新关联取消事件。
+        """
+        self.cancel_event.clear()
+        self.prepare_oss_uploader()
+        if self.oss_uploader is not None:
+            self.oss_uploader.cancel_event = self.cancel_event
+    
+    @property
+    def cancelled(self):
+        """当前运行是否已被取消"""
+        return self.cancel_event.is_set()
+    
+    def run_cpu_task(self, func, *args):
+        """
+        执行CPU密集任务：进程池模式下交给工作进程，否则在当前线程中执行
+        
+        Args:
+            func: cpu_pool 中的任务函数（参数为路径等少量数据）
+            
+        Returns:
+            任务返回的元数据
+        """
+        if self.process_pool:
+            return self.cpu_pool.run(func, *args)
+        return func(*args)
+    
+    def scan_directories(self, root_dir, dir_type, directories=None):
+        """
+        单次遍历根目录，返回目标目录索引（包含每个目录的图片及其大小、修改时间）
+        
+        Args:
+            root_dir: 根目录路径
+            dir_type: 目录类型，"村"（二级）、"乡"（三级）或"自动"（任意深度）
+            directories: 可选，只扫描这些目标目录（不遍历根目录，已不存在的目录被忽略）
+            
+        Returns:
+            DirectoryIndex列表
+        """
+        def on_error(directory, error):
+            self.log(f"读取目录 {directory} 时出错: {str(error)}")
+        
+        with span('scan_directories', 'scan', root=root_dir):
+            if directories is None:
+                return scan_directories(root_dir, dir_type, on_error=on_error)
+            indexes = []
+            for directory in directories:
+                try:
+                    indexes.append(scan_directory(directory)[0])
+                except FileNotFoundError:
+                    continue
+                except OSError as e:
+                    on_error(directory, e)
+            return indexes
+    
+    def get_target_directories(self, root_dir, dir_type):
+        """
+        获取目标目录列表（最深一级子目录）
+        
+        Args:
+            root_dir: 根目录路径
+            dir_type: 目录类型，"村"（二级）、"乡"（三级）或"自动"（任意深度）
+            
+        Returns:
+            目标目录列表
+        """
+        return [index.path for index in self.scan_directories(root_dir, dir_type)]
+    
+    def get_images_in_directory(self, directory):
+        """
+        获取目录中的所有图片文件
+        
+        Args:
+            directory: 目录路径
+            
+        Returns:
+            图片文件名列表
+        """
+        try:
+            index, _ = scan_directory(directory)
+        except Exception as e:
+            self.log(f"读取目录 {directory} 时出错: {str(e)}")
+            return []
+        
+        return [image.name for image in index.images]
+    
+    def generate_qrcode(self, url, output_path, size_mm=50):
+        """
+        生成二维码图片
+        
+        Args:
+            url: 二维码内容（URL）
+            output_path: 输出文件路径
+            size_mm: 二维码大小（毫米）
+        """
+        try:
+            # 将毫米转换为像素（假设300 DPI）
+            dpi = 300
+            size_px = int(size_mm * dpi / 25.4)
+            
+            # 相同URL和尺寸的渲染结果会被缓存
+            with span('qrcode', 'file', file=output_path):
+                self.run_cpu_task(qrcode_task, url, output_path, size_px, self.qr_error_correction)
+            return True
+        except Exception as e:
+            self.log(f"生成二维码失败: {str(e)}")
+            return False
+    
+    def create_pdf_with_qrcode(self, qr_image_path, pdf_path, page_size, qr_size_mm, x_mm, y_mm, qr_url=None):
+        """
+        创建PDF并插入二维码
+        
+        Args:
+            qr_image_path: 二维码图片路径
+            pdf_path: PDF输出路径
+            page_size: 页面尺寸
+            qr_size_mm: 二维码大小（毫米）
+            x_mm: X坐标（毫米）
+            y_mm: Y坐标（毫米）
+            qr_url: 二维码内容；提供时直接以矢量绘制二维码，不读取二维码图片
+        """
+        try:
+            with span('pdf', 'file', file=pdf_path):
+                self.run_cpu_task(pdf_task, pdf_path, page_size, qr_size_mm, x_mm, y_mm,
+                                  qr_url, qr_image_path, self.qr_error_correction)
+            return True
+        except Exception as e:
+            self.log(f"创建PDF失败: {str(e)}")
+            return False
+    
+    def generate_index_html(self, directory, uploaded_files, dir_name):
+        """
+        生成索引HTML文件，用于在浏览器中查看图片列表
+        
+        Args:
+            directory: 本地目录路径
+            uploaded_files: 已上传的文件列表，条目中的 derivatives（种类 → URL）用于缩略图
+            dir_name: 目录名称
+            
+        Returns:
+            index.html文件路径
+        """
+        # 按模板逐段写入文件，大目录的其余图片由页面脚本分批加载
+        index_path = os.path.join(directory, 'index.html')
+        try:
+            with span('index.html', 'file', file=index_path):
+                write_index_html(index_path, dir_name, uploaded_files, DERIVATIVE_SIZES)
+            return index_path
+        except Exception as e:
+            self.log(f"  生成index.html失败: {str(e)}")
+            return None
+    
+    def upload_directory_to_oss(self, directory, root_dir=None, manifest=None, images=None, dead_letter=None):
+        """
+        上传目录到OSS
+        
+        Args:
+            directory: 目录路径
+            root_dir: 根目录路径（用于构建完整路径结构）
+            manifest: 可选，增量处理清单，跳过未变化的文件
+            images: 可选，扫描阶段得到的图片列表（scanner.ImageFile），避免重复读取目录
+            dead_letter: 可选，上传失败列表（DeadLetterList），记录重试后仍然失败的文件
+            
+        Returns:
+            (成功, OSS URL前缀)
+        """
+        if not self.oss_uploader:
+            self.log("  OSS未配置，跳过上传")
+            return False, None
+        
+        # 构建OSS路径：包含根目录名称和子目录名称
+        if root_dir:
+            root_name = os.path.basename(root_dir)
+            dir_name = os.path.basename(directory)
+            oss_dir_prefix = f"{root_name}/{dir_name}"
+        else:
+            oss_dir_prefix = os.path.basename(directory)
+            dir_name = oss_dir_prefix
+        
+        # 上传前压缩图片：上传文件可能是 .normalized 中的缓存文件（内容相同的图片共用一个），
+        # 上传时传入原图列表，回调函数收到原图路径，日志和失败列表使用原图
+        upload_images = images
+        upload_names = {}
+        source_names = {}
+        if self.normalize:
+            if images is None:
+                images = scan_directory(directory)[0].images
+            upload_images = self.normalize_images(directory, images)
+            for upload, image in zip(upload_images, images):
+                upload_names[image.path] = upload.name
+                source_names[upload.name] = image.name
+        
+        # 原图大小，用于统计上传进度
+        image_sizes = {image.path: image.size for image in images or ()}
+        
+        def upload_callback(source_path, success, result):
+            name = upload_names.get(source_path, os.path.basename(source_path))
+            if success:
+                self.log(f"    ✓ 已上传: {name}")
+            elif self.cancelled:
+                return
+            else:
+                self.log(f"    ✗ 上传失败: {name} - {result}")
+            if source_path in image_sizes:
+                self.progress.add_file(image_sizes[source_path], success)
+            if dead_letter is not None and os.path.isfile(source_path):
+                if success:
+                    dead_letter.remove(source_path)
+                else:
+                    dead_letter.add(source_path, f"{oss_dir_prefix}/{name}", result)
+        
+        # 一次列举目录前缀下的已有对象（包含缩略图和index.html），代替逐个文件HEAD
+        remote_index = None
+        if self.skip_existing:
+            try:
+                remote_index = self.oss_uploader.list_remote_objects(f"{oss_dir_prefix}/")
+                self.log(f"  OSS上已有 {len(remote_index)} 个对象")
+            except Exception as e:
+                self.log(f"  列举OSS已有文件失败，将全部上传: {str(e)}")
+        
+        self.log(f"  开始上传图片到OSS...")
+        success_count, fail_count, uploaded_files = self.oss_uploader.upload_directory(
+            directory, oss_dir_prefix, callback=upload_callback, manifest=manifest, files=upload_images,
+            remote_index=remote_index, source_files=images if self.normalize else None
+        )
+        
+        if self.cancelled:
+            # 已上传的文件记录在清单中，下次运行时跳过；不生成不完整的图片浏览页面
+            self.log(f"  已取消，本目录已上传 {success_count} 个文件")
+            return False, None
+        
+        skipped_count = sum(1 for f in uploaded_files if f.get('skipped'))
+        if remote_index is not None:
+            changed_count = sum(1 for f in uploaded_files if f.get('status') == 'changed')
+            uploaded_count = sum(1 for f in uploaded_files if f.get('status') == 'uploaded')
+            self.log(f"  上传完成: 跳过 {skipped_count} 个, 新上传 {uploaded_count} 个, "
+                     f"内容变化重新上传 {changed_count} 个, 失败 {fail_count} 个")
+        elif skipped_count:
+            self.log(f"  上传完成: 成功 {success_count} 个（其中未变化跳过 {skipped_count} 个）, 失败 {fail_count} 个")
+        else:
+            self.log(f"  上传完成: 成功 {success_count} 个, 失败 {fail_count} 个")
+        copied_count = sum(1 for f in uploaded_files if f.get('status') == 'copied')
+        if copied_count:
+            self.log(f"  其中 {copied_count} 个与已上传的文件内容相同，已使用服务端复制")
+        
+        # 构建OSS URL前缀
+        if uploaded_files:
+            # 生成并上传缩略图，图片浏览页面的网格使用缩略图
+            if self.derivatives:
+                if images is None:
+                    images = scan_directory(directory)[0].images
+                derivative_urls = self.upload_derivatives(directory, oss_dir_prefix, images, manifest, remote_index)
+                for file_info in uploaded_files:
+                    name = os.path.basename(file_info['oss_path'])
+                    urls = derivative_urls.get(source_names.get(name, name))
+                    if urls:
+                        file_info['derivatives'] = urls
+            
+            # 生成index.html（图片列表未变化时沿用已有文件）
+            index_path = os.path.join(directory, 'index.html')
+            index_fingerprint = Manifest.fingerprint(
+                'index', GALLERY_TEMPLATE_VERSION, dir_name,
+                [(f['url'], f.get('derivatives')) for f in uploaded_files]
+            )
+            if manifest is not None and manifest.is_output_current(index_path, index_fingerprint):
+                self.log(f"  图片浏览页面未变化，跳过生成")
+            else:
+                self.log(f"  生成图片浏览页面...")
+                index_path = self.generate_index_html(directory, uploaded_files, dir_name)
+                if index_path and manifest is not None:
+                    manifest.record_output(index_path, index_fingerprint)
+            if index_path:
+                self.progress.stage_done('index')
+            
+            if index_path:
+                # 上传index.html到OSS
+                index_oss_path = f"{oss_dir_prefix}/index.html"
+                success, result = self.oss_uploader.upload_file(index_path, index_oss_path, manifest=manifest,
+                                                                remote_index=remote_index)
+                
+                if success:
+                    self.log(f"    ✓ 已上传: index.html")
+                    # 返回index.html的URL
+                    return True, result
+                # index.html 是生成的文件，不加入失败列表（失败列表只记录原图），下次处理时重新上传
+                if not self.cancelled:
+                    self.log(f"    ✗ 上传失败: index.html - {result}")
+            
+            # 如果index.html上传失败，返回目录URL
+            first_url = uploaded_files[0]['url']
+            oss_url_prefix = first_url.rsplit('/', 1)[0]
+            return True, oss_url_prefix
+        
+        return False, None
+    
+    def normalize_images(self, directory, images):
+        """
+        上传前压缩图片，结果缓存在目录下的 .normalized 中
+        
+        Args:
+            directory: 目录路径
+            images: 图片列表（scanner.ImageFile）
+            
+        Returns:
+            上传用的图片列表，与images一一对应；出错时上传原图
+        """
+        def on_error(image, error):
+            self.log(f"    ✗ 压缩图片失败，上传原图: {image.name} - {str(error)}")
+        
+        try:
+            normalizer = ImageNormalizer(self.cpu_pool, self.normalize_format, self.normalize_quality,
+                                         self.normalize_max_dimension)
+            with span('normalize', 'io', directory=directory):
+                upload_images = normalizer.normalize(directory, images, on_error=on_error)
+        except Exception as e:
+            self.log(f"  压缩图片失败，上传原图: {str(e)}")
+            return images
+        
+        original_size = sum(image.size for image in images)
+        upload_size = sum(image.size for image in upload_images)
+        if original_size:
+            self.log(f"  图片压缩: {original_size / 1024 / 1024:.1f}MB → {upload_size / 1024 / 1024:.1f}MB"
+                     f"（{upload_size / original_size:.0%}）")
+        return upload_images
+    
+    def get_derivative_generator(self):
+        """获取派生图片生成器（按需创建，进程池在各目录之间共用）"""
+        with self._derivative_lock:
+            if self._derivative_generator is None:
+                self._derivative_generator = DerivativeGenerator(self.derivative_format, pool=self.cpu_pool)
+            return self._derivative_generator
+    
+    def upload_derivatives(self, directory, oss_dir_prefix, images, manifest=None, remote_index=None):
+        """
+        生成缩略图和中等尺寸图片并上传到原图旁边的 _thumb/、_medium/ 目录
+        
+        Args:
+            directory: 目录路径
+            oss_dir_prefix: 原图的OSS路径前缀
+            images: 图片列表（scanner.ImageFile）
+            manifest: 可选，增量处理清单
+            remote_index: 可选，OSS已有对象索引，相同文件跳过上传
+            
+        Returns:
+            {原文件名: {种类: URL}}
+        """
+        def on_error(image, error):
+            self.log(f"    ✗ 生成缩略图失败: {image.name} - {str(error)}")
+        
+        generated = self.get_derivative_generator().generate(directory, images, on_error=on_error)
+        
+        derivative_urls = {}
+        for kind, files in generated.items():
+            if not files:
+                continue
+            success_count, fail_count, uploaded = self.oss_uploader.upload_directory(
+                os.path.join(directory, DERIVATIVE_DIR, kind), f"{oss_dir_prefix}/_{kind}",
+                manifest=manifest, files=files, remote_index=remote_index
+            )
+            if fail_count:
+                self.log(f"    ✗ 上传{kind}图片失败 {fail_count} 个")
+            for file_info in uploaded:
+                # 派生图片文件名为“原文件名.扩展名”
+                original_name = os.path.splitext(os.path.basename(file_info['local_path']))[0]
+                derivative_urls.setdefault(original_name, {})[kind] = file_info['url']
+        
+        if derivative_urls:
+            self.log(f"  缩略图已就绪: {len(derivative_urls)} 张图片")
+        return derivative_urls
+    
+    def close(self):
+        """关闭进程池（下次使用时重新创建），结束本次运行的去重索引"""
+        with self._derivative_lock:
+            self._derivative_generator = None
+        self.cpu_pool.close()
+        if self.oss_uploader is not None:
+            self.oss_uploader.content_index = None
+    
+    def begin_dedup(self, manifest=None):
+        """
+        开始一次运行的跨目录去重：建立内容索引并交给上传器
+        
+        Args:
+            manifest: 可选，增量清单；其中已上传的文件也可以作为复制来源
+        """
+        self.content_index = None
+        if not self.dedup or self.oss_uploader is None:
+            return
+        self.content_index = ContentIndex()
+        if manifest is not None:
+            self.content_index.seed_from_manifest(manifest)
+        self.oss_uploader.content_index = self.content_index
+    
+    def log_dedup(self):
+        """输出跨目录去重节省的上传量"""
+        index = self.content_index
+        if index is not None and index.copied_files:
+            self.log(f"跨目录去重：{index.copied_files} 个重复文件使用服务端复制，"
+                     f"节省上传 {index.bytes_saved / 1024 / 1024:.1f}MB")
+    
+    def build_default_oss_url(self, directory, root_dir=None):
+        """
+        构建目录默认的index.html访问URL（未上传或上传失败时使用）
+        
+        Args:
+            directory: 目标目录路径
+            root_dir: 根目录路径（用于构建OSS路径）
+            
+        Returns:
+            index.html的URL
+        """
+        dir_name = os.path.basename(directory)
+        
+        if not self.oss_config.is_valid():
+            return f"https://your-bucket.oss-region.aliyuncs.com/{quote(dir_name, safe='')}/index.html"
+        
+        endpoint_without_protocol = self.oss_config.endpoint.replace('http://', '').replace('https://', '')
+        
+        # 构建OSS路径（与upload_directory_to_oss保持一致）
+        if root_dir:
+            root_name = os.path.basename(root_dir)
+            # 计算相对路径
+            if directory.startswith(root_dir):
+                rel_path = os.path.relpath(directory, root_dir)
+                if rel_path == '.':
+                    # directory就是root_dir，只使用root_name
+                    oss_path = root_name
+                else:
+                    # directory是root_dir的子目录
+                    oss_path = f"{root_name}/{rel_path}"
+            else:
+                # 不在root_dir下，使用directory的basename
+                oss_path = dir_name
+        else:
+            # 没有root_dir，只使用dir_name
+            oss_path = dir_name
+        
+        # URL编码路径
+        encoded_path = quote(oss_path, safe='')
+        
+        # 构建完整URL
+        if self.oss_config.base_path:
+            encoded_base = quote(self.oss_config.base_path.strip('/'), safe='')
+            return f"https://{self.oss_config.bucket_name}.{endpoint_without_protocol}/{encoded_base}/{encoded_path}/index.html"
+        return f"https://{self.oss_config.bucket_name}.{endpoint_without_protocol}/{encoded_path}/index.html"
+    
+    def traced_stage(self, name, stage):
+        """
+        为流水线阶段加上跟踪span（按目录统计耗时，未开启跟踪时几乎没有开销）
+        
+        Args:
+            name: 阶段名
+            stage: 阶段函数，参数和返回值为任务字典
+        """
+        def run(job):
+            with span(name, 'stage', directory=job['directory']):
+                return stage(job)
+        return run
+    
+    def stage_scan(self, job):
+        """
+        流水线阶段：扫描目录中的图片
+        
+        Args:
+            job: 任务字典，至少包含 directory
+            
+        Returns:
+            任务字典；目录中没有图片时返回None
+        """
+        directory = job['directory']
+        dir_name = os.path.basename(directory)
+        job['dir_name'] = dir_name
+        self.log(f"处理目录: {dir_name}")
+        
+        # 检查目录中是否有图片（优先使用扫描索引，避免重复读取目录）
+        index = job.get('dir_index')
+        if index is None:
+            try:
+                index, _ = scan_directory(directory)
+            except Exception as e:
+                self.log(f"读取目录 {directory} 时出错: {str(e)}")
+                return None
+        images = index.images
+        if not images:
+            self.log(f"  跳过（无图片）: {dir_name}")
+            return None
+        
+        self.log(f"  [{dir_name}] 找到 {len(images)} 张图片")
+        job['images'] = images
+        return job
+    
+    def stage_upload(self, job):
+        """流水线阶段：上传图片到OSS并确定二维码URL"""
+        directory = job['directory']
+        root_dir = job.get('root_dir')
+        
+        # 如果启用自动上传，先上传图片到OSS（上次运行中已上传的目录沿用记录的URL）
+        oss_url = None
+        checkpoint = job.get('checkpoint')
+        uploaded, recorded_url = checkpoint.get(directory, 'upload') if checkpoint else (False, None)
+        if job.get('auto_upload') and uploaded:
+            self.log(f"  [{job['dir_name']}] 已在上次运行中上传，跳过")
+            oss_url = recorded_url
+            for image in job['images']:
+                self.progress.add_file(image.size)
+            self.progress.stage_done('upload')
+        elif job.get('auto_upload'):
+            success, oss_url = self.upload_directory_to_oss(directory, root_dir, job.get('manifest'), job['images'],
+                                                            job.get('dead_letter'))
+            if success:
+                self.progress.stage_done('upload')
+                if checkpoint:
+                    checkpoint.mark(directory, 'upload', oss_url)
+            elif self.cancelled:
+                return None
+            else:
+                self.log(f"  [{job['dir_name']}] 警告：上传失败，将使用默认URL生成二维码")
+        
+        # 如果没有OSS URL，使用默认格式
+        if not oss_url:
+            oss_url = self.build_default_oss_url(directory, root_dir)
+        
+        # 对URL进行编码（如果包含中文字符）
+        # 注意：只编码路径部分，不编码协议和域名
+        if oss_url and '://' in oss_url:
+            protocol, rest = oss_url.split('://', 1)
+            if '/' in rest:
+                domain, path = rest.split('/', 1)
+                # 对路径进行URL编码，但保留斜杠
+                encoded_path = quote(path, safe='/')
+                oss_url = f"{protocol}://{domain}/{encoded_path}"
+        
+        job['oss_url'] = oss_url
+        return job
+    
+    def stage_qrcode(self, job):
+        """流水线阶段：生成二维码图片"""
+        dir_name = job['dir_name']
+        qr_filename = f"{dir_name}_qr.png"
+        qr_path = os.path.join(job['directory'], qr_filename)
+        manifest = job.get('manifest')
+        
+        qr_fingerprint = Manifest.fingerprint('qrcode', job['oss_url'], job['qr_size_mm'],
+                                              self.qr_error_correction)
+        job['qr_path'] = qr_path
+        job['qr_fingerprint'] = qr_fingerprint
+        
+        if manifest is not None and manifest.is_output_current(qr_path, qr_fingerprint):
+            self.log(f"  二维码未变化，跳过: {qr_filename}")
+            self.progress.stage_done('qrcode')
+            return job
+        
+        if self.generate_qrcode(job['oss_url'], qr_path, job['qr_size_mm']):
+            self.progress.stage_done('qrcode')
+            self.log(f"  二维码已生成: {qr_filename}")
+            self.log(f"  二维码URL: {job['oss_url']}")
+            if manifest is not None:
+                manifest.record_output(qr_path, qr_fingerprint)
+        else:
+            self.log(f"  [{dir_name}] 二维码生成失败")
+            return None
+        
+        return job
+    
+    def stage_pdf(self, job):
+        """流水线阶段：生成PDF"""
+        dir_name = job['dir_name']
+        pdf_filename = f"{dir_name}_qr.pdf"
+        pdf_path = os.path.join(job['directory'], pdf_filename)
+        manifest = job.get('manifest')
+        job['pdf_path'] = pdf_path
+        
+        pdf_fingerprint = Manifest.fingerprint('pdf', job['qr_fingerprint'], job['page_size'],
+                                               job['qr_size_mm'], job['x_mm'], job['y_mm'],
+                                               self.qr_vector)
+        if manifest is not None and manifest.is_output_current(pdf_path, pdf_fingerprint):
+            self.log(f"  PDF未变化，跳过: {pdf_filename}")
+            self.progress.stage_done('pdf')
+            return job
+        
+        qr_url = job['oss_url'] if self.qr_vector else None
+        if self.create_pdf_with_qrcode(job['qr_path'], pdf_path, job['page_size'],
+                                       job['qr_size_mm'], job['x_mm'], job['y_mm'], qr_url):
+            self.progress.stage_done('pdf')
+            self.log(f"  PDF已生成: {pdf_filename}")
+            if manifest is not None:
+                manifest.record_output(pdf_path, pdf_fingerprint)
+        else:
+            self.log(f"  [{dir_name}] PDF生成失败")
+            return None
+        
+        return job
+    
+    def process_directory(self, directory, page_size, qr_size_mm, x_mm, y_mm, auto_upload=False, root_dir=None,
+                          manifest=None, dead_letter=None):
+        """
+        处理单个目录：上传图片、生成二维码和PDF
+        
+        Args:
+            directory: 目标目录路径
+            page_size: PDF页面尺寸
+            qr_size_mm: 二维码大小
+            x_mm: 二维码X坐标
+            y_mm: 二维码Y坐标
+            auto_upload: 是否自动上传
+            root_dir: 根目录路径（用于构建OSS路径）
+            manifest: 可选，增量处理清单
+            dead_letter: 可选，上传失败列表
+        """
+        job = {
+            'directory': directory,
+            'root_dir': root_dir,
+            'page_size': page_size,
+            'qr_size_mm': qr_size_mm,
+            'x_mm': x_mm,
+            'y_mm': y_mm,
+            'auto_upload': auto_upload,
+            'manifest': manifest,
+            'dead_letter': dead_letter,
+        }
+        for name, stage in (('scan', self.stage_scan), ('upload', self.stage_upload),
+                            ('qrcode', self.stage_qrcode), ('pdf', self.stage_pdf)):
+            job = self.traced_stage(name, stage)(job)
+            if job is None:
+                return
+
+    def upload_all_directories(self, root_dir, dir_type, incremental=True, resume=True, directories=None):
+        """
+        仅上传所有目录到OSS
+        
+        Args:
+            root_dir: 根目录路径
+            dir_type: 目录类型，"村"（二级）或"乡"（三级）
+            incremental: 是否增量处理（跳过未变化的文件）
+            resume: 是否从上次被取消或中断的运行处继续
+            directories: 可选，只处理这些目标目录（监视模式使用），默认处理根目录下的全部目标目录
+            
+        Returns:
+            (成功目录数, 失败目录数)
+        """
+        self.reset_cancel()
+        checkpoint = RunCheckpoint(root_dir)
+        resumed = checkpoint.begin(Manifest.fingerprint(
+            'upload', dir_type, incremental, sorted(directories) if directories is not None else None
+        ), resume)
+        manifest = Manifest(root_dir) if incremental else checkpoint.run_manifest()
+        dead_letter = DeadLetterList(root_dir)
+        self.begin_dedup(manifest)
+        finished = False
+        try:
+            self.log("=" * 60)
+            self.log("开始上传到OSS...")
+            self.log(f"根目录: {root_dir}")
+            self.log_upload_limits()
+            self.log_resume(checkpoint, resumed)
+            self.log("=" * 60)
+            
+            indexes = self.scan_directories(root_dir, dir_type, directories)
+            
+            self.log(f"找到 {len(indexes)} 个目标目录")
+            self.log("")
+            self.start_progress(indexes, ('upload', 'index'), upload=True)
+            
+            total_success = 0
+            total_fail = 0
+            
+            for index in indexes:
+                if self.cancelled:
+                    break
+                self.log(f"上传目录: {index.name}")
+                
+                if checkpoint.get(index.path, 'done')[0]:
+                    self.log(f"  已在上次运行中上传，跳过")
+                    self.log("")
+                    total_success += 1
+                    for image in index.images:
+                        self.progress.add_file(image.size)
+                    self.progress.stage_done('upload')
+                    self.progress.directory_done()
+                    continue
+                
+                if not index.images:
+                    self.log(f"  跳过（无图片）")
+                    self.log("")
+                    self.progress.directory_done()
+                    continue
+                
+                with span('upload', 'stage', directory=index.path):
+                    success, oss_url = self.upload_directory_to_oss(index.path, root_dir, manifest, index.images,
+                                                                    dead_letter)
+                if success:
+                    total_success += 1
+                    self.progress.stage_done('upload')
+                    checkpoint.mark(index.path, 'done', oss_url)
+                elif self.cancelled:
+                    break
+                else:
+                    total_fail += 1
+                self.progress.directory_done()
+                
+                self.log("")
+            
+            self.log("=" * 60)
+            if self.cancelled:
+                self.log(f"上传已取消！已完成 {total_success} 个目录，失败 {total_fail} 个")
+            else:
+                self.log(f"上传完成！成功 {total_success} 个目录，失败 {total_fail} 个")
+            self.log_dedup()
+            self.log_dead_letter(dead_letter)
+            self.log("=" * 60)
+            
+            finished = True
+            return total_success, total_fail
+        finally:
+            self.progress.finish(finished and not self.cancelled)
+            dead_letter.save()
+            manifest.compact()
+            self.finish_checkpoint(checkpoint, finished)
+            self.close()
+    
+    def start_progress(self, indexes, stages, upload=False):
+        """
+        按扫描结果开始统计进度
+        
+        Args:
+            indexes: 目标目录索引列表（scanner.DirectoryIndex）
+            stages: 统计完成目录数的阶段名
+            upload: 是否上传图片
+        """
+        files, total_bytes = count_images(indexes)
+        self.progress.start(len(indexes), files, total_bytes, stages, upload)
+        self.log(f"共 {files} 张图片，{total_bytes / 1024 / 1024:.1f}MB")
+    
+    def log_resume(self, checkpoint, resumed):
+        """提示本次运行从上次中断处继续"""
+        if resumed:
+            self.log(f"从上次中断处继续：已完成 {checkpoint.completed_count()} 个目录")
+    
+    def finish_checkpoint(self, checkpoint, finished):
+        """
+        运行结束时处理运行断点：正常完成时删除，被取消或出错时保留供下次继续
+        
+        Args:
+            checkpoint: RunCheckpoint
+            finished: 运行是否执行到最后（没有抛出异常）
+        """
+        if finished and not self.cancelled:
+            checkpoint.finish()
+        else:
+            self.log("运行未完成，下次以相同参数运行时将从中断处继续")
+    
+    def log_upload_limits(self):
+        """输出带宽上限和上传时段设置"""
+        uploader = self.oss_uploader
+        if uploader is None:
+            return
+        if uploader.throttle is not None:
+            self.log(f"带宽上限: {uploader.throttle.rate / 1024:g} KB/s")
+        if uploader.window is not None:
+            self.log(f"上传时段: {uploader.window}（不小于 {self.oss_config.upload_window_min_mb:g}MB 的文件在时段外等待）")
+    
+    def log_dead_letter(self, dead_letter):
+        """提示上传失败列表中剩余的文件数"""
+        if len(dead_letter):
+            self.log(f"有 {len(dead_letter)} 个文件重试后仍上传失败，已记录到 {dead_letter.path}")
+            self.log("可使用“重试失败文件”只重新上传这些文件")
+    
+    def retry_failed_uploads(self, root_dir):
+        """
+        只重新上传失败列表中的文件所在的目录
+        
+        Args:
+            root_dir: 根目录路径
+            
+        Returns:
+            (成功目录数, 失败目录数)
+        """
+        self.reset_cancel()
+        dead_letter = DeadLetterList(root_dir)
+        manifest = Manifest(root_dir)
+        self.begin_dedup(manifest)
+        try:
+            self.log("=" * 60)
+            directories = dead_letter.directories()
+            if not directories:
+                self.log("没有需要重试的失败文件")
+                return 0, 0
+            self.log(f"重试 {len(dead_letter)} 个失败文件，涉及 {len(directories)} 个目录")
+            self.progress.start(len(directories), stages=('upload', 'index'))
+            
+            total_success = 0
+            total_fail = 0
+            for i, directory in enumerate(directories, 1):
+                if self.cancelled:
+                    break
+                if not os.path.isdir(directory):
+                    self.log(f"[{i}/{len(directories)}] 目录已不存在，移出失败列表: {directory}")
+                    dead_letter.discard_directory(directory)
+                    self.progress.directory_done()
+                    continue
+                self.log(f"[{i}/{len(directories)}] 重新上传: {os.path.basename(directory)}")
+                success, _ = self.upload_directory_to_oss(directory, root_dir, manifest, dead_letter=dead_letter)
+                if success:
+                    total_success += 1
+                    self.progress.stage_done('upload')
+                else:
+                    total_fail += 1
+                self.progress.directory_done()
+            
+            if self.cancelled:
+                self.log(f"重试已取消！成功 {total_success} 个目录，失败 {total_fail} 个")
+            else:
+                self.log(f"重试完成！成功 {total_success} 个目录，失败 {total_fail} 个")
+            self.log_dedup()
+            self.log_dead_letter(dead_letter)
+            self.log("=" * 60)
+            return total_success, total_fail
+        finally:
+            self.progress.finish(not self.cancelled)
+            dead_letter.save()
+            manifest.compact()
+            self.close()
+    
+    def get_batch_pdf_path(self, root_dir):
+        """合并PDF的默认路径：根目录下的“根目录名_qr_all.pdf”"""
+        root_name = os.path.basename(os.path.normpath(root_dir))
+        return os.path.join(root_dir, f"{root_name}_qr_all.pdf")
+    
+    def process_all_directories(self, root_dir, dir_type, page_size, qr_size_mm, x_mm, y_mm,
+                                auto_upload=False, incremental=True, batch_layout=None,
+                                batch_pdf_path=None, per_directory_pdf=True, resume=True, directories=None):
+        """
+        处理所有目录
+        
+        Args:
+            root_dir: 根目录路径
+            dir_type: 目录类型，"村"（二级）或"乡"（三级）
+            page_size: PDF页面尺寸
+            qr_size_mm: 二维码大小（毫米）
+            x_mm: 二维码X坐标（毫米）
+            y_mm: 二维码Y坐标（毫米）
+            auto_upload: 是否自动上传
+            incremental: 是否增量处理（跳过未变化的文件和生成物）
+            batch_layout: 合并PDF布局，None不生成，"single"每页一个，"tile"拼版
+            batch_pdf_path: 合并PDF路径，默认见 get_batch_pdf_path
+            per_directory_pdf: 是否为每个目录生成单独的PDF
+            resume: 是否从上次被取消或中断的运行处继续
+            directories: 可选，只处理这些目标目录（监视模式使用），默认处理根目录下的全部目标目录
+            
+        Returns:
+            (完成目录数, 跳过目录数, 出错目录数)
+        """
+        self.reset_cancel()
+        # 运行断点：参数相同时沿用上次未完成的运行，已完成的目录不再处理
+        checkpoint = RunCheckpoint(root_dir)
+        resumed = checkpoint.begin(Manifest.fingerprint(
+            'process', dir_type, page_size, qr_size_mm, x_mm, y_mm, auto_upload, incremental,
+            batch_layout, per_directory_pdf, self.qr_vector, self.qr_error_correction,
+            sorted(directories) if directories is not None else None
+        ), resume)
+        manifest = Manifest(root_dir) if incremental else checkpoint.run_manifest()
+        dead_letter = DeadLetterList(root_dir) if auto_upload else None
+        self.begin_dedup(manifest)
+        batch_writer = None
+        finished = False
+        try:
+            self.log("=" * 60)
+            self.log("开始处理...")
+            self.log(f"根目录: {root_dir}")
+            self.log(f"目录类型: {dir_type}")
+            self.log(f"页面尺寸: {page_size[0] / mm:.0f}mm × {page_size[1] / mm:.0f}mm")
+            self.log(f"二维码大小: {qr_size_mm}mm")
+            self.log(f"二维码位置: ({x_mm}mm, {y_mm}mm)")
+            self.log(f"自动上传: {'是' if auto_upload else '否'}")
+            if auto_upload:
+                self.log_upload_limits()
+            self.log(f"增量处理: {'是' if incremental else '否'}")
+            if self.process_pool:
+                self.log(f"多进程处理: {self.cpu_pool.workers} 个进程")
+            self.log_resume(checkpoint, resumed)
+            self.log("=" * 60)
+            
+            # 获取目标目录（单次遍历，同时得到每个目录的图片列表）
+            indexes = self.scan_directories(root_dir, dir_type, directories)
+            
+            self.log(f"找到 {len(indexes)} 个目标目录")
+            self.log("")
+            progress_stages = ['qrcode', 'pdf'] if per_directory_pdf else ['qrcode']
+            if auto_upload:
+                progress_stages = ['upload', 'index'] + progress_stages
+            self.start_progress(indexes, progress_stages, upload=auto_upload)
+            
+            # 合并PDF：所有目录的二维码按目录顺序写入同一个文件
+            if batch_layout:
+                batch_pdf_path = batch_pdf_path or self.get_batch_pdf_path(root_dir)
+                batch_writer = BatchPDFWriter(
+                    batch_pdf_path, page_size, qr_size_mm, x_mm, y_mm, layout=batch_layout,
+                    qr_vector=self.qr_vector, error_correction=self.qr_error_correction
+                )
+            
+            # 上次运行中已完成的目录直接计入结果（合并PDF仍包含其二维码）
+            pending = []
+            resumed_count = 0
+            for index, entry in enumerate(indexes):
+                done, oss_url = checkpoint.get(entry.path, 'done')
+                if not done:
+                    pending.append((index, entry))
+                    continue
+                resumed_count += 1
+                for image in entry.images:
+                    self.progress.add_file(image.size)
+                self.progress.directory_done()
+                if batch_writer is not None:
+                    dir_name = os.path.basename(entry.path)
+                    batch_writer.add(oss_url, dir_name, os.path.join(entry.path, f"{dir_name}_qr.png"), index=index)
+            
+            # 分阶段流水线处理：扫描 → 上传 → 二维码 → PDF，各阶段并行
+            jobs = (
+                {
+                    'index': index,
+                    'dir_index': entry,
+                    'directory': entry.path,
+                    'root_dir': root_dir,
+                    'page_size': page_size,
+                    'qr_size_mm': qr_size_mm,
+                    'x_mm': x_mm,
+                    'y_mm': y_mm,
+                    'auto_upload': auto_upload,
+                    'manifest': manifest,
+                    'dead_letter': dead_letter,
+                    'checkpoint': checkpoint,
+                }
+                for index, entry in pending
+            )
+            
+            def on_error(stage_name, job, error):
+                self.log(f"  [{os.path.basename(job['directory'])}] {stage_name} 阶段出错: {str(error)}")
+            
+            def on_done(job, status):
+                self.progress.directory_done()
+                if status == 'completed':
+                    checkpoint.mark(job['directory'], 'done', job['oss_url'])
+                if batch_writer is None:
+                    return
+                if status == 'completed':
+                    batch_writer.add(job['oss_url'], job['dir_name'], job.get('qr_path'), index=job['index'])
+                else:
+                    batch_writer.skip(job['index'])
+            
+            workers = dict(self.stage_workers)
+            max_in_flight = self.max_in_flight
+            if self.process_pool:
+                max_in_flight = max(max_in_flight, self.cpu_pool.workers)
+                # 进程池模式下二维码/PDF阶段的线程只负责等待工作进程，线程数与进程数一致
+                for name in ('qrcode', 'pdf'):
+                    workers[name] = max(workers[name], self.cpu_pool.workers)
+            
+            stages = [
+                Stage('scan', self.traced_stage('scan', self.stage_scan), workers['scan']),
+                Stage('upload', self.traced_stage('upload', self.stage_upload), workers['upload']),
+                Stage('qrcode', self.traced_stage('qrcode', self.stage_qrcode), workers['qrcode']),
+            ]
+            if per_directory_pdf:
+                stages.append(Stage('pdf', self.traced_stage('pdf', self.stage_pdf), workers['pdf']))
+            
+            pipeline = StagedPipeline(stages, max_in_flight=max_in_flight,
+                                      on_error=on_error, on_done=on_done, should_stop=lambda: self.cancelled)
+            
+            success_count, skipped_count, failed_count = pipeline.run(jobs)
+            success_count += resumed_count
+            
+            if self.cancelled:
+                # 取消时不保存不完整的合并PDF，下次继续时重新生成
+                batch_writer = None
+                self.log("")
+                self.log("=" * 60)
+                self.log(f"处理已取消！已完成 {success_count} 个目录，出错 {failed_count} 个")
+                self.log("=" * 60)
+                finished = True
+                return success_count, skipped_count, failed_count
+            
+            if batch_writer is not None:
+                qr_count = batch_writer.close()
+                batch_paths = batch_writer.paths
+                batch_writer = None
+                if len(batch_paths) > 1:
+                    self.log(f"合并PDF已生成: {batch_pdf_path} 等 {len(batch_paths)} 个文件（{qr_count} 个二维码）")
+                else:
+                    self.log(f"合并PDF已生成: {batch_pdf_path}（{qr_count} 个二维码）")
+            
+            self.log("")
+            self.log("=" * 60)
+            self.log(f"处理完成！共处理 {success_count} 个目录，跳过 {skipped_count} 个，出错 {failed_count} 个")
+            self.log_dedup()
+            if dead_letter is not None:
+                self.log_dead_letter(dead_letter)
+            self.log("=" * 60)
+            
+            finished = True
+            return success_count, skipped_count, failed_count
+        finally:
+            self.progress.finish(finished and not self.cancelled)
+            if batch_writer is not None:
+                batch_writer.close()
+            if dead_letter is not None:
+                dead_letter.save()
+            manifest.compact()
+            self.finish_checkpoint(checkpoint, finished)
+            self.close()
@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+图片浏览页面（index.html）生成模块
+页面按模板逐段写入文件，不在内存中拼接整个页面：
+- 前 PAGE_SIZE 张图片直接写成HTML，页面打开即可显示
+- 其余图片写成页面内嵌的JSON清单，由页面脚本在滚动到底部时分批创建，
+  图片数量很多时生成时间和浏览器加载时间都不会明显增加
+"""
+
+import os
+import json
+from html import escape
+from string import Template
+from urllib.parse import quote
+
+
+# 页面直接输出的图片数量，以及脚本每批追加的图片数量
+PAGE_SIZE = 60
+
+# 页面模板版本，模板变化时已生成的页面需要重新生成
+TEMPLATE_VERSION = 2
+
+# 缩略图在网格中的显示宽度
+IMAGE_SIZES = "(max-width: 768px) 50vw, 250px"
+
+HEAD_TEMPLATE = Template("""<!DOCTYPE html>
+<html lang="zh-CN">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>$dir_name - 图片浏览</title>
+    <style>
+        * {
+            margin: 0;
+            padding: 0;
+            box-sizing: border-box;
+        }
+        body {
+            font-family: -apple-system, BlinkMacSystemFont, "Segoe UI", Roboto, "Helvetica Neue", Arial, sans-serif;
+            background: #f5f5f5;
+            padding: 20px;
+        }
+        .container {
+            max-width: 1200px;
+            margin: 0 auto;
+            background: white;
+            border-radius: 8px;
+            box-shadow: 0 2px 8px rgba(0,0,0,0.1);
+            padding: 30px;
+        }
+        h1 {
+            color: #333;
+            margin-bottom: 10px;
+            font-size: 28px;
+        }
+        .info {
+            color: #666;
+            margin-bottom: 30px;
+            font-size: 14px;
+        }
+        .gallery {
+            display: grid;
+            grid-template-columns: repeat(auto-fill, minmax(250px, 1fr));
+            gap: 20px;
+            margin-top: 20px;
+        }
+        .image-item {
+            background: #fff;
+            border: 1px solid #e0e0e0;
+            border-radius: 8px;
+            overflow: hidden;
+            transition: transform 0.2s, box-shadow 0.2s;
+            cursor: pointer;
+        }
+        .image-item:hover {
+            transform: translateY(-4px);
+            box-shadow: 0 4px 12px rgba(0,0,0,0.15);
+        }
+        .image-item img {
+            width: 100%;
+            height: 200px;
+            object-fit: cover;
+            display: block;
+        }
+        .image-name {
+            padding: 12px;
+            font-size: 14px;
+            color: #333;
+            text-align: center;
+            word-break: break-all;
+        }
+        .lightbox {
+            display: none;
+            position: fixed;
+            top: 0;
+            left: 0;
+            width: 100%;
+            height: 100%;
+            background: rgba(0,0,0,0.9);
+            z-index: 1000;
+            justify-content: center;
+            align-items: center;
+        }
+        .lightbox.active {
+            display: flex;
+        }
+        .lightbox img {
+            max-width: 90%;
+            max-height: 90%;
+            object-fit: contain;
+        }
+        .lightbox-close {
+            position: absolute;
+            top: 20px;
+            right: 30px;
+            color: white;
+            font-size: 40px;
+            cursor: pointer;
+            z-index: 1001;
+        }
+        .gallery-status {
+            color: #999;
+            text-align: center;
+            font-size: 14px;
+            padding: 20px 0;
+        }
+        @media (max-width: 768px) {
+            .gallery {
+                grid-template-columns: repeat(auto-fill, minmax(150px, 1fr));
+                gap: 10px;
+            }
+            .container {
+                padding: 15px;
+            }
+        }
+    </style>
+</head>
+<body>
+""")
+
+BODY_TEMPLATE = Template("""    <div class="container">
+        <h1>📁 $dir_name</h1>
+        <div class="info">共 $count 张图片</div>
+        <div class="gallery" id="gallery">
+""")
+
+TAIL_TEMPLATE = Template("""        </div>
+        <div class="gallery-status" id="gallery-status"></div>
+    </div>
+    
+    <div class="lightbox" id="lightbox" onclick="closeLightbox()">
+        <span class="lightbox-close">&times;</span>
+        <img id="lightbox-img" src="" alt="">
+    </div>
+    
+    <script>
+        function openLightbox(url) {
+            document.getElementById('lightbox').classList.add('active');
+            document.getElementById('lightbox-img').src = url;
+        }
+        
+        function closeLightbox() {
+            document.getElementById('lightbox').classList.remove('active');
+        }
+        
+        document.addEventListener('keydown', function(e) {
+            if (e.key === 'Escape') {
+                closeLightbox();
+            }
+        });
+        
+        // 其余图片按批次追加到页面，滚动到底部时加载下一批
+        (function() {
+            var data = document.getElementById('gallery-data');
+            if (!data) {
+                return;
+            }
+            var items = JSON.parse(data.textContent);
+            var chunkSize = $chunk_size;
+            var next = 0;
+            var gallery = document.getElementById('gallery');
+            var status = document.getElementById('gallery-status');
+            
+            function createItem(item) {
+                var div = document.createElement('div');
+                div.className = 'image-item';
+                div.addEventListener('click', function() {
+                    openLightbox(item.url);
+                });
+                var img = document.createElement('img');
+                img.src = item.src;
+                if (item.srcset) {
+                    img.srcset = item.srcset;
+                    img.sizes = '(max-width: 768px) 50vw, 250px';
+                }
+                img.alt = item.name;
+                img.loading = 'lazy';
+                var name = document.createElement('div');
+                name.className = 'image-name';
+                name.textContent = item.name;
+                div.appendChild(img);
+                div.appendChild(name);
+                return div;
+            }
+            
+            function loadChunk() {
+                var fragment = document.createDocumentFragment();
+                var end = Math.min(next + chunkSize, items.length);
+                for (; next < end; next++) {
+                    fragment.appendChild(createItem(items[next]));
+                }
+                gallery.appendChild(fragment);
+                status.textContent = next < items.length ? '已显示 ' + next + ' 张，继续滚动加载更多' : '';
+                return next < items.length;
+            }
+            
+            if ('IntersectionObserver' in window) {
+                var observer = new IntersectionObserver(function(entries) {
+                    if (entries[0].isIntersecting && !loadChunk()) {
+                        observer.disconnect();
+                    }
+                }, {rootMargin: '600px'});
+                observer.observe(status);
+            } else {
+                while (loadChunk()) {}
+            }
+        })();
+    </script>
+</body>
+</html>
+""")
+
+
+def encode_url(url):
+    """对URL中的路径部分进行编码（保留协议、域名和斜杠）"""
+    if '://' in url:
+        protocol_end = url.index('://') + 3
+        domain_end = url.index('/', protocol_end)
+        protocol_domain = url[:domain_end]
+        path = url[domain_end:]
+        return protocol_domain + quote(path, safe='/')
+    return quote(url, safe=':/')
+
+
+def gallery_item(file_info, size_widths):
+    """
+    构建一张图片的显示信息
+
+    Args:
+        file_info: 上传结果条目，包含 local_path、url，可选 oss_path、derivatives（种类 → URL）
+        size_widths: 派生图片种类 → 宽度描述符（像素）
+
+    Returns:
+        {'name', 'url', 'src', 'srcset'}，url为原图（点击放大时加载）
+    """
+    url = encode_url(file_info['url'])
+    # 上传前压缩的图片本地文件在缓存目录中，显示上传后的文件名
+    name = os.path.basename(file_info.get('oss_path') or file_info['local_path'])
+    item = {'name': name, 'url': url, 'src': url, 'srcset': ''}
+
+    derivative_urls = file_info.get('derivatives') or {}
+    kinds = sorted((kind for kind in derivative_urls if kind in size_widths), key=lambda k: size_widths[k])
+    if kinds:
+        item['src'] = encode_url(derivative_urls[kinds[0]])
+        item['srcset'] = ", ".join(f"{encode_url(derivative_urls[kind])} {size_widths[kind]}w" for kind in kinds)
+    return item
+
+
+def _item_html(item):
+    """图片条目的HTML"""
+    srcset = ""
+    if item['srcset']:
+        srcset = f' srcset="{escape(item["srcset"])}" sizes="{IMAGE_SIZES}"'
+    name = escape(item['name'])
+    return f"""
+            <div class="image-item" onclick="openLightbox('{escape(item['url'])}')">
+                <img src="{escape(item['src'])}"{srcset} alt="{name}" loading="lazy">
+                <div class="image-name">{name}</div>
+            </div>
+"""
+
+
+def write_index_html(index_path, dir_name, uploaded_files, size_widths=None, page_size=PAGE_SIZE):
+    """
+    逐段写入图片浏览页面
+
+    先写入临时文件，完成后替换目标文件，中途出错不会留下半个页面。
+
+    Args:
+        index_path: 输出路径
+        dir_name: 目录名称（页面标题）
+        uploaded_files: 已上传的文件列表
+        size_widths: 派生图片种类 → 宽度描述符（像素），用于 srcset
+        page_size: 直接输出为HTML的图片数量，其余图片由页面脚本分批加载
+
+    Returns:
+        写入的图片数量
+    """
+    size_widths = size_widths or {}
+    tmp_path = index_path + ".tmp"
+    count = 0
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(HEAD_TEMPLATE.substitute(dir_name=escape(dir_name)))
+            f.write(BODY_TEMPLATE.substitute(dir_name=escape(dir_name), count=len(uploaded_files)))
+
+            # 第一页直接输出
+            for file_info in uploaded_files[:page_size]:
+                f.write(_item_html(gallery_item(file_info, size_widths)))
+                count += 1
+
+            tail = TAIL_TEMPLATE.substitute(chunk_size=page_size)
+            remaining = uploaded_files[page_size:]
+            if remaining:
+                # 其余图片写成内嵌JSON清单，逐条写入
+                head, script = tail.split("    <script>", 1)
+                f.write(head)
+                f.write('    <script type="application/json" id="gallery-data">[')
+                for i, file_info in enumerate(remaining):
+                    data = json.dumps(gallery_item(file_info, size_widths), ensure_ascii=False)
+                    # 转义 "<"，防止文件名中的标签提前结束 script
+                    f.write(("," if i else "") + "\n" + data.replace("<", "\\u003c"))
+                    count += 1
+                f.write("\n]</script>\n")
+                f.write("    <script>" + script)
+            else:
+                f.write(tail)
+        os.replace(tmp_path, index_path)
+    except Exception:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+    return count
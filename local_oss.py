@@ -0,0 +1,458 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+本地OSS模拟器
+用本地目录模拟 oss2.Bucket，实现本项目用到的接口（put_object、put_object_from_file、
+copy_object、list_objects、分片上传、head_object 等），可以注入延迟、带宽限制、限流和随机故障。
+没有网络的构建机器上也能重复测试并发上传、失败重试和断点续传，基准测试也可以使用。
+
+对象保存在 <根目录>/objects/ 下（对象路径按“/”映射为子目录），ETag等元数据保存在
+<根目录>/.meta/ 下，未完成的分片上传保存在 <根目录>/.uploads/ 下。
+与真实OSS不同，同一前缀不能既是对象又是“目录”（例如同时存在 a 和 a/b）。
+
+OSS配置的 endpoint 使用 file:// 开头的本地路径时，上传器直接使用本模拟器：
+    file:///data/oss-local   →   对象保存在 /data/oss-local/<bucket_name>/ 下
+"""
+
+import os
+import json
+import time
+import uuid
+import random
+import hashlib
+import mimetypes
+import threading
+from contextlib import contextmanager
+from types import SimpleNamespace
+from bandwidth import TokenBucket
+
+
+# 使用本地模拟器的endpoint前缀
+LOCAL_ENDPOINT_PREFIX = "file://"
+
+# 接收数据时每次读取的字节数（带宽限制按块计算）
+CHUNK_SIZE = 64 * 1024
+
+
+def is_local_endpoint(endpoint):
+    """endpoint 是否指向本地模拟器"""
+    return bool(endpoint) and endpoint.startswith(LOCAL_ENDPOINT_PREFIX)
+
+
+class LocalOSSError(Exception):
+    """模拟oss2的服务端错误：带HTTP状态码和错误码（status为负数表示网络错误）"""
+
+    def __init__(self, status, code, message=''):
+        super().__init__(f"{status} {code} {message}".strip())
+        self.status = status
+        self.code = code
+        self.message = message
+        self.request_id = uuid.uuid4().hex[:16].upper()
+
+
+def throttled_error():
+    """限流错误（503 SlowDown）"""
+    return LocalOSSError(503, 'SlowDown', '请求过多，请降低请求频率')
+
+
+def server_error():
+    """服务端内部错误（500 InternalError）"""
+    return LocalOSSError(500, 'InternalError', '模拟的服务端错误')
+
+
+def network_error():
+    """网络错误（与oss2的RequestError一样status为-2）"""
+    return LocalOSSError(-2, 'RequestError', '模拟的连接中断')
+
+
+class LocalBucket:
+    """基于本地目录的Bucket（线程安全）"""
+
+    def __init__(self, root_dir, latency=0.0, bandwidth=None, max_concurrency=0,
+                 failure_rate=0.0, throttle_rate=0.0, seed=None, sleep=time.sleep):
+        """
+        Args:
+            root_dir: 保存对象的本地目录
+            latency: 每次请求的延迟（秒）
+            bandwidth: 上行带宽（字节/秒），所有并发请求共用，None表示不限
+            max_concurrency: 同时处理的请求数上限，超过时返回503 SlowDown，0表示不限
+            failure_rate: 随机返回500 InternalError的概率
+            throttle_rate: 随机返回503 SlowDown的概率
+            seed: 随机数种子（固定后故障序列可以重复）
+            sleep: 等待函数（测试时可替换）
+        """
+        self.root_dir = os.path.abspath(root_dir)
+        self.objects_dir = os.path.join(self.root_dir, "objects")
+        self.meta_dir = os.path.join(self.root_dir, ".meta")
+        self.uploads_dir = os.path.join(self.root_dir, ".uploads")
+        for path in (self.objects_dir, self.meta_dir, self.uploads_dir):
+            os.makedirs(path, exist_ok=True)
+
+        self.latency = latency
+        self.max_concurrency = max(0, int(max_concurrency or 0))
+        self.failure_rate = failure_rate
+        self.throttle_rate = throttle_rate
+        self.sleep = sleep
+        self.link = TokenBucket(bandwidth, sleep=sleep) if bandwidth else None
+        self._random = random.Random(seed)
+
+        # 统计：各类请求次数、注入的错误次数、接收的字节数、最大同时请求数
+        self.requests = {}
+        self.errors = {}
+        self.bytes_received = 0
+        self.active = 0
+        self.max_active = 0
+        self._injected = []
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_endpoint(cls, endpoint, bucket_name, **kwargs):
+        """按 file:// 开头的endpoint创建，对象保存在该目录下以bucket名命名的子目录中"""
+        root = endpoint[len(LOCAL_ENDPOINT_PREFIX):]
+        return cls(os.path.join(root, bucket_name), **kwargs)
+
+    # ---- 故障注入 ----
+
+    def inject(self, error, operation=None, key=None, count=1, after=0):
+        """
+        让之后的请求返回指定错误
+
+        Args:
+            error: 要抛出的异常，例如 throttled_error()、server_error()、network_error()
+            operation: 只对该类请求生效（例如 'put_object'、'upload_part'），None为全部
+            key: 只对该对象生效，None为全部
+            count: 生效次数
+            after: 先放行的匹配请求数，例如 after=2 时第3个分片开始出错
+        """
+        with self._lock:
+            self._injected.append({'operation': operation, 'key': key, 'error': error,
+                                   'count': count, 'after': after})
+
+    def _take_injected(self, operation, key):
+        """取出一个匹配的注入错误（调用方需持有锁）"""
+        for entry in self._injected:
+            if entry['operation'] not in (None, operation) or entry['key'] not in (None, key):
+                continue
+            if entry['after'] > 0:
+                entry['after'] -= 1
+                continue
+            entry['count'] -= 1
+            if entry['count'] <= 0:
+                self._injected.remove(entry)
+            return entry['error']
+        return None
+
+    @contextmanager
+    def _request(self, operation, key=None):
+        """一次请求：统计、注入延迟和错误、限制同时处理的请求数"""
+        with self._lock:
+            self.requests[operation] = self.requests.get(operation, 0) + 1
+            error = self._take_injected(operation, key)
+            if error is None and self.max_concurrency and self.active >= self.max_concurrency:
+                error = throttled_error()
+            if error is None and self.throttle_rate and self._random.random() < self.throttle_rate:
+                error = throttled_error()
+            if error is None and self.failure_rate and self._random.random() < self.failure_rate:
+                error = server_error()
+            if error is not None:
+                code = getattr(error, 'code', type(error).__name__)
+                self.errors[code] = self.errors.get(code, 0) + 1
+            else:
+                self.active += 1
+                self.max_active = max(self.max_active, self.active)
+
+        if self.latency:
+            self.sleep(self.latency)
+        if error is not None:
+            raise error
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.active -= 1
+
+    # ---- 存储 ----
+
+    def _path(self, key):
+        """对象路径对应的本地文件"""
+        parts = key.split('/')
+        if not key or any(part in ('', '.', '..') for part in parts):
+            raise LocalOSSError(400, 'InvalidObjectName', key)
+        return os.path.join(self.objects_dir, *parts)
+
+    def _meta_path(self, key):
+        return os.path.join(self.meta_dir, *key.split('/')) + ".json"
+
+    def _receive(self, data, path):
+        """
+        接收上传的数据写入文件（按带宽限制计算传输时间）
+
+        Args:
+            data: bytes、str 或文件对象
+            path: 保存路径
+
+        Returns:
+            (大小, MD5十六进制)
+        """
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        if isinstance(data, (bytes, bytearray, memoryview)):
+            chunks = (bytes(data[i:i + CHUNK_SIZE]) for i in range(0, len(data), CHUNK_SIZE))
+        else:
+            chunks = iter(lambda: data.read(CHUNK_SIZE), b'')
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        md5 = hashlib.md5()
+        size = 0
+        try:
+            with open(tmp_path, 'wb') as f:
+                for chunk in chunks:
+                    if self.link is not None:
+                        self.link.consume(len(chunk))
+                    md5.update(chunk)
+                    f.write(chunk)
+                    size += len(chunk)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        with self._lock:
+            self.bytes_received += size
+        return size, md5.hexdigest().upper()
+
+    def _write_meta(self, key, size, etag, content_type):
+        meta_path = self._meta_path(key)
+        os.makedirs(os.path.dirname(meta_path), exist_ok=True)
+        with open(meta_path, 'w', encoding='utf-8') as f:
+            json.dump({'size': size, 'etag': etag, 'content_type': content_type,
+                       'last_modified': int(time.time())}, f)
+
+    def _read_meta(self, key):
+        """对象的元数据；对象不存在时抛出404"""
+        try:
+            path = self._path(key)
+        except LocalOSSError:
+            path = None
+        if path is None or not os.path.isfile(path):
+            raise LocalOSSError(404, 'NoSuchKey', key)
+        try:
+            with open(self._meta_path(key), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            # 直接放入 objects/ 的文件没有元数据，按内容计算
+            with open(path, 'rb') as f:
+                etag = hashlib.md5(f.read()).hexdigest().upper()
+            return {'size': os.path.getsize(path), 'etag': etag,
+                    'content_type': mimetypes.guess_type(key)[0] or 'application/octet-stream',
+                    'last_modified': int(os.path.getmtime(path))}
+
+    @staticmethod
+    def _content_type(key, headers):
+        for name, value in (headers or {}).items():
+            if name.lower() == 'content-type':
+                return value
+        return mimetypes.guess_type(key)[0] or 'application/octet-stream'
+
+    # ---- oss2.Bucket 接口 ----
+
+    def put_object(self, key, data, headers=None):
+        with self._request('put_object', key):
+            size, etag = self._receive(data, self._path(key))
+            self._write_meta(key, size, etag, self._content_type(key, headers))
+            return SimpleNamespace(status=200, etag=etag, request_id=uuid.uuid4().hex[:16].upper())
+
+    def put_object_from_file(self, key, filename, headers=None):
+        with open(filename, 'rb') as f:
+            headers = dict(headers or {})
+            headers.setdefault('Content-Type', self._content_type(filename, None))
+            return self.put_object(key, f, headers)
+
+    def copy_object(self, source_bucket_name, source_key, target_key, headers=None):
+        """服务端复制（模拟器只有一个Bucket，忽略 source_bucket_name）；支持 x-oss-copy-source-if-match"""
+        if_match = None
+        for name, value in (headers or {}).items():
+            if name.lower() == 'x-oss-copy-source-if-match':
+                if_match = value.strip('"').upper()
+        with self._request('copy_object', target_key):
+            meta = self._read_meta(source_key)
+            if if_match is not None and meta['etag'].upper() != if_match:
+                raise LocalOSSError(412, 'PreconditionFailed', f"{source_key} 的ETag不符")
+            path = self._path(target_key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+            with open(self._path(source_key), 'rb') as src, open(tmp_path, 'wb') as dst:
+                for chunk in iter(lambda: src.read(CHUNK_SIZE), b''):
+                    dst.write(chunk)
+            os.replace(tmp_path, path)
+            self._write_meta(target_key, meta['size'], meta['etag'], meta['content_type'])
+            return SimpleNamespace(status=200, etag=meta['etag'])
+
+    def head_object(self, key):
+        with self._request('head_object', key):
+            meta = self._read_meta(key)
+            headers = {'Content-Length': str(meta['size']), 'Content-Type': meta['content_type'],
+                       'ETag': f'"{meta["etag"]}"'}
+            return SimpleNamespace(status=200, etag=meta['etag'], content_length=meta['size'],
+                                   content_type=meta['content_type'], last_modified=meta['last_modified'],
+                                   headers=headers)
+
+    def object_exists(self, key):
+        try:
+            self.head_object(key)
+            return True
+        except LocalOSSError as e:
+            if e.status == 404:
+                return False
+            raise
+
+    def delete_object(self, key):
+        with self._request('delete_object', key):
+            for path in (self._path(key), self._meta_path(key)):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            return SimpleNamespace(status=204)
+
+    def _all_keys(self):
+        keys = []
+        for dirpath, _, filenames in os.walk(self.objects_dir):
+            rel_dir = os.path.relpath(dirpath, self.objects_dir)
+            for name in filenames:
+                if name.endswith('.tmp'):
+                    continue
+                rel_path = name if rel_dir == '.' else os.path.join(rel_dir, name)
+                keys.append(rel_path.replace(os.sep, '/'))
+        keys.sort()
+        return keys
+
+    def list_objects(self, prefix='', delimiter='', marker='', max_keys=100):
+        with self._request('list_objects', prefix):
+            object_list = []
+            prefix_list = []
+            last = ''
+            truncated = False
+            for key in self._all_keys():
+                if not key.startswith(prefix) or key <= marker:
+                    continue
+                # 上一页以公共前缀结束时，跳过该前缀下的其余对象
+                if delimiter and marker.endswith(delimiter) and key.startswith(marker):
+                    continue
+                common = None
+                if delimiter:
+                    position = key.find(delimiter, len(prefix))
+                    if position >= 0:
+                        common = key[:position + len(delimiter)]
+                if common is not None and prefix_list and prefix_list[-1] == common:
+                    continue
+                if len(object_list) + len(prefix_list) >= max_keys:
+                    truncated = True
+                    break
+                if common is not None:
+                    prefix_list.append(common)
+                    last = common
+                else:
+                    meta = self._read_meta(key)
+                    object_list.append(SimpleNamespace(
+                        key=key, size=meta['size'], etag=meta['etag'], last_modified=meta['last_modified'],
+                        type='Multipart' if '-' in meta['etag'] else 'Normal', storage_class='Standard'
+                    ))
+                    last = key
+            return SimpleNamespace(status=200, object_list=object_list, prefix_list=prefix_list,
+                                   is_truncated=truncated, next_marker=last if truncated else '')
+
+    def init_multipart_upload(self, key, headers=None):
+        with self._request('init_multipart_upload', key):
+            self._path(key)
+            upload_id = uuid.uuid4().hex.upper()
+            upload_dir = os.path.join(self.uploads_dir, upload_id)
+            os.makedirs(upload_dir)
+            with open(os.path.join(upload_dir, "upload.json"), 'w', encoding='utf-8') as f:
+                json.dump({'key': key, 'content_type': self._content_type(key, headers)}, f,
+                          ensure_ascii=False)
+            return SimpleNamespace(status=200, upload_id=upload_id)
+
+    def _upload_dir(self, key, upload_id):
+        """分片上传任务的目录；任务不存在时抛出404"""
+        upload_dir = os.path.join(self.uploads_dir, str(upload_id))
+        try:
+            with open(os.path.join(upload_dir, "upload.json"), 'r', encoding='utf-8') as f:
+                info = json.load(f)
+        except (OSError, ValueError):
+            info = None
+        if info is None or info['key'] != key:
+            raise LocalOSSError(404, 'NoSuchUpload', str(upload_id))
+        return upload_dir, info
+
+    def upload_part(self, key, upload_id, part_number, data, headers=None):
+        with self._request('upload_part', key):
+            upload_dir, _ = self._upload_dir(key, upload_id)
+            _, etag = self._receive(data, os.path.join(upload_dir, f"{int(part_number)}.part"))
+            return SimpleNamespace(status=200, etag=etag)
+
+    def _parts(self, upload_dir):
+        """已上传的分片 {分片号: (大小, ETag)}"""
+        parts = {}
+        for name in os.listdir(upload_dir):
+            if not name.endswith('.part'):
+                continue
+            path = os.path.join(upload_dir, name)
+            with open(path, 'rb') as f:
+                etag = hashlib.md5(f.read()).hexdigest().upper()
+            parts[int(name[:-len('.part')])] = (os.path.getsize(path), etag)
+        return parts
+
+    def list_parts(self, key, upload_id, marker='', max_parts=1000):
+        with self._request('list_parts', key):
+            upload_dir, _ = self._upload_dir(key, upload_id)
+            parts = [SimpleNamespace(part_number=number, size=size, etag=etag)
+                     for number, (size, etag) in sorted(self._parts(upload_dir).items())]
+            return SimpleNamespace(status=200, parts=parts, is_truncated=False, next_marker='')
+
+    def complete_multipart_upload(self, key, upload_id, parts, headers=None):
+        with self._request('complete_multipart_upload', key):
+            upload_dir, info = self._upload_dir(key, upload_id)
+            uploaded = self._parts(upload_dir)
+            numbers = [part.part_number for part in parts]
+            if not parts or numbers != sorted(set(numbers)):
+                raise LocalOSSError(400, 'InvalidPartOrder', key)
+            for part in parts:
+                if uploaded.get(part.part_number, (None, None))[1] != (part.etag or '').strip('"').upper():
+                    raise LocalOSSError(400, 'InvalidPart', f"{key} 分片 {part.part_number}")
+
+            # 与OSS相同：ETag为各分片MD5拼接后的MD5加分片数
+            digest = hashlib.md5(b"".join(bytes.fromhex(uploaded[n][1]) for n in numbers))
+            etag = f"{digest.hexdigest().upper()}-{len(numbers)}"
+            path = self._path(key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+            with open(tmp_path, 'wb') as out:
+                for number in numbers:
+                    with open(os.path.join(upload_dir, f"{number}.part"), 'rb') as f:
+                        while True:
+                            chunk = f.read(CHUNK_SIZE)
+                            if not chunk:
+                                break
+                            out.write(chunk)
+            os.replace(tmp_path, path)
+            self._write_meta(key, os.path.getsize(path), etag, info['content_type'])
+            self._remove_upload(upload_dir)
+            return SimpleNamespace(status=200, etag=etag)
+
+    def abort_multipart_upload(self, key, upload_id):
+        with self._request('abort_multipart_upload', key):
+            upload_dir, _ = self._upload_dir(key, upload_id)
+            self._remove_upload(upload_dir)
+            return SimpleNamespace(status=204)
+
+    @staticmethod
+    def _remove_upload(upload_dir):
+        for name in os.listdir(upload_dir):
+            os.remove(os.path.join(upload_dir, name))
+        os.rmdir(upload_dir)
+
+    def get_bucket_info(self):
+        with self._request('get_bucket_info'):
+            return SimpleNamespace(status=200, name=os.path.basename(self.root_dir), location='local')
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+日志缓冲模块
+工作线程只把日志放入线程安全的队列，由界面主循环定时批量取出显示；
+完整日志同时写入按大小滚动的日志文件。
+"""
+
+import os
+import queue
+import logging
+from logging.handlers import RotatingFileHandler
+
+
+class LogSink:
+    """线程安全的日志缓冲"""
+
+    DEFAULT_LOG_FILE = os.path.join("logs", "processing.log")
+    # 单个日志文件大小上限和保留的历史文件数
+    MAX_BYTES = 5 * 1024 * 1024
+    BACKUP_COUNT = 5
+
+    def __init__(self, log_file=None, max_bytes=None, backup_count=None):
+        """
+        Args:
+            log_file: 日志文件路径，默认 DEFAULT_LOG_FILE；传入空字符串则不写文件
+            max_bytes: 单个日志文件大小上限
+            backup_count: 保留的历史日志文件数
+        """
+        self.queue = queue.SimpleQueue()
+        self.logger = None
+
+        if log_file is None:
+            log_file = self.DEFAULT_LOG_FILE
+        if log_file:
+            try:
+                log_dir = os.path.dirname(log_file)
+                if log_dir:
+                    os.makedirs(log_dir, exist_ok=True)
+                handler = RotatingFileHandler(
+                    log_file,
+                    maxBytes=max_bytes or self.MAX_BYTES,
+                    backupCount=backup_count or self.BACKUP_COUNT,
+                    encoding='utf-8'
+                )
+                handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+                self.logger = logging.getLogger(f"{__name__}.{id(self)}")
+                self.logger.setLevel(logging.INFO)
+                self.logger.propagate = False
+                self.logger.addHandler(handler)
+            except Exception as e:
+                print(f"创建日志文件失败: {e}")
+
+    def write(self, message):
+        """写入一条日志（可在任意线程调用）"""
+        self.queue.put(message)
+        if self.logger:
+            self.logger.info(message)
+
+    def drain(self, max_items=None):
+        """
+        取出队列中的日志
+
+        Args:
+            max_items: 最多取出的条数，None表示全部取出
+
+        Returns:
+            日志消息列表
+        """
+        messages = []
+        while max_items is None or len(messages) < max_items:
+            try:
+                messages.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return messages
+
+    def close(self):
+        """关闭日志文件"""
+        if self.logger:
+            for handler in list(self.logger.handlers):
+                handler.close()
+                self.logger.removeHandler(handler)
@@ -6,19 +6,73 @@
 1. 为指定目录结构下的最深一级子目录中的所有图片生成二维码
 2. 将二维码插入到PDF中
 3. 上传图片到阿里云OSS
+
+启动时只导入界面需要的模块：oss2、qrcode、PIL、reportlab 画布在窗口显示后由后台线程预热，
+或在第一次使用时导入。使用 --startup-time 参数运行可测量启动各阶段的耗时。
 """
 
+import time
+
+# 启动计时起点（在其他模块导入之前记录）
+STARTUP_STARTED = time.perf_counter()
+
 import os
+import sys
+import json
+import importlib
+import multiprocessing
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, scrolledtext, simpledialog
-import qrcode
-from PIL import Image
-from reportlab.lib.pagesizes import A3, A4, A5, landscape
-from reportlab.pdfgen import canvas
-from reportlab.lib.units import mm
 import threading
-from urllib.parse import quote
 from oss_helper import OSSConfig, OSSUploader
+from engine import DocumentProcessor, PAGE_SIZES, resolve_page_size
+from log_sink import LogSink
+from cpu_pool import default_workers
+from bandwidth import UploadWindow
+from progress import format_progress
+
+
+class StartupTimer:
+    """启动计时：记录各阶段距程序启动的毫秒数，用于比较不同版本的启动速度"""
+    
+    # 测量结果追加到此文件（每次一行JSON）
+    RECORD_FILE = os.path.join("logs", "startup.jsonl")
+    
+    def __init__(self, started=None):
+        """
+        Args:
+            started: 起点（time.perf_counter() 的值），默认为导入本模块时
+        """
+        self.started = STARTUP_STARTED if started is None else started
+        self.marks = {}
+    
+    def mark(self, name):
+        """记录一个阶段完成的时刻（重复调用只保留第一次）"""
+        if name not in self.marks:
+            self.marks[name] = round((time.perf_counter() - self.started) * 1000, 1)
+    
+    def save(self, path=None):
+        """
+        把测量结果追加到记录文件
+        
+        Returns:
+            记录（字典）
+        """
+        record = {
+            'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'frozen': bool(getattr(sys, 'frozen', False)),
+            'python': sys.version.split()[0],
+        }
+        record.update({f"{name}_ms": value for name, value in self.marks.items()})
+        path = path or self.RECORD_FILE
+        try:
+            if os.path.dirname(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        except Exception as e:
+            print(f"保存启动时间失败: {e}")
+        return record
 
 
 class OSSConfigDialog(tk.Toplevel):
@@ -27,7 +81,7 @@ class OSSConfigDialog(tk.Toplevel):
     def __init__(self, parent, config):
         super().__init__(parent)
         self.title("OSS配置")
-        self.geometry("500x400")
+        self.geometry("540x610")
         self.config = config
         self.result = False
         
@@ -74,9 +128,56 @@ class OSSConfigDialog(tk.Toplevel):
         ttk.Label(main_frame, text="例: documents/xigou (可选)", 
                  foreground="gray").grid(row=6, column=1, sticky=tk.W)
         
+        # 并发上传数
+        ttk.Label(main_frame, text="并发上传数:").grid(row=7, column=0, sticky=tk.W, pady=5)
+        self.upload_concurrency_var = tk.StringVar()
+        ttk.Entry(main_frame, textvariable=self.upload_concurrency_var, width=10).grid(row=7, column=1, sticky=tk.W, pady=5)
+        
+        # 分片上传
+        ttk.Label(main_frame, text="分片上传:").grid(row=8, column=0, sticky=tk.W, pady=5)
+        multipart_frame = ttk.Frame(main_frame)
+        multipart_frame.grid(row=8, column=1, sticky=tk.W, pady=5)
+        ttk.Label(multipart_frame, text="阈值(MB)").pack(side=tk.LEFT)
+        self.multipart_threshold_var = tk.StringVar()
+        ttk.Entry(multipart_frame, textvariable=self.multipart_threshold_var, width=6).pack(side=tk.LEFT, padx=(2, 8))
+        ttk.Label(multipart_frame, text="分片大小(MB)").pack(side=tk.LEFT)
+        self.part_size_var = tk.StringVar()
+        ttk.Entry(multipart_frame, textvariable=self.part_size_var, width=6).pack(side=tk.LEFT, padx=(2, 8))
+        ttk.Label(multipart_frame, text="分片并发").pack(side=tk.LEFT)
+        self.part_concurrency_var = tk.StringVar()
+        ttk.Entry(multipart_frame, textvariable=self.part_concurrency_var, width=6).pack(side=tk.LEFT, padx=2)
+        
+        # 连接设置
+        ttk.Label(main_frame, text="连接设置:").grid(row=9, column=0, sticky=tk.W, pady=5)
+        connection_frame = ttk.Frame(main_frame)
+        connection_frame.grid(row=9, column=1, sticky=tk.W, pady=5)
+        ttk.Label(connection_frame, text="连接池").pack(side=tk.LEFT)
+        self.connection_pool_size_var = tk.StringVar()
+        ttk.Entry(connection_frame, textvariable=self.connection_pool_size_var, width=6).pack(side=tk.LEFT, padx=(2, 8))
+        ttk.Label(connection_frame, text="连接超时(秒)").pack(side=tk.LEFT)
+        self.connect_timeout_var = tk.StringVar()
+        ttk.Entry(connection_frame, textvariable=self.connect_timeout_var, width=6).pack(side=tk.LEFT, padx=(2, 8))
+        ttk.Label(connection_frame, text="读取超时(秒)").pack(side=tk.LEFT)
+        self.read_timeout_var = tk.StringVar()
+        ttk.Entry(connection_frame, textvariable=self.read_timeout_var, width=6).pack(side=tk.LEFT, padx=2)
+        
+        # 带宽设置
+        ttk.Label(main_frame, text="带宽设置:").grid(row=10, column=0, sticky=tk.W, pady=5)
+        bandwidth_frame = ttk.Frame(main_frame)
+        bandwidth_frame.grid(row=10, column=1, sticky=tk.W, pady=5)
+        ttk.Label(bandwidth_frame, text="上限(KB/s)").pack(side=tk.LEFT)
+        self.bandwidth_limit_var = tk.StringVar()
+        ttk.Entry(bandwidth_frame, textvariable=self.bandwidth_limit_var, width=7).pack(side=tk.LEFT, padx=(2, 8))
+        ttk.Label(bandwidth_frame, text="上传时段").pack(side=tk.LEFT)
+        self.upload_window_var = tk.StringVar()
+        ttk.Entry(bandwidth_frame, textvariable=self.upload_window_var, width=12).pack(side=tk.LEFT, padx=(2, 8))
+        ttk.Label(bandwidth_frame, text="大于(MB)").pack(side=tk.LEFT)
+        self.upload_window_min_var = tk.StringVar()
+        ttk.Entry(bandwidth_frame, textvariable=self.upload_window_min_var, width=5).pack(side=tk.LEFT, padx=2)
+        
         # 按钮
         button_frame = ttk.Frame(main_frame)
-        button_frame.grid(row=7, column=0, columnspan=2, pady=20)
+        button_frame.grid(row=11, column=0, columnspan=2, pady=20)
         
         ttk.Button(button_frame, text="测试连接", command=self.test_connection).pack(side=tk.LEFT, padx=5)
         ttk.Button(button_frame, text="保存", command=self.save_config).pack(side=tk.LEFT, padx=5)
@@ -84,13 +185,17 @@ class OSSConfigDialog(tk.Toplevel):
         
         # 说明
         info_frame = ttk.LabelFrame(main_frame, text="说明", padding="10")
-        info_frame.grid(row=8, column=0, columnspan=2, sticky=(tk.W, tk.E), pady=10)
+        info_frame.grid(row=12, column=0, columnspan=2, sticky=(tk.W, tk.E), pady=10)
         
         info_text = """
 • Access Key可在阿里云控制台获取
 • Endpoint格式: oss-cn-<region>.aliyuncs.com
 • 配置将保存在本地文件中
 • 基础路径为OSS中的目录前缀，可以为空
+• 并发上传数为同时上传的文件数，网络较差时可适当调小
+• 超过分片阈值的文件分片上传，中断后可从已完成的分片继续
+• 连接池为0时按并发上传数自动设置，连接在多次上传之间复用
+• 带宽上限为0时不限速；上传时段如 22:00-06:00，时段外大文件排队等待
         """
         ttk.Label(info_frame, text=info_text, justify=tk.LEFT).pack()
         
@@ -101,6 +206,16 @@ class OSSConfigDialog(tk.Toplevel):
         self.endpoint_var.set(self.config.endpoint)
         self.bucket_name_var.set(self.config.bucket_name)
         self.base_path_var.set(self.config.base_path)
+        self.upload_concurrency_var.set(str(self.config.upload_concurrency))
+        self.multipart_threshold_var.set(f"{self.config.multipart_threshold_mb:g}")
+        self.part_size_var.set(f"{self.config.part_size_mb:g}")
+        self.part_concurrency_var.set(str(self.config.part_concurrency))
+        self.connection_pool_size_var.set(str(self.config.connection_pool_size))
+        self.connect_timeout_var.set(f"{self.config.connect_timeout:g}")
+        self.read_timeout_var.set(f"{self.config.read_timeout:g}")
+        self.bandwidth_limit_var.set(f"{self.config.bandwidth_limit_kb:g}")
+        self.upload_window_var.set(self.config.upload_window)
+        self.upload_window_min_var.set(f"{self.config.upload_window_min_mb:g}")
     
     def test_connection(self):
         """测试OSS连接"""
@@ -123,11 +238,55 @@ class OSSConfigDialog(tk.Toplevel):
         self.config.endpoint = self.endpoint_var.get().strip()
         self.config.bucket_name = self.bucket_name_var.get().strip()
         self.config.base_path = self.base_path_var.get().strip()
+        try:
+            self.config.upload_concurrency = max(1, int(self.upload_concurrency_var.get()))
+        except ValueError:
+            self.config.upload_concurrency = OSSConfig.DEFAULT_UPLOAD_CONCURRENCY
+        try:
+            self.config.multipart_threshold_mb = max(0.0, float(self.multipart_threshold_var.get()))
+        except ValueError:
+            self.config.multipart_threshold_mb = OSSConfig.DEFAULT_MULTIPART_THRESHOLD_MB
+        try:
+            self.config.part_size_mb = max(0.1, float(self.part_size_var.get()))
+        except ValueError:
+            self.config.part_size_mb = OSSConfig.DEFAULT_PART_SIZE_MB
+        try:
+            self.config.part_concurrency = max(1, int(self.part_concurrency_var.get()))
+        except ValueError:
+            self.config.part_concurrency = OSSConfig.DEFAULT_PART_CONCURRENCY
+        try:
+            self.config.connection_pool_size = max(0, int(self.connection_pool_size_var.get()))
+        except ValueError:
+            self.config.connection_pool_size = OSSConfig.DEFAULT_CONNECTION_POOL_SIZE
+        try:
+            self.config.connect_timeout = max(1.0, float(self.connect_timeout_var.get()))
+        except ValueError:
+            self.config.connect_timeout = OSSConfig.DEFAULT_CONNECT_TIMEOUT
+        try:
+            self.config.read_timeout = max(1.0, float(self.read_timeout_var.get()))
+        except ValueError:
+            self.config.read_timeout = OSSConfig.DEFAULT_READ_TIMEOUT
+        try:
+            self.config.bandwidth_limit_kb = max(0.0, float(self.bandwidth_limit_var.get()))
+        except ValueError:
+            self.config.bandwidth_limit_kb = OSSConfig.DEFAULT_BANDWIDTH_LIMIT_KB
+        self.config.upload_window = self.upload_window_var.get().strip()
+        try:
+            self.config.upload_window_min_mb = max(0.0, float(self.upload_window_min_var.get()))
+        except ValueError:
+            self.config.upload_window_min_mb = OSSConfig.DEFAULT_UPLOAD_WINDOW_MIN_MB
     
     def save_config(self):
         """保存配置"""
         self.save_to_config()
         
+        if self.config.upload_window:
+            try:
+                UploadWindow(self.config.upload_window)
+            except ValueError as e:
+                messagebox.showerror("错误", str(e))
+                return
+        
         if self.config.save_config():
             messagebox.showinfo("成功", "配置已保存！")
             self.result = True
@@ -141,30 +300,73 @@ class OSSConfigDialog(tk.Toplevel):
 
 
 class DocumentProcessorApp:
-    """文档处理应用主类"""
+    """文档处理应用主类（界面层，处理逻辑由 DocumentProcessor 完成）"""
+    
+    # 日志刷新间隔（毫秒）、每次刷新的最大条数、日志窗口保留的最大行数
+    LOG_FLUSH_INTERVAL_MS = 100
+    LOG_FLUSH_BATCH = 500
+    LOG_MAX_LINES = 5000
+    # 进度刷新间隔（毫秒）
+    PROGRESS_REFRESH_INTERVAL_MS = 500
+    
+    # 合并PDF选项
+    BATCH_PDF_LAYOUTS = {
+        "不生成": None,
+        "每页一个": "single",
+        "拼版": "tile"
+    }
+    
+    # 窗口显示后在后台预先导入的模块（第一次生成二维码和PDF时不再等待导入）
+    WARM_UP_MODULES = ('qrcode', 'PIL.Image', 'reportlab.pdfgen.canvas')
     
-    def __init__(self, root):
+    def __init__(self, root, startup_timer=None):
         self.root = root
+        self.startup_timer = startup_timer or StartupTimer()
         self.root.title("文档处理工具 - 二维码、PDF与OSS管理器")
         self.root.geometry("950x750")
         
         # 页面尺寸映射
-        self.page_sizes = {
-            "A3": A3,
-            "A4": A4,
-            "A5": A5,
-            "自定义": None
-        }
+        self.page_sizes = PAGE_SIZES
         
         # OSS配置
         self.oss_config = OSSConfig()
-        self.oss_uploader = None
-        if self.oss_config.is_valid():
-            self.oss_uploader = OSSUploader(self.oss_config)
+        
+        # 日志缓冲：工作线程写入队列，主循环定时批量显示
+        self.log_sink = LogSink()
+        
+        # 处理引擎（OSS上传器在窗口显示后由后台线程创建）
+        self.processor = DocumentProcessor(self.oss_config, log=self.log, defer_oss=True)
+        self.warm_up_done = threading.Event()
         
         # 创建界面
         self.create_widgets()
         
+        # 启动日志刷新和进度刷新
+        self.root.after(self.LOG_FLUSH_INTERVAL_MS, self.flush_log)
+        self.root.after(self.PROGRESS_REFRESH_INTERVAL_MS, self.refresh_progress)
+        
+        # 窗口显示后开始后台预热
+        self.startup_timer.mark('window')
+        self.root.after_idle(self.start_warm_up)
+        
+    def start_warm_up(self):
+        """窗口已显示：在后台线程中创建OSS上传器并预先导入生成二维码和PDF用到的模块"""
+        self.startup_timer.mark('shown')
+        threading.Thread(target=self.warm_up, daemon=True).start()
+    
+    def warm_up(self):
+        """后台预热（在后台线程中运行）"""
+        try:
+            self.processor.prepare_oss_uploader()
+            self.startup_timer.mark('oss_ready')
+            for name in self.WARM_UP_MODULES:
+                importlib.import_module(name)
+        except Exception as e:
+            self.log(f"后台初始化失败: {str(e)}")
+        finally:
+            self.startup_timer.mark('warm_up')
+            self.warm_up_done.set()
+    
     def create_widgets(self):
         """创建GUI组件"""
         
@@ -188,6 +390,15 @@ class DocumentProcessorApp:
         dir_type_frame.grid(row=1, column=1, sticky=tk.W, pady=5)
         ttk.Radiobutton(dir_type_frame, text="村（二级目录）", variable=self.dir_type_var, value="村").pack(side=tk.LEFT, padx=10)
         ttk.Radiobutton(dir_type_frame, text="乡（三级目录）", variable=self.dir_type_var, value="乡").pack(side=tk.LEFT, padx=10)
+        ttk.Radiobutton(dir_type_frame, text="自动（最深一级目录）", variable=self.dir_type_var, value="自动").pack(side=tk.LEFT, padx=10)
+        
+        # 增量处理
+        self.incremental_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(dir_frame, text="增量处理（跳过未变化的图片、二维码和PDF）",
+                       variable=self.incremental_var).grid(row=2, column=1, sticky=tk.W, pady=5)
+        self.process_pool_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(dir_frame, text=f"多进程处理（{default_workers()} 个CPU核心）", 
+                       variable=self.process_pool_var).grid(row=3, column=1, sticky=tk.W, pady=5)
         
         # OSS设置
         oss_frame = ttk.LabelFrame(main_frame, text="OSS设置", padding="10")
@@ -206,6 +417,18 @@ class DocumentProcessorApp:
         self.auto_upload_var = tk.BooleanVar(value=False)
         ttk.Checkbutton(oss_frame, text="生成二维码后自动上传图片到OSS", 
                        variable=self.auto_upload_var).grid(row=1, column=0, sticky=tk.W, pady=5)
+        self.derivatives_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(oss_frame, text="上传时生成缩略图（加快图片浏览页面加载）", 
+                       variable=self.derivatives_var).grid(row=2, column=0, sticky=tk.W, pady=5)
+        self.skip_existing_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(oss_frame, text="上传前对比OSS已有文件（跳过大小和MD5相同的文件）", 
+                       variable=self.skip_existing_var).grid(row=3, column=0, sticky=tk.W, pady=5)
+        self.normalize_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(oss_frame, text="上传前压缩图片（按拍摄方向旋转、缩小、去除元数据）", 
+                       variable=self.normalize_var).grid(row=4, column=0, sticky=tk.W, pady=5)
+        self.dedup_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(oss_frame, text="跨目录去重（内容相同的文件只上传一次，其余使用OSS服务端复制）", 
+                       variable=self.dedup_var).grid(row=5, column=0, sticky=tk.W, pady=5)
         
         # PDF设置
         pdf_frame = ttk.LabelFrame(main_frame, text="PDF设置", padding="10")
@@ -227,6 +450,12 @@ class DocumentProcessorApp:
         ttk.Radiobutton(orientation_frame, text="纵向", variable=self.page_orientation_var, value="纵向").pack(side=tk.LEFT, padx=5)
         ttk.Radiobutton(orientation_frame, text="横向", variable=self.page_orientation_var, value="横向").pack(side=tk.LEFT, padx=5)
         
+        # 合并PDF
+        ttk.Label(pdf_frame, text="合并PDF:").grid(row=2, column=0, sticky=tk.W, pady=5)
+        self.batch_pdf_var = tk.StringVar(value="不生成")
+        ttk.Combobox(pdf_frame, textvariable=self.batch_pdf_var, values=list(self.BATCH_PDF_LAYOUTS.keys()),
+                     state="readonly", width=15).grid(row=2, column=1, sticky=tk.W, padx=5, pady=5)
+        
         # 自定义尺寸
         self.custom_size_frame = ttk.Frame(pdf_frame)
         self.custom_size_frame.grid(row=0, column=2, columnspan=4, sticky=tk.W, padx=5, pady=5)
@@ -250,6 +479,11 @@ class DocumentProcessorApp:
         self.qr_size_var = tk.StringVar(value="50")
         ttk.Entry(qr_frame, textvariable=self.qr_size_var, width=10).grid(row=0, column=1, sticky=tk.W, padx=5, pady=5)
         
+        # 矢量二维码
+        self.qr_vector_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(qr_frame, text="PDF中使用矢量二维码（打印更清晰，文件更小）",
+                       variable=self.qr_vector_var).grid(row=0, column=2, columnspan=2, sticky=tk.W, padx=(20, 0), pady=5)
+        
         # 二维码位置
         ttk.Label(qr_frame, text="X坐标(mm):").grid(row=1, column=0, sticky=tk.W, pady=5)
         self.qr_x_var = tk.StringVar(value="10")
@@ -272,6 +506,13 @@ class DocumentProcessorApp:
         self.upload_button = ttk.Button(button_frame, text="仅上传到OSS", command=self.upload_only, width=15)
         self.upload_button.pack(side=tk.LEFT, padx=5)
         
+        self.retry_button = ttk.Button(button_frame, text="重试失败文件", command=self.retry_failed, width=15)
+        self.retry_button.pack(side=tk.LEFT, padx=5)
+        
+        self.cancel_button = ttk.Button(button_frame, text="取消", command=self.cancel_run, width=15,
+                                        state='disabled')
+        self.cancel_button.pack(side=tk.LEFT, padx=5)
+        
         ttk.Button(button_frame, text="清除日志", command=self.clear_log, width=15).pack(side=tk.LEFT, padx=5)
         
         # 进度显示
@@ -281,7 +522,7 @@ class DocumentProcessorApp:
         self.progress_var = tk.StringVar(value="就绪")
         ttk.Label(progress_frame, textvariable=self.progress_var).pack(anchor=tk.W)
         
-        self.progress_bar = ttk.Progressbar(progress_frame, mode='indeterminate')
+        self.progress_bar = ttk.Progressbar(progress_frame, mode='determinate', maximum=100)
         self.progress_bar.pack(fill=tk.X, pady=5)
         
         # 日志显示
@@ -309,9 +550,8 @@ class DocumentProcessorApp:
         dialog = OSSConfigDialog(self.root, self.oss_config)
         self.root.wait_window(dialog)
         
-        # 更新上传器
-        if self.oss_config.is_valid():
-            self.oss_uploader = OSSUploader(self.oss_config)
+        # 按新配置重新创建上传器（与后台预热使用同一创建流程）
+        self.processor.reset_oss_uploader()
         
         self.update_oss_status()
     
@@ -330,10 +570,34 @@ class DocumentProcessorApp:
             self.log(f"已选择目录: {directory}")
     
     def log(self, message):
-        """添加日志信息"""
-        self.log_text.insert(tk.END, f"{message}\n")
-        self.log_text.see(tk.END)
-        self.root.update_idletasks()
+        """添加日志信息（线程安全，实际显示由 flush_log 完成）"""
+        self.log_sink.write(message)
+    
+    def flush_log(self):
+        """在主循环中批量显示缓冲的日志，并限制日志窗口的行数"""
+        try:
+            messages = self.log_sink.drain(self.LOG_FLUSH_BATCH)
+            if messages:
+                self.log_text.insert(tk.END, "\n".join(messages) + "\n")
+                
+                # 只保留最近的 LOG_MAX_LINES 行，完整日志见日志文件
+                line_count = int(self.log_text.index('end-1c').split('.')[0]) - 1
+                if line_count > self.LOG_MAX_LINES:
+                    self.log_text.delete('1.0', f"{line_count - self.LOG_MAX_LINES + 1}.0")
+                
+                self.log_text.see(tk.END)
+        finally:
+            self.root.after(self.LOG_FLUSH_INTERVAL_MS, self.flush_log)
+    
+    def refresh_progress(self):
+        """在主循环中定时读取处理进度，更新进度条和完成百分比、速度、剩余时间"""
+        try:
+            snapshot = self.processor.progress.snapshot()
+            if snapshot['running']:
+                self.progress_bar['value'] = snapshot['percent']
+                self.progress_var.set(format_progress(snapshot))
+        finally:
+            self.root.after(self.PROGRESS_REFRESH_INTERVAL_MS, self.refresh_progress)
     
     def clear_log(self):
         """清除日志"""
@@ -341,490 +605,22 @@ class DocumentProcessorApp:
     
     def get_page_size(self):
         """获取页面尺寸"""
-        page_size_name = self.page_size_var.get()
-        orientation = self.page_orientation_var.get()
-        
-        if page_size_name == "自定义":
-            try:
-                width = float(self.custom_width_var.get()) * mm
-                height = float(self.custom_height_var.get()) * mm
-                # 应用方向
-                if orientation == "横向":
-                    width, height = height, width
-                return (width, height)
-            except ValueError:
-                messagebox.showerror("错误", "自定义尺寸必须是数字")
-                return None
-        else:
-            page_size = self.page_sizes[page_size_name]
-            # 应用方向
-            if orientation == "横向":
-                page_size = landscape(page_size)
-            return page_size
-    
-    def get_target_directories(self, root_dir, dir_type):
-        """
-        获取目标目录列表（最深一级子目录）
-        
-        Args:
-            root_dir: 根目录路径
-            dir_type: 目录类型，"村"（二级）或"乡"（三级）
-            
-        Returns:
-            目标目录列表
-        """
-        target_dirs = []
-        
-        if dir_type == "村":
-            # 二级目录结构：根目录/一级目录
-            for item in os.listdir(root_dir):
-                item_path = os.path.join(root_dir, item)
-                if os.path.isdir(item_path) and not item.startswith('.'):
-                    target_dirs.append(item_path)
-        else:  # 乡
-            # 三级目录结构：根目录/一级目录/二级目录
-            for level1 in os.listdir(root_dir):
-                level1_path = os.path.join(root_dir, level1)
-                if os.path.isdir(level1_path) and not level1.startswith('.'):
-                    for level2 in os.listdir(level1_path):
-                        level2_path = os.path.join(level1_path, level2)
-                        if os.path.isdir(level2_path) and not level2.startswith('.'):
-                            target_dirs.append(level2_path)
-        
-        return target_dirs
-    
-    def get_images_in_directory(self, directory):
-        """
-        获取目录中的所有图片文件
-        
-        Args:
-            directory: 目录路径
-            
-        Returns:
-            图片文件列表
-        """
-        image_extensions = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.webp'}
-        images = []
-        
         try:
-            for item in os.listdir(directory):
-                if os.path.isfile(os.path.join(directory, item)):
-                    _, ext = os.path.splitext(item)
-                    if ext.lower() in image_extensions:
-                        images.append(item)
-        except Exception as e:
-            self.log(f"读取目录 {directory} 时出错: {str(e)}")
-        
-        return images
-    
-    def generate_qrcode(self, url, output_path, size_mm=50):
-        """
-        生成二维码图片
-        
-        Args:
-            url: 二维码内容（URL）
-            output_path: 输出文件路径
-            size_mm: 二维码大小（毫米）
-        """
-        try:
-            # 将毫米转换为像素（假设300 DPI）
-            dpi = 300
-            size_px = int(size_mm * dpi / 25.4)
-            
-            qr = qrcode.QRCode(
-                version=1,
-                error_correction=qrcode.constants.ERROR_CORRECT_H,
-                box_size=10,
-                border=4,
+            return resolve_page_size(
+                self.page_size_var.get(),
+                self.page_orientation_var.get(),
+                self.custom_width_var.get(),
+                self.custom_height_var.get()
             )
-            qr.add_data(url)
-            qr.make(fit=True)
-            
-            img = qr.make_image(fill_color="black", back_color="white")
-            img = img.resize((size_px, size_px), Image.Resampling.LANCZOS)
-            img.save(output_path)
-            
-            return True
-        except Exception as e:
-            self.log(f"生成二维码失败: {str(e)}")
-            return False
-    
-    def create_pdf_with_qrcode(self, qr_image_path, pdf_path, page_size, qr_size_mm, x_mm, y_mm):
-        """
-        创建PDF并插入二维码
-        
-        Args:
-            qr_image_path: 二维码图片路径
-            pdf_path: PDF输出路径
-            page_size: 页面尺寸
-            qr_size_mm: 二维码大小（毫米）
-            x_mm: X坐标（毫米）
-            y_mm: Y坐标（毫米）
-        """
-        try:
-            c = canvas.Canvas(pdf_path, pagesize=page_size)
-            
-            # 将毫米转换为点（ReportLab使用点作为单位）
-            qr_size = qr_size_mm * mm
-            x_pos = x_mm * mm
-            y_pos = y_mm * mm
-            
-            # 在PDF上绘制二维码
-            c.drawImage(qr_image_path, x_pos, y_pos, width=qr_size, height=qr_size)
-            
-            c.save()
-            return True
-        except Exception as e:
-            self.log(f"创建PDF失败: {str(e)}")
-            return False
-    
-    def generate_index_html(self, directory, uploaded_files, dir_name):
-        """
-        生成索引HTML文件，用于在浏览器中查看图片列表
-        
-        Args:
-            directory: 本地目录路径
-            uploaded_files: 已上传的文件列表
-            dir_name: 目录名称
-            
-        Returns:
-            index.html文件路径
-        """
-        html_content = f"""<!DOCTYPE html>
-<html lang="zh-CN">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>{dir_name} - 图片浏览</title>
-    <style>
-        * {{
-            margin: 0;
-            padding: 0;
-            box-sizing: border-box;
-        }}
-        body {{
-            font-family: -apple-system, BlinkMacSystemFont, "Segoe UI", Roboto, "Helvetica Neue", Arial, sans-serif;
-            background: #f5f5f5;
-            padding: 20px;
-        }}
-        .container {{
-            max-width: 1200px;
-            margin: 0 auto;
-            background: white;
-            border-radius: 8px;
-            box-shadow: 0 2px 8px rgba(0,0,0,0.1);
-            padding: 30px;
-        }}
-        h1 {{
-            color: #333;
-            margin-bottom: 10px;
-            font-size: 28px;
-        }}
-        .info {{
-            color: #666;
-            margin-bottom: 30px;
-            font-size: 14px;
-        }}
-        .gallery {{
-            display: grid;
-            grid-template-columns: repeat(auto-fill, minmax(250px, 1fr));
-            gap: 20px;
-            margin-top: 20px;
-        }}
-        .image-item {{
-            background: #fff;
-            border: 1px solid #e0e0e0;
-            border-radius: 8px;
-            overflow: hidden;
-            transition: transform 0.2s, box-shadow 0.2s;
-            cursor: pointer;
-        }}
-        .image-item:hover {{
-            transform: translateY(-4px);
-            box-shadow: 0 4px 12px rgba(0,0,0,0.15);
-        }}
-        .image-item img {{
-            width: 100%;
-            height: 200px;
-            object-fit: cover;
-            display: block;
-        }}
-        .image-name {{
-            padding: 12px;
-            font-size: 14px;
-            color: #333;
-            text-align: center;
-            word-break: break-all;
-        }}
-        .lightbox {{
-            display: none;
-            position: fixed;
-            top: 0;
-            left: 0;
-            width: 100%;
-            height: 100%;
-            background: rgba(0,0,0,0.9);
-            z-index: 1000;
-            justify-content: center;
-            align-items: center;
-        }}
-        .lightbox.active {{
-            display: flex;
-        }}
-        .lightbox img {{
-            max-width: 90%;
-            max-height: 90%;
-            object-fit: contain;
-        }}
-        .lightbox-close {{
-            position: absolute;
-            top: 20px;
-            right: 30px;
-            color: white;
-            font-size: 40px;
-            cursor: pointer;
-            z-index: 1001;
-        }}
-        @media (max-width: 768px) {{
-            .gallery {{
-                grid-template-columns: repeat(auto-fill, minmax(150px, 1fr));
-                gap: 10px;
-            }}
-            .container {{
-                padding: 15px;
-            }}
-        }}
-    </style>
-</head>
-<body>
-    <div class="container">
-        <h1>📁 {dir_name}</h1>
-        <div class="info">共 {len(uploaded_files)} 张图片</div>
-        <div class="gallery">
-"""
-        
-        # 添加每张图片
-        for file_info in uploaded_files:
-            filename = os.path.basename(file_info['local_path'])
-            # URL编码，保留协议和域名部分的特殊字符
-            url = file_info['url']
-            # 对URL中的路径部分进行编码（保留协议和斜杠）
-            if '://' in url:
-                protocol_end = url.index('://') + 3
-                domain_end = url.index('/', protocol_end)
-                protocol_domain = url[:domain_end]
-                path = url[domain_end:]
-                # 编码路径部分，但保留斜杠
-                encoded_path = quote(path, safe='/')
-                encoded_url = protocol_domain + encoded_path
-            else:
-                encoded_url = quote(url, safe=':/')
-            
-            html_content += f"""
-            <div class="image-item" onclick="openLightbox('{encoded_url}')">
-                <img src="{encoded_url}" alt="{filename}" loading="lazy">
-                <div class="image-name">{filename}</div>
-            </div>
-"""
-        
-        html_content += """
-        </div>
-    </div>
-    
-    <div class="lightbox" id="lightbox" onclick="closeLightbox()">
-        <span class="lightbox-close">&times;</span>
-        <img id="lightbox-img" src="" alt="">
-    </div>
-    
-    <script>
-        function openLightbox(url) {
-            document.getElementById('lightbox').classList.add('active');
-            document.getElementById('lightbox-img').src = url;
-        }
-        
-        function closeLightbox() {
-            document.getElementById('lightbox').classList.remove('active');
-        }
-        
-        document.addEventListener('keydown', function(e) {
-            if (e.key === 'Escape') {
-                closeLightbox();
-            }
-        });
-    </script>
-</body>
-</html>
-"""
-        
-        # 保存HTML文件
-        index_path = os.path.join(directory, 'index.html')
-        try:
-            with open(index_path, 'w', encoding='utf-8') as f:
-                f.write(html_content)
-            return index_path
-        except Exception as e:
-            self.log(f"  生成index.html失败: {str(e)}")
+        except ValueError:
+            messagebox.showerror("错误", "自定义尺寸必须是数字")
             return None
     
-    def upload_directory_to_oss(self, directory, root_dir=None):
-        """
-        上传目录到OSS
-        
-        Args:
-            directory: 目录路径
-            root_dir: 根目录路径（用于构建完整路径结构）
-            
-        Returns:
-            (成功, OSS URL前缀)
-        """
-        if not self.oss_uploader:
-            self.log("  OSS未配置，跳过上传")
-            return False, None
-        
-        # 构建OSS路径：包含根目录名称和子目录名称
-        if root_dir:
-            root_name = os.path.basename(root_dir)
-            dir_name = os.path.basename(directory)
-            oss_dir_prefix = f"{root_name}/{dir_name}"
-        else:
-            oss_dir_prefix = os.path.basename(directory)
-            dir_name = oss_dir_prefix
-        
-        def upload_callback(file_path, success, result):
-            if success:
-                self.log(f"    ✓ 已上传: {os.path.basename(file_path)}")
-            else:
-                self.log(f"    ✗ 上传失败: {os.path.basename(file_path)} - {result}")
-        
-        self.log(f"  开始上传图片到OSS...")
-        success_count, fail_count, uploaded_files = self.oss_uploader.upload_directory(
-            directory, oss_dir_prefix, callback=upload_callback
-        )
-        
-        self.log(f"  上传完成: 成功 {success_count} 个, 失败 {fail_count} 个")
-        
-        # 构建OSS URL前缀
-        if uploaded_files:
-            # 生成index.html
-            self.log(f"  生成图片浏览页面...")
-            index_path = self.generate_index_html(directory, uploaded_files, dir_name)
-            
-            if index_path:
-                # 上传index.html到OSS
-                index_oss_path = f"{oss_dir_prefix}/index.html"
-                success, result = self.oss_uploader.upload_file(index_path, index_oss_path)
-                
-                if success:
-                    self.log(f"    ✓ 已上传: index.html")
-                    # 返回index.html的URL
-                    return True, result
-                else:
-                    self.log(f"    ✗ 上传index.html失败: {result}")
-            
-            # 如果index.html上传失败，返回目录URL
-            first_url = uploaded_files[0]['url']
-            oss_url_prefix = first_url.rsplit('/', 1)[0]
-            return True, oss_url_prefix
-        
-        return False, None
-    
-    def process_directory(self, directory, page_size, qr_size_mm, x_mm, y_mm, auto_upload=False, root_dir=None):
-        """
-        处理单个目录：上传图片、生成二维码和PDF
-        
-        Args:
-            directory: 目标目录路径
-            page_size: PDF页面尺寸
-            qr_size_mm: 二维码大小
-            x_mm: 二维码X坐标
-            y_mm: 二维码Y坐标
-            auto_upload: 是否自动上传
-            root_dir: 根目录路径（用于构建OSS路径）
-        """
-        dir_name = os.path.basename(directory)
-        self.log(f"处理目录: {dir_name}")
-        
-        # 检查目录中是否有图片
-        images = self.get_images_in_directory(directory)
-        if not images:
-            self.log(f"  跳过（无图片）: {dir_name}")
-            return
-        
-        self.log(f"  找到 {len(images)} 张图片")
-        
-        # 如果启用自动上传，先上传图片到OSS
-        oss_url = None
-        if auto_upload:
-            success, oss_url = self.upload_directory_to_oss(directory, root_dir)
-            if not success:
-                self.log(f"  警告：上传失败，将使用默认URL生成二维码")
-        
-        # 如果没有OSS URL，使用默认格式
-        if not oss_url:
-            # 构建默认OSS URL
-            if self.oss_config.is_valid():
-                endpoint_without_protocol = self.oss_config.endpoint.replace('http://', '').replace('https://', '')
-                
-                # 构建OSS路径（与upload_directory_to_oss保持一致）
-                if root_dir:
-                    root_name = os.path.basename(root_dir)
-                    # 计算相对路径
-                    if directory.startswith(root_dir):
-                        rel_path = os.path.relpath(directory, root_dir)
-                        if rel_path == '.':
-                            # directory就是root_dir，只使用root_name
-                            oss_path = root_name
-                        else:
-                            # directory是root_dir的子目录
-                            oss_path = f"{root_name}/{rel_path}"
-                    else:
-                        # 不在root_dir下，使用directory的basename
-                        oss_path = dir_name
-                else:
-                    # 没有root_dir，只使用dir_name
-                    oss_path = dir_name
-                
-                # URL编码路径
-                encoded_path = quote(oss_path, safe='')
-                
-                # 构建完整URL
-                if self.oss_config.base_path:
-                    encoded_base = quote(self.oss_config.base_path.strip('/'), safe='')
-                    oss_url = f"https://{self.oss_config.bucket_name}.{endpoint_without_protocol}/{encoded_base}/{encoded_path}/index.html"
-                else:
-                    oss_url = f"https://{self.oss_config.bucket_name}.{endpoint_without_protocol}/{encoded_path}/index.html"
-            else:
-                oss_url = f"https://your-bucket.oss-region.aliyuncs.com/{quote(dir_name, safe='')}/index.html"
-        
-        # 对URL进行编码（如果包含中文字符）
-        # 注意：只编码路径部分，不编码协议和域名
-        if oss_url and '://' in oss_url:
-            protocol, rest = oss_url.split('://', 1)
-            if '/' in rest:
-                domain, path = rest.split('/', 1)
-                # 对路径进行URL编码，但保留斜杠
-                encoded_path = quote(path, safe='/')
-                oss_url = f"{protocol}://{domain}/{encoded_path}"
-        
-        # 生成二维码
-        qr_filename = f"{dir_name}_qr.png"
-        qr_path = os.path.join(directory, qr_filename)
-        
-        if self.generate_qrcode(oss_url, qr_path, qr_size_mm):
-            self.log(f"  二维码已生成: {qr_filename}")
-            self.log(f"  二维码URL: {oss_url}")
-        else:
-            self.log(f"  二维码生成失败")
-            return
-        
-        # 生成PDF
-        pdf_filename = f"{dir_name}_qr.pdf"
-        pdf_path = os.path.join(directory, pdf_filename)
-        
-        if self.create_pdf_with_qrcode(qr_path, pdf_path, page_size, qr_size_mm, x_mm, y_mm):
-            self.log(f"  PDF已生成: {pdf_filename}")
-        else:
-            self.log(f"  PDF生成失败")
+    def cancel_run(self):
+        """取消当前运行：进行中的文件上传完成后停止，下次运行时从中断处继续"""
+        self.cancel_button.config(state='disabled')
+        self.progress_var.set("正在取消...")
+        self.processor.cancel()
     
     def start_processing(self):
         """开始处理"""
@@ -847,6 +643,13 @@ class DocumentProcessorApp:
             return
         
         auto_upload = self.auto_upload_var.get()
+        incremental = self.incremental_var.get()
+        self.processor.qr_vector = self.qr_vector_var.get()
+        self.processor.derivatives = self.derivatives_var.get()
+        self.processor.skip_existing = self.skip_existing_var.get()
+        self.processor.normalize = self.normalize_var.get()
+        self.processor.dedup = self.dedup_var.get()
+        self.processor.process_pool = self.process_pool_var.get()
         
         if auto_upload and not self.oss_config.is_valid():
             result = messagebox.askyesno("OSS未配置", 
@@ -857,7 +660,8 @@ class DocumentProcessorApp:
         
         # 在新线程中处理，避免阻塞GUI
         thread = threading.Thread(target=self.process_all_directories,
-                                 args=(root_dir, page_size, qr_size_mm, x_mm, y_mm, auto_upload))
+                                 args=(root_dir, page_size, qr_size_mm, x_mm, y_mm, auto_upload, incremental,
+                                       self.BATCH_PDF_LAYOUTS[self.batch_pdf_var.get()]))
         thread.daemon = True
         thread.start()
     
@@ -872,55 +676,86 @@ class DocumentProcessorApp:
             messagebox.showerror("错误", "请选择有效的根目录")
             return
         
-        thread = threading.Thread(target=self.upload_all_directories, args=(root_dir,))
+        self.processor.derivatives = self.derivatives_var.get()
+        self.processor.skip_existing = self.skip_existing_var.get()
+        self.processor.normalize = self.normalize_var.get()
+        self.processor.dedup = self.dedup_var.get()
+        thread = threading.Thread(target=self.upload_all_directories, args=(root_dir, self.incremental_var.get()))
         thread.daemon = True
         thread.start()
     
-    def upload_all_directories(self, root_dir):
-        """仅上传所有目录到OSS"""
+    def retry_failed(self):
+        """只重新上传上次失败的文件"""
+        if not self.oss_config.is_valid():
+            messagebox.showerror("错误", "请先配置OSS")
+            return
+        
+        root_dir = self.root_dir_var.get()
+        if not root_dir or not os.path.isdir(root_dir):
+            messagebox.showerror("错误", "请选择有效的根目录")
+            return
+        
+        self.processor.derivatives = self.derivatives_var.get()
+        self.processor.skip_existing = self.skip_existing_var.get()
+        self.processor.normalize = self.normalize_var.get()
+        self.processor.dedup = self.dedup_var.get()
+        thread = threading.Thread(target=self.retry_failed_uploads, args=(root_dir,))
+        thread.daemon = True
+        thread.start()
+    
+    def show_cancelled(self):
+        """运行被取消后的提示"""
+        self.progress_var.set(f"已取消 · {format_progress(self.processor.progress.snapshot())}")
+        messagebox.showinfo("已取消", "已取消。已完成的目录和文件已记录，\n下次以相同设置运行时将从中断处继续。")
+    
+    def retry_failed_uploads(self, root_dir):
+        """重新上传失败文件（在后台线程中运行）"""
         try:
             self.upload_button.config(state='disabled')
             self.start_button.config(state='disabled')
-            self.progress_bar.start()
-            self.progress_var.set("正在上传...")
-            
-            self.log("=" * 60)
-            self.log("开始上传到OSS...")
-            self.log(f"根目录: {root_dir}")
-            self.log("=" * 60)
+            self.retry_button.config(state='disabled')
+            self.cancel_button.config(state='normal')
+            self.progress_bar['value'] = 0
+            self.progress_var.set("正在重试...")
             
-            dir_type = self.dir_type_var.get()
-            target_dirs = self.get_target_directories(root_dir, dir_type)
+            total_success, total_fail = self.processor.retry_failed_uploads(root_dir)
             
-            self.log(f"找到 {len(target_dirs)} 个目标目录")
-            self.log("")
-            
-            total_success = 0
-            total_fail = 0
+            if self.processor.cancelled:
+                self.progress_var.set(f"已取消 · {format_progress(self.processor.progress.snapshot())}")
+                messagebox.showinfo("已取消", f"重试已取消！\n成功: {total_success}\n失败: {total_fail}")
+                return
+            self.progress_bar['value'] = 100
+            self.progress_var.set(f"重试完成 · {format_progress(self.processor.progress.snapshot())}")
+            messagebox.showinfo("完成", f"重试完成！\n成功: {total_success}\n失败: {total_fail}")
             
-            for target_dir in target_dirs:
-                dir_name = os.path.basename(target_dir)
-                self.log(f"上传目录: {dir_name}")
-                
-                images = self.get_images_in_directory(target_dir)
-                if not images:
-                    self.log(f"  跳过（无图片）")
-                    self.log("")
-                    continue
-                
-                success, oss_url = self.upload_directory_to_oss(target_dir, root_dir)
-                if success:
-                    total_success += 1
-                else:
-                    total_fail += 1
-                
-                self.log("")
+        except Exception as e:
+            self.log(f"重试过程中出错: {str(e)}")
+            messagebox.showerror("错误", f"重试过程中出错: {str(e)}")
+        finally:
+            self.upload_button.config(state='normal')
+            self.start_button.config(state='normal')
+            self.retry_button.config(state='normal')
+            self.cancel_button.config(state='disabled')
+    
+    def upload_all_directories(self, root_dir, incremental=True):
+        """仅上传所有目录到OSS（在后台线程中运行）"""
+        try:
+            self.upload_button.config(state='disabled')
+            self.start_button.config(state='disabled')
+            self.retry_button.config(state='disabled')
+            self.cancel_button.config(state='normal')
+            self.progress_bar['value'] = 0
+            self.progress_var.set("正在上传...")
             
-            self.log("=" * 60)
-            self.log(f"上传完成！成功 {total_success} 个目录，失败 {total_fail} 个")
-            self.log("=" * 60)
+            total_success, total_fail = self.processor.upload_all_directories(
+                root_dir, self.dir_type_var.get(), incremental
+            )
             
-            self.progress_var.set("上传完成")
+            if self.processor.cancelled:
+                self.show_cancelled()
+                return
+            self.progress_bar['value'] = 100
+            self.progress_var.set(f"上传完成 · {format_progress(self.processor.progress.snapshot())}")
             messagebox.showinfo("完成", f"上传完成！\n成功: {total_success}\n失败: {total_fail}")
             
         except Exception as e:
@@ -929,46 +764,31 @@ class DocumentProcessorApp:
         finally:
             self.upload_button.config(state='normal')
             self.start_button.config(state='normal')
-            self.progress_bar.stop()
+            self.retry_button.config(state='normal')
+            self.cancel_button.config(state='disabled')
     
-    def process_all_directories(self, root_dir, page_size, qr_size_mm, x_mm, y_mm, auto_upload):
+    def process_all_directories(self, root_dir, page_size, qr_size_mm, x_mm, y_mm, auto_upload, incremental=True,
+                                batch_layout=None):
         """处理所有目录（在后台线程中运行）"""
         try:
             # 禁用按钮
             self.start_button.config(state='disabled')
             self.upload_button.config(state='disabled')
-            self.progress_bar.start()
+            self.retry_button.config(state='disabled')
+            self.cancel_button.config(state='normal')
+            self.progress_bar['value'] = 0
             self.progress_var.set("正在处理...")
             
-            self.log("=" * 60)
-            self.log("开始处理...")
-            self.log(f"根目录: {root_dir}")
-            self.log(f"目录类型: {self.dir_type_var.get()}")
-            self.log(f"页面尺寸: {self.page_size_var.get()}")
-            self.log(f"二维码大小: {qr_size_mm}mm")
-            self.log(f"二维码位置: ({x_mm}mm, {y_mm}mm)")
-            self.log(f"自动上传: {'是' if auto_upload else '否'}")
-            self.log("=" * 60)
-            
-            # 获取目标目录
-            dir_type = self.dir_type_var.get()
-            target_dirs = self.get_target_directories(root_dir, dir_type)
-            
-            self.log(f"找到 {len(target_dirs)} 个目标目录")
-            self.log("")
-            
-            # 处理每个目录
-            success_count = 0
-            for target_dir in target_dirs:
-                self.process_directory(target_dir, page_size, qr_size_mm, x_mm, y_mm, auto_upload, root_dir)
-                success_count += 1
-                self.log("")
-            
-            self.log("=" * 60)
-            self.log(f"处理完成！共处理 {success_count} 个目录")
-            self.log("=" * 60)
+            success_count, _, _ = self.processor.process_all_directories(
+                root_dir, self.dir_type_var.get(), page_size, qr_size_mm, x_mm, y_mm,
+                auto_upload, incremental, batch_layout
+            )
             
-            self.progress_var.set("处理完成")
+            if self.processor.cancelled:
+                self.show_cancelled()
+                return
+            self.progress_bar['value'] = 100
+            self.progress_var.set(f"处理完成 · {format_progress(self.processor.progress.snapshot())}")
             messagebox.showinfo("完成", f"处理完成！共处理 {success_count} 个目录")
             
         except Exception as e:
@@ -978,13 +798,29 @@ class DocumentProcessorApp:
             # 恢复按钮
             self.start_button.config(state='normal')
             self.upload_button.config(state='normal')
-            self.progress_bar.stop()
+            self.retry_button.config(state='normal')
+            self.cancel_button.config(state='disabled')
 
 
 def main():
     """主函数"""
+    # 打包为exe后，缩略图进程池的子进程需要此调用
+    multiprocessing.freeze_support()
+    startup_timer = StartupTimer()
+    startup_timer.mark('imports')
     root = tk.Tk()
-    app = DocumentProcessorApp(root)
+    app = DocumentProcessorApp(root, startup_timer)
+    
+    if "--startup-time" in sys.argv[1:]:
+        # 启动时间测量模式：后台预热结束后保存各阶段耗时并退出
+        def finish_measurement():
+            if not app.warm_up_done.is_set():
+                root.after(20, finish_measurement)
+                return
+            print(json.dumps(startup_timer.save(), ensure_ascii=False))
+            root.destroy()
+        root.after_idle(finish_measurement)
+    
     root.mainloop()
 
 
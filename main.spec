@@ -7,7 +7,9 @@ a = Analysis(
     pathex=[],
     binaries=[],
     datas=[('oss_helper.py', '.')],
-    hiddenimports=['oss2', 'PIL._tkinter_finder', 'PIL.Image', 'qrcode', 'reportlab'],
+    # oss2、qrcode、PIL和reportlab在第一次使用时或后台预热时才导入，需要显式列出
+    hiddenimports=['oss2', 'PIL._tkinter_finder', 'PIL.Image', 'PIL.ImageOps', 'qrcode', 'reportlab',
+                   'reportlab.pdfgen.canvas', 'reportlab.pdfbase.cidfonts'],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+增量处理清单模块
+在根目录下以JSON Lines格式记录每张图片的大小、修改时间、内容哈希
+以及上传后的OSS对象路径和ETag，同时记录二维码/PDF/index.html的输入指纹，
+再次运行时跳过未发生变化的文件。
+"""
+
+import os
+import json
+import mmap
+import hashlib
+import threading
+
+
+# 不小于该大小的文件通过内存映射计算哈希（不复制到Python对象，计算期间释放GIL，多线程可并行）
+MMAP_MIN_SIZE = 64 * 1024
+
+
+def file_md5(path, chunk_size=1024 * 1024):
+    """
+    计算文件内容的MD5
+
+    Args:
+        path: 文件路径
+        chunk_size: 小文件每次读取的字节数
+
+    Returns:
+        十六进制MD5字符串
+    """
+    md5 = hashlib.md5()
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size >= MMAP_MIN_SIZE:
+            try:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped, memoryview(mapped) as view:
+                    md5.update(view)
+                return md5.hexdigest()
+            except (OSError, ValueError):
+                # 不支持内存映射的文件系统，改为分块读取
+                md5 = hashlib.md5()
+                f.seek(0)
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            md5.update(chunk)
+    return md5.hexdigest()
+
+
+class Manifest:
+    """根目录级别的增量处理清单"""
+
+    FILE_NAME = ".wendang_manifest.jsonl"
+
+    def __init__(self, root_dir, file_name=None):
+        """
+        Args:
+            root_dir: 根目录路径，清单文件保存在该目录下
+            file_name: 清单文件名，默认 FILE_NAME
+        """
+        self.root_dir = os.path.abspath(root_dir)
+        self.path = os.path.join(self.root_dir, file_name or self.FILE_NAME)
+        self.files = {}
+        self.outputs = {}
+        self._lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        """从文件加载清单（后写入的记录覆盖先写入的记录）"""
+        if not os.path.exists(self.path):
+            return
+
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # 中断写入产生的半行，忽略
+                        continue
+                    if record.get('type') == 'file':
+                        self.files[record['path']] = record
+                    elif record.get('type') == 'output':
+                        self.outputs[record['path']] = record
+        except Exception as e:
+            print(f"加载清单失败: {e}")
+
+    def _key(self, path):
+        """清单中使用相对根目录的路径作为键"""
+        path = os.path.abspath(path)
+        try:
+            rel_path = os.path.relpath(path, self.root_dir)
+        except ValueError:
+            # Windows下不同盘符
+            return path.replace(os.sep, '/')
+        if rel_path.startswith('..'):
+            return path.replace(os.sep, '/')
+        return rel_path.replace(os.sep, '/')
+
+    def _append(self, record):
+        """追加一条记录（调用方需持有锁）"""
+        try:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        except Exception as e:
+            print(f"写入清单失败: {e}")
+
+    def lookup_upload(self, local_path, oss_key, size=None, mtime_ns=None):
+        """
+        查询文件是否已按相同内容上传到相同的OSS对象
+
+        Args:
+            local_path: 本地文件路径
+            oss_key: 完整的OSS对象路径
+            size: 可选，已知的文件大小（例如来自目录扫描），提供时不再stat
+            mtime_ns: 可选，已知的修改时间（纳秒）
+
+        Returns:
+            已上传时返回记录中的URL，否则返回None
+        """
+        key = self._key(local_path)
+        with self._lock:
+            entry = self.files.get(key)
+        if not entry or entry.get('oss_key') != oss_key:
+            return None
+
+        if size is None or mtime_ns is None:
+            try:
+                stat = os.stat(local_path)
+            except OSError:
+                return None
+            size, mtime_ns = stat.st_size, stat.st_mtime_ns
+
+        if size != entry.get('size'):
+            return None
+        if mtime_ns == entry.get('mtime_ns'):
+            return entry.get('url')
+
+        # 修改时间变化但大小相同：比较内容哈希，内容未变则只更新时间戳
+        try:
+            if file_md5(local_path) != entry.get('md5'):
+                return None
+        except OSError:
+            return None
+
+        updated = dict(entry, mtime_ns=mtime_ns)
+        with self._lock:
+            self.files[key] = updated
+            self._append(updated)
+        return entry.get('url')
+
+    def record_upload(self, local_path, oss_key, etag, url, md5=None):
+        """
+        记录一次成功上传
+
+        Args:
+            local_path: 本地文件路径
+            oss_key: 完整的OSS对象路径
+            etag: OSS返回的ETag
+            url: 访问URL
+            md5: 文件内容MD5，未提供时自动计算
+        """
+        try:
+            stat = os.stat(local_path)
+            if md5 is None:
+                md5 = file_md5(local_path)
+        except OSError:
+            return
+
+        record = {
+            'type': 'file',
+            'path': self._key(local_path),
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'md5': md5,
+            'oss_key': oss_key,
+            'etag': etag,
+            'url': url,
+        }
+        with self._lock:
+            self.files[record['path']] = record
+            self._append(record)
+
+    def uploaded_files(self):
+        """已记录上传的文件（清单记录的副本）"""
+        with self._lock:
+            return list(self.files.values())
+
+    @staticmethod
+    def fingerprint(*parts):
+        """根据生成参数计算输入指纹"""
+        data = json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str)
+        return hashlib.md5(data.encode('utf-8')).hexdigest()
+
+    def is_output_current(self, output_path, fingerprint):
+        """
+        判断生成文件是否存在且由相同的输入生成
+
+        Args:
+            output_path: 生成文件路径（二维码、PDF、index.html）
+            fingerprint: 本次生成的输入指纹
+        """
+        if not os.path.exists(output_path):
+            return False
+        with self._lock:
+            entry = self.outputs.get(self._key(output_path))
+        return bool(entry) and entry.get('fingerprint') == fingerprint
+
+    def record_output(self, output_path, fingerprint):
+        """记录生成文件的输入指纹"""
+        record = {
+            'type': 'output',
+            'path': self._key(output_path),
+            'fingerprint': fingerprint,
+        }
+        with self._lock:
+            self.outputs[record['path']] = record
+            self._append(record)
+
+    def compact(self):
+        """重写清单文件，去掉被覆盖的旧记录"""
+        with self._lock:
+            tmp_path = self.path + ".tmp"
+            try:
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    for record in list(self.files.values()) + list(self.outputs.values()):
+                        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                os.replace(tmp_path, self.path)
+            except Exception as e:
+                print(f"压缩清单失败: {e}")
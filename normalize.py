@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+上传前图片压缩模块
+扫描仪直接输出的PNG/TIFF/JPG往往有数MB，上传前统一处理：
+- 按 EXIF 方向信息旋转
+- 长边超过上限时缩小，转换为指定质量的 JPEG/WebP（灰度扫描件保持灰度）
+- 不保留 EXIF/XMP 等元数据（保留ICC色彩配置）
+- 压缩后不比原图小时直接上传原图
+结果按“内容MD5 + 压缩参数”缓存在目录下的 .normalized 中，同一内容只处理一次。
+"""
+
+import os
+import json
+import hashlib
+from scanner import ImageFile
+from manifest import file_md5
+from derivatives import FORMATS
+
+
+# 压缩结果保存在目录下的隐藏子目录中，不会被当作原始图片扫描
+NORMALIZED_DIR = ".normalized"
+INDEX_FILE = "index.json"
+
+# 默认参数：JPEG质量、长边像素上限（A4 300dpi 扫描件的长边约3508像素，0为不缩小）
+DEFAULT_FORMAT = 'jpeg'
+DEFAULT_QUALITY = 85
+DEFAULT_MAX_DIMENSION = 3500
+
+# 处理的图片类型（GIF可能是动图，不处理）
+NORMALIZE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff', '.webp'}
+
+# 处理逻辑变化时修改版本号，使旧的缓存失效
+NORMALIZE_VERSION = 1
+
+
+def normalize_image(src_path, output_path, fmt=DEFAULT_FORMAT, quality=DEFAULT_QUALITY,
+                    max_dimension=DEFAULT_MAX_DIMENSION):
+    """
+    压缩一张图片（在工作进程中执行）
+
+    Args:
+        src_path: 原图路径
+        output_path: 输出路径
+        fmt: 输出格式 webp/jpeg
+        quality: 压缩质量 1-100
+        max_dimension: 长边像素上限，0为不缩小
+
+    Returns:
+        输出文件大小
+    """
+    from PIL import Image, ImageOps
+    pil_format, _ = FORMATS[fmt]
+
+    with Image.open(src_path) as img:
+        # JPEG解码时直接缩小到不小于上限的比例
+        if max_dimension and img.format == 'JPEG' and max(img.size) > max_dimension:
+            scale = max_dimension / max(img.size)
+            img.draft(img.mode, (int(img.width * scale) + 1, int(img.height * scale) + 1))
+        icc_profile = img.info.get('icc_profile')
+        img = ImageOps.exif_transpose(img)
+
+        if img.mode in ('1', 'L', 'I', 'I;16', 'F') or (img.mode == 'P' and not _has_alpha(img)
+                                                         and _is_grayscale_palette(img)):
+            img = img.convert('L')
+        elif fmt == 'webp' and _has_alpha(img):
+            img = img.convert('RGBA')
+        elif _has_alpha(img):
+            # JPEG不支持透明，铺在白色背景上
+            rgba = img.convert('RGBA')
+            img = Image.new('RGB', rgba.size, (255, 255, 255))
+            img.paste(rgba, mask=rgba.getchannel('A'))
+        elif img.mode != 'RGB':
+            img = img.convert('RGB')
+
+        if max_dimension and max(img.size) > max_dimension:
+            img.thumbnail((max_dimension, max_dimension), Image.Resampling.LANCZOS, reducing_gap=2.0)
+
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        tmp_path = output_path + ".tmp"
+        save_options = {'quality': quality, 'optimize': True}
+        if icc_profile:
+            save_options['icc_profile'] = icc_profile
+        if fmt == 'jpeg':
+            save_options['progressive'] = True
+        img.save(tmp_path, format=pil_format, **save_options)
+        os.replace(tmp_path, output_path)
+
+    return os.path.getsize(output_path)
+
+
+def _has_alpha(img):
+    return 'A' in img.getbands() or (img.mode == 'P' and 'transparency' in img.info)
+
+
+def _is_grayscale_palette(img):
+    palette = img.getpalette() or []
+    return all(palette[i] == palette[i + 1] == palette[i + 2] for i in range(0, len(palette) - 2, 3))
+
+
+class ImageNormalizer:
+    """上传前的图片压缩，在进程池中处理，结果按内容哈希缓存"""
+
+    def __init__(self, pool, fmt=DEFAULT_FORMAT, quality=DEFAULT_QUALITY, max_dimension=DEFAULT_MAX_DIMENSION):
+        """
+        Args:
+            pool: CPUPool
+            fmt: 输出格式 webp/jpeg
+            quality: 压缩质量 1-100
+            max_dimension: 长边像素上限，0为不缩小
+        """
+        if fmt not in FORMATS:
+            raise ValueError(f"不支持的图片格式: {fmt}")
+        self.pool = pool
+        self.fmt = fmt
+        self.quality = max(1, min(100, int(quality)))
+        self.max_dimension = max(0, int(max_dimension or 0))
+        settings = f"{NORMALIZE_VERSION}|{fmt}|{self.quality}|{self.max_dimension}"
+        self.settings_key = hashlib.md5(settings.encode('utf-8')).hexdigest()[:8]
+
+    def _load_index(self, cache_dir):
+        """
+        读取缓存索引：
+        files: 原文件名 → [大小, 修改时间纳秒, MD5]，文件未变化时无需重新计算MD5
+        outputs: "MD5-参数" → 是否使用压缩结果（False表示压缩后不比原图小，上传原图）
+        """
+        try:
+            with open(os.path.join(cache_dir, INDEX_FILE), 'r', encoding='utf-8') as f:
+                index = json.load(f)
+            return index.get('files', {}), index.get('outputs', {})
+        except (OSError, ValueError):
+            return {}, {}
+
+    def _save_index(self, cache_dir, files, outputs):
+        """保存缓存索引，并删除不再使用的压缩结果"""
+        os.makedirs(cache_dir, exist_ok=True)
+        for entry in os.scandir(cache_dir):
+            stem, ext = os.path.splitext(entry.name)
+            if ext in ('.jpg', '.webp') and stem not in outputs:
+                try:
+                    os.remove(entry.path)
+                except OSError:
+                    pass
+        index_path = os.path.join(cache_dir, INDEX_FILE)
+        tmp_path = index_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'files': files, 'outputs': outputs}, f, ensure_ascii=False)
+        os.replace(tmp_path, index_path)
+
+    def normalize(self, directory, images, on_error=None):
+        """
+        压缩目录中的图片
+
+        Args:
+            directory: 目录路径
+            images: 图片列表（scanner.ImageFile）
+            on_error: 出错回调 (image, exception)，出错的图片上传原图
+
+        Returns:
+            上传用的图片列表，与images一一对应；使用压缩结果的条目 name 为上传的文件名
+            （扩展名随格式变化），path 指向 .normalized 中的缓存文件
+        """
+        cache_dir = os.path.join(directory, NORMALIZED_DIR)
+        _, ext = FORMATS[self.fmt]
+        files, outputs = self._load_index(cache_dir)
+
+        # 计算内容哈希（大小和修改时间未变化时沿用索引中的值）
+        hashes = {}
+        for image in images:
+            if os.path.splitext(image.name)[1].lower() not in NORMALIZE_EXTENSIONS:
+                continue
+            cached = files.get(image.name)
+            if cached and cached[0] == image.size and cached[1] == image.mtime_ns:
+                hashes[image.name] = cached[2]
+                continue
+            try:
+                hashes[image.name] = file_md5(image.path)
+            except OSError as e:
+                if on_error:
+                    on_error(image, e)
+                continue
+            files[image.name] = [image.size, image.mtime_ns, hashes[image.name]]
+
+        # 同一内容只压缩一次
+        pending = {}
+        for image in images:
+            md5 = hashes.get(image.name)
+            if md5 is None:
+                continue
+            key = f"{md5}-{self.settings_key}"
+            output_path = os.path.join(cache_dir, key + ext)
+            if key in outputs and (not outputs[key] or os.path.exists(output_path)):
+                continue
+            if key not in pending:
+                pending[key] = (image, self.pool.submit(
+                    normalize_image, image.path, output_path, self.fmt, self.quality, self.max_dimension
+                ))
+
+        for key, (image, future) in pending.items():
+            try:
+                output_size = future.result()
+            except Exception as e:
+                if on_error:
+                    on_error(image, e)
+                continue
+            # 压缩后不比原图小时上传原图
+            outputs[key] = output_size < image.size
+            if not outputs[key]:
+                try:
+                    os.remove(os.path.join(cache_dir, key + ext))
+                except OSError:
+                    pass
+
+        # 清理不再使用的缓存记录（图片已删除、内容或压缩参数已变化）
+        names = {image.name for image in images}
+        files = {name: value for name, value in files.items() if name in names}
+        used = {f"{md5}-{self.settings_key}" for md5 in hashes.values()}
+        outputs = {key: value for key, value in outputs.items() if key in used}
+        self._save_index(cache_dir, files, outputs)
+
+        upload_images = []
+        # 已分配给转换后图片的文件名
+        assigned = set()
+        for image in images:
+            md5 = hashes.get(image.name)
+            key = f"{md5}-{self.settings_key}"
+            if md5 is None or not outputs.get(key):
+                upload_images.append(image)
+                continue
+            output_path = os.path.join(cache_dir, key + ext)
+            try:
+                stat = os.stat(output_path)
+            except OSError:
+                upload_images.append(image)
+                continue
+            # 换扩展名后与目录中其他图片或已转换的图片重名时保留原扩展名，例如 scan.png.jpg，
+            # 仍重名时再加序号
+            name = os.path.splitext(image.name)[0] + ext
+            if name != image.name and (name in names or name in assigned):
+                name = image.name + ext
+                counter = 1
+                while name in names or name in assigned:
+                    name = f"{image.name}.{counter}{ext}"
+                    counter += 1
+            assigned.add(name)
+            upload_images.append(ImageFile(name, output_path, stat.st_size, stat.st_mtime_ns))
+        return upload_images
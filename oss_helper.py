@@ -5,8 +5,19 @@ OSS配置和上传模块
 """
 
 import os
+import io
 import json
+import hashlib
+import threading
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from scanner import scan_directory
+from manifest import file_md5
+from retry import RetryPolicy, AdaptiveLimiter, is_throttle_error
+from bandwidth import TokenBucket, ThrottledReader, UploadWindow
+from local_oss import LocalBucket, is_local_endpoint
+from dedup import COPY_MAX_SIZE
+from tracing import span
 
 
 class OSSConfig:
@@ -14,25 +25,76 @@ class OSSConfig:
     
     CONFIG_FILE = "oss_config.json"
     
-    def __init__(self):
+    # 默认并发上传数
+    DEFAULT_UPLOAD_CONCURRENCY = 8
+    # 分片上传默认参数：超过阈值的文件使用分片上传
+    DEFAULT_MULTIPART_THRESHOLD_MB = 10
+    DEFAULT_PART_SIZE_MB = 2
+    DEFAULT_PART_CONCURRENCY = 4
+    DEFAULT_CHECKPOINT_DIR = ".oss_checkpoints"
+    # HTTP连接池大小（0表示按并发上传数自动计算）、连接超时和读取超时（秒）
+    DEFAULT_CONNECTION_POOL_SIZE = 0
+    DEFAULT_CONNECT_TIMEOUT = 10
+    DEFAULT_READ_TIMEOUT = 60
+    # 失败重试：最大重试次数、第一次重试的最大等待时间（秒）
+    DEFAULT_MAX_RETRIES = 3
+    DEFAULT_RETRY_BASE_DELAY = 0.5
+    # 带宽上限（KB/s，0为不限速）；上传时段（如 "22:00-06:00"，空为不限），
+    # 不小于 upload_window_min_mb 的文件只在该时段上传
+    DEFAULT_BANDWIDTH_LIMIT_KB = 0
+    DEFAULT_UPLOAD_WINDOW = ""
+    DEFAULT_UPLOAD_WINDOW_MIN_MB = 0
+    
+    def __init__(self, config_file=None):
+        """
+        Args:
+            config_file: 配置文件路径，默认为当前目录下的 CONFIG_FILE
+        """
+        self.config_file = config_file or self.CONFIG_FILE
         self.access_key_id = ""
         self.access_key_secret = ""
         self.endpoint = ""
         self.bucket_name = ""
         self.base_path = ""
+        self.upload_concurrency = self.DEFAULT_UPLOAD_CONCURRENCY
+        self.multipart_threshold_mb = self.DEFAULT_MULTIPART_THRESHOLD_MB
+        self.part_size_mb = self.DEFAULT_PART_SIZE_MB
+        self.part_concurrency = self.DEFAULT_PART_CONCURRENCY
+        self.checkpoint_dir = self.DEFAULT_CHECKPOINT_DIR
+        self.connection_pool_size = self.DEFAULT_CONNECTION_POOL_SIZE
+        self.connect_timeout = self.DEFAULT_CONNECT_TIMEOUT
+        self.read_timeout = self.DEFAULT_READ_TIMEOUT
+        self.max_retries = self.DEFAULT_MAX_RETRIES
+        self.retry_base_delay = self.DEFAULT_RETRY_BASE_DELAY
+        self.bandwidth_limit_kb = self.DEFAULT_BANDWIDTH_LIMIT_KB
+        self.upload_window = self.DEFAULT_UPLOAD_WINDOW
+        self.upload_window_min_mb = self.DEFAULT_UPLOAD_WINDOW_MIN_MB
         self.load_config()
     
     def load_config(self):
         """从文件加载配置"""
-        if os.path.exists(self.CONFIG_FILE):
+        if os.path.exists(self.config_file):
             try:
-                with open(self.CONFIG_FILE, 'r', encoding='utf-8') as f:
+                with open(self.config_file, 'r', encoding='utf-8') as f:
                     config = json.load(f)
                     self.access_key_id = config.get('access_key_id', '')
                     self.access_key_secret = config.get('access_key_secret', '')
                     self.endpoint = config.get('endpoint', '')
                     self.bucket_name = config.get('bucket_name', '')
                     self.base_path = config.get('base_path', '')
+                    self.upload_concurrency = int(config.get('upload_concurrency', self.DEFAULT_UPLOAD_CONCURRENCY))
+                    self.multipart_threshold_mb = float(config.get('multipart_threshold_mb', self.DEFAULT_MULTIPART_THRESHOLD_MB))
+                    self.part_size_mb = float(config.get('part_size_mb', self.DEFAULT_PART_SIZE_MB))
+                    self.part_concurrency = int(config.get('part_concurrency', self.DEFAULT_PART_CONCURRENCY))
+                    self.checkpoint_dir = config.get('checkpoint_dir', self.DEFAULT_CHECKPOINT_DIR)
+                    self.connection_pool_size = int(config.get('connection_pool_size', self.DEFAULT_CONNECTION_POOL_SIZE))
+                    self.connect_timeout = float(config.get('connect_timeout', self.DEFAULT_CONNECT_TIMEOUT))
+                    self.read_timeout = float(config.get('read_timeout', self.DEFAULT_READ_TIMEOUT))
+                    self.max_retries = int(config.get('max_retries', self.DEFAULT_MAX_RETRIES))
+                    self.retry_base_delay = float(config.get('retry_base_delay', self.DEFAULT_RETRY_BASE_DELAY))
+                    self.bandwidth_limit_kb = float(config.get('bandwidth_limit_kb', self.DEFAULT_BANDWIDTH_LIMIT_KB))
+                    self.upload_window = config.get('upload_window', self.DEFAULT_UPLOAD_WINDOW)
+                    self.upload_window_min_mb = float(config.get('upload_window_min_mb', self.DEFAULT_UPLOAD_WINDOW_MIN_MB))
             except Exception as e:
                 print(f"加载配置失败: {e}")
     
@@ -43,18 +105,53 @@ class OSSConfig:
             'access_key_secret': self.access_key_secret,
             'endpoint': self.endpoint,
             'bucket_name': self.bucket_name,
-            'base_path': self.base_path
+            'base_path': self.base_path,
+            'upload_concurrency': self.upload_concurrency,
+            'multipart_threshold_mb': self.multipart_threshold_mb,
+            'part_size_mb': self.part_size_mb,
+            'part_concurrency': self.part_concurrency,
+            'checkpoint_dir': self.checkpoint_dir,
+            'connection_pool_size': self.connection_pool_size,
+            'connect_timeout': self.connect_timeout,
+            'read_timeout': self.read_timeout,
+            'max_retries': self.max_retries,
+            'retry_base_delay': self.retry_base_delay,
+            'bandwidth_limit_kb': self.bandwidth_limit_kb,
+            'upload_window': self.upload_window,
+            'upload_window_min_mb': self.upload_window_min_mb
         }
         try:
-            with open(self.CONFIG_FILE, 'w', encoding='utf-8') as f:
+            with open(self.config_file, 'w', encoding='utf-8') as f:
                 json.dump(config, f, indent=2, ensure_ascii=False)
             return True
         except Exception as e:
             print(f"保存配置失败: {e}")
             return False
     
+    def get_pool_size(self):
+        """
+        HTTP连接池大小
+        
+        自动模式下按并发上传数的两倍计算（流水线中可能有两个目录同时上传），
+        分片并发较大时再适当增加，最少10个连接。
+        """
+        if self.connection_pool_size > 0:
+            return int(self.connection_pool_size)
+        return max(10, self.upload_concurrency * 2, self.part_concurrency * 2)
+    
+    def get_request_limit(self):
+        """
+        同时进行的OSS请求数上限（自适应并发的初始值）
+        
+        每个上传线程同时只有一个请求，分片上传的大文件再增加分片并发数个请求。
+        与连接池大小分开计算：上限等于实际可能同时进行的请求数，限流时减半能真正降低并发。
+        """
+        return max(1, self.upload_concurrency + self.part_concurrency)
+    
     def is_valid(self):
-        """检查配置是否有效"""
+        """检查配置是否有效（本地模拟器不需要AccessKey）"""
+        if is_local_endpoint(self.endpoint):
+            return bool(self.bucket_name)
         return all([
             self.access_key_id,
             self.access_key_secret,
@@ -64,129 +161,560 @@ class OSSConfig:
     
     def get_oss_url(self, object_name):
         """获取OSS对象的访问URL"""
+        if is_local_endpoint(self.endpoint):
+            # 本地模拟器：对象在本地目录中的路径
+            return f"{self.endpoint.rstrip('/')}/{self.bucket_name}/objects/{object_name}"
         # 移除endpoint中的协议部分
         endpoint_without_protocol = self.endpoint.replace('http://', '').replace('https://', '')
         # 构建URL
         return f"https://{self.bucket_name}.{endpoint_without_protocol}/{object_name}"
 
 
+# 进程内共用的HTTP会话，按连接池大小区分；
+# 多个OSSUploader（每次运行、测试连接）复用已建立的keep-alive连接，省去重复的TLS握手
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def get_shared_session(pool_size):
+    """
+    获取进程内共用的oss2会话（线程安全，requests连接池可被多个上传线程同时使用）
+    
+    Args:
+        pool_size: 连接池大小
+        
+    Returns:
+        oss2.Session
+    """
+    import oss2
+    
+    with _sessions_lock:
+        session = _sessions.get(pool_size)
+        if session is None:
+            session = oss2.Session(pool_size=pool_size)
+            _sessions[pool_size] = session
+        return session
+
+
+class UploadCancelled(Exception):
+    """上传已被取消"""
+    
+    def __init__(self):
+        super().__init__("已取消")
+
+
 class OSSUploader:
     """OSS上传器"""
     
-    def __init__(self, config):
+    def __init__(self, config, bucket=None):
         """
         初始化OSS上传器
         
         Args:
             config: OSSConfig对象
+            bucket: 可选，外部提供的Bucket对象（测试时可传入本地替身）
         """
         self.config = config
-        self.bucket = None
+        self.bucket = bucket
         self.auth = None
         
-        if config.is_valid():
+        # 取消上传：设置后尚未开始的文件和分片不再上传（可由调用方替换为共用的Event）
+        self.cancel_event = threading.Event()
+        
+        # 跨目录去重：由调用方在一次运行期间设置为 dedup.ContentIndex，None为不去重
+        self.content_index = None
+        
+        # 失败重试和自适应并发：所有目录的上传共用，限流时整体降低并发
+        self.retry_policy = RetryPolicy(config.max_retries, config.retry_base_delay)
+        self.limiter = AdaptiveLimiter(config.get_request_limit())
+        
+        # 带宽限制：所有上传线程共用一个令牌桶，普通上传和分片上传都按读取的字节数限速
+        self.throttle = None
+        if config.bandwidth_limit_kb > 0:
+            self.throttle = TokenBucket(config.bandwidth_limit_kb * 1024)
+        
+        # 上传时段：大文件在时段外排队等待
+        self.window = None
+        if config.upload_window:
+            try:
+                self.window = UploadWindow(config.upload_window)
+            except ValueError as e:
+                print(f"上传时段配置无效，已忽略: {e}")
+        
+        if bucket is None and config.is_valid() and is_local_endpoint(config.endpoint):
+            # endpoint 为 file:// 开头的本地路径时使用本地模拟器（离线测试）
+            self.bucket = LocalBucket.from_endpoint(config.endpoint, config.bucket_name)
+        elif bucket is None and config.is_valid():
             try:
                 import oss2
                 self.auth = oss2.Auth(config.access_key_id, config.access_key_secret)
-                self.bucket = oss2.Bucket(self.auth, config.endpoint, config.bucket_name)
+                self.bucket = oss2.Bucket(
+                    self.auth, config.endpoint, config.bucket_name,
+                    session=get_shared_session(config.get_pool_size()),
+                    connect_timeout=(config.connect_timeout, config.read_timeout)
+                )
             except Exception as e:
                 print(f"初始化OSS失败: {e}")
     
-    def upload_file(self, local_path, oss_path, callback=None):
+    def get_full_oss_path(self, oss_path):
+        """拼接基础路径，得到完整的OSS对象路径"""
+        if self.config.base_path:
+            return f"{self.config.base_path.strip('/')}/{oss_path}"
+        return oss_path
+    
+    # 分片大小下限（OSS要求除最后一片外每片不小于100KB）
+    MIN_PART_SIZE = 100 * 1024
+    # 列举OSS对象时每页的数量（OSS上限为1000）
+    LIST_PAGE_SIZE = 1000
+    
+    def _request(self, func, *args):
         """
-        上传单个文件到OSS
+        发起一次OSS请求：受自适应并发限制，网络错误、限流和5xx错误按指数退避重试
+        
+        Args:
+            func: bucket的请求方法
+            
+        Returns:
+            请求结果；重试用完、不可重试或等待重试时被取消（cancel_event）时抛出异常
+        """
+        def attempt():
+            with self.limiter:
+                try:
+                    result = func(*args)
+                except Exception as e:
+                    if is_throttle_error(e):
+                        self.limiter.on_throttle()
+                    raise
+                self.limiter.on_success()
+                return result
+        
+        with span(getattr(func, '__name__', 'request').lstrip('_'), 'oss'):
+            return self.retry_policy.call(attempt, cancel_event=self.cancel_event)
+    
+    def _stream(self, data):
+        """按带宽限制包装上传的数据（bytes或文件对象）；不限速时原样返回"""
+        if self.throttle is None:
+            return data
+        if isinstance(data, bytes):
+            data = io.BytesIO(data)
+        return ThrottledReader(data, self.throttle)
+    
+    def _put_object(self, full_oss_path, local_path):
+        """普通上传；限速时打开文件并以限速的数据流上传"""
+        if self.throttle is None:
+            return self.bucket.put_object_from_file(full_oss_path, local_path)
+        
+        import oss2
+        headers = oss2.utils.set_content_type(oss2.CaseInsensitiveDict(), local_path)
+        with open(local_path, 'rb') as f:
+            return self.bucket.put_object(full_oss_path, self._stream(f), headers=headers)
+    
+    def _copy_object(self, source_key, full_oss_path, etag=None):
+        """
+        服务端复制同一Bucket中的对象，不重新传输数据
+        
+        提供 etag 时以来源对象的ETag为条件（x-oss-copy-source-if-match）：
+        来源对象已被改写为其他内容时OSS拒绝复制（412），由调用方改为上传。
+        """
+        headers = None
+        if etag:
+            headers = {'x-oss-copy-source-if-match': '"%s"' % etag.strip('"')}
+        return self.bucket.copy_object(self.config.bucket_name, source_key, full_oss_path, headers=headers)
+    
+    def _checkpoint_path(self, local_path, full_oss_path):
+        """断点记录文件路径：按本地文件和目标对象区分"""
+        key = f"{os.path.abspath(local_path)}|{self.config.bucket_name}|{full_oss_path}"
+        name = hashlib.md5(key.encode('utf-8')).hexdigest() + ".json"
+        return os.path.join(self.config.checkpoint_dir, name)
+    
+    def _load_checkpoint(self, checkpoint_path, full_oss_path, stat, part_size):
+        """读取断点记录，文件或分片参数变化时视为无效"""
+        if not os.path.exists(checkpoint_path):
+            return None
+        try:
+            with open(checkpoint_path, 'r', encoding='utf-8') as f:
+                checkpoint = json.load(f)
+        except Exception:
+            return None
+        
+        if (checkpoint.get('key') != full_oss_path
+                or checkpoint.get('size') != stat.st_size
+                or checkpoint.get('mtime_ns') != stat.st_mtime_ns
+                or checkpoint.get('part_size') != part_size):
+            # 文件已变化，放弃旧的分片上传任务
+            try:
+                self.bucket.abort_multipart_upload(checkpoint.get('key'), checkpoint.get('upload_id'))
+            except Exception:
+                pass
+            return None
+        
+        # 确认分片上传任务在服务端仍然存在
+        try:
+            self.bucket.list_parts(full_oss_path, checkpoint['upload_id'])
+        except Exception:
+            return None
+        
+        return checkpoint
+    
+    def _save_checkpoint(self, checkpoint_path, checkpoint):
+        """保存断点记录（先写临时文件再替换，避免中断时损坏）"""
+        tmp_path = checkpoint_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(checkpoint, f)
+        os.replace(tmp_path, checkpoint_path)
+    
+    def _multipart_upload(self, local_path, full_oss_path):
+        """
+        分片并发上传，支持断点续传
+        
+        已完成的分片记录在 checkpoint_dir 下，上传中断后再次上传同一文件时
+        只传输未完成的分片。
         
         Args:
             local_path: 本地文件路径
-            oss_path: OSS对象路径
-            callback: 进度回调函数
+            full_oss_path: 完整的OSS对象路径
             
         Returns:
-            (success, url_or_error_message)
+            complete_multipart_upload 的返回结果
+        """
+        from oss2.models import PartInfo
+        
+        stat = os.stat(local_path)
+        part_size = max(self.MIN_PART_SIZE, int(self.config.part_size_mb * 1024 * 1024))
+        part_count = max(1, (stat.st_size + part_size - 1) // part_size)
+        
+        os.makedirs(self.config.checkpoint_dir, exist_ok=True)
+        checkpoint_path = self._checkpoint_path(local_path, full_oss_path)
+        checkpoint = self._load_checkpoint(checkpoint_path, full_oss_path, stat, part_size)
+        
+        if checkpoint is None:
+            upload_id = self._request(self.bucket.init_multipart_upload, full_oss_path).upload_id
+            checkpoint = {
+                'key': full_oss_path,
+                'upload_id': upload_id,
+                'size': stat.st_size,
+                'mtime_ns': stat.st_mtime_ns,
+                'part_size': part_size,
+                'parts': {}
+            }
+            self._save_checkpoint(checkpoint_path, checkpoint)
+        
+        upload_id = checkpoint['upload_id']
+        lock = threading.Lock()
+        
+        def upload_part(part_number):
+            # 取消时停止上传剩余分片，已完成的分片保留在断点记录中
+            if self.cancel_event.is_set():
+                raise UploadCancelled()
+            offset = (part_number - 1) * part_size
+            with open(local_path, 'rb') as f:
+                f.seek(offset)
+                data = f.read(part_size)
+            # 每次重试重新包装数据流，从分片开头读取
+            result = self._request(
+                lambda: self.bucket.upload_part(full_oss_path, upload_id, part_number, self._stream(data))
+            )
+            with lock:
+                checkpoint['parts'][str(part_number)] = result.etag
+                self._save_checkpoint(checkpoint_path, checkpoint)
+        
+        remaining = [n for n in range(1, part_count + 1) if str(n) not in checkpoint['parts']]
+        workers = max(1, min(int(self.config.part_concurrency), len(remaining) or 1))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(upload_part, n) for n in remaining]
+            # 任一分片失败时取消剩余分片并抛出异常，断点记录保留，下次从已完成的分片继续
+            try:
+                for future in futures:
+                    future.result()
+            except Exception:
+                for future in futures:
+                    future.cancel()
+                raise
+        
+        parts = [PartInfo(n, checkpoint['parts'][str(n)]) for n in range(1, part_count + 1)]
+        result = self._request(self.bucket.complete_multipart_upload, full_oss_path, upload_id, parts)
+        
+        try:
+            os.remove(checkpoint_path)
+        except OSError:
+            pass
+        
+        return result
+    
+    def _put_file(self, local_path, oss_path):
+        """
+        上传单个文件，返回 (success, url_or_error_message, etag)
+        
+        超过分片阈值的文件使用分片上传，其余文件直接上传。
         """
         if not self.bucket:
-            return False, "OSS未配置或配置无效"
+            return False, "OSS未配置或配置无效", None
         
         try:
-            # 拼接完整的OSS路径
-            if self.config.base_path:
-                full_oss_path = f"{self.config.base_path.strip('/')}/{oss_path}"
-            else:
-                full_oss_path = oss_path
+            full_oss_path = self.get_full_oss_path(oss_path)
+            
+            size = os.path.getsize(local_path)
+            
+            # 大文件等到上传时段再上传
+            if self.window is not None and size >= self.config.upload_window_min_mb * 1024 * 1024:
+                if not self.window.wait(self.cancel_event):
+                    raise UploadCancelled()
             
             # 上传文件
-            self.bucket.put_object_from_file(full_oss_path, local_path)
+            threshold = self.config.multipart_threshold_mb * 1024 * 1024
+            if threshold > 0 and size >= threshold:
+                result = self._multipart_upload(local_path, full_oss_path)
+            else:
+                result = self._request(self._put_object, full_oss_path, local_path)
             
             # 获取URL
             url = self.config.get_oss_url(full_oss_path)
             
-            if callback:
-                callback(local_path, url)
-            
-            return True, url
+            return True, url, getattr(result, 'etag', None)
         except Exception as e:
-            return False, str(e)
+            return False, str(e), None
     
-    def upload_directory(self, local_dir, oss_dir_prefix, image_extensions=None, callback=None):
+    def list_remote_objects(self, oss_prefix):
         """
-        上传目录中的所有图片文件
+        分页列出OSS前缀下的全部对象，建立内存索引
+        
+        Args:
+            oss_prefix: OSS路径前缀（不含 base_path，例如 "根目录/家庭/"）
+            
+        Returns:
+            {完整对象路径: (大小, ETag)}
+        """
+        index = {}
+        full_prefix = self.get_full_oss_path(oss_prefix)
+        marker = ''
+        while True:
+            result = self._request(self.bucket.list_objects, full_prefix, '', marker, self.LIST_PAGE_SIZE)
+            for obj in result.object_list:
+                index[obj.key] = (obj.size, (obj.etag or '').strip('"').upper())
+            if not result.is_truncated:
+                break
+            marker = result.next_marker
+        return index
+    
+    def _sync_file(self, local_path, oss_path, remote_index=None):
+        """
+        上传单个文件；提供远端索引时，大小和MD5与OSS上已有对象一致的文件直接跳过
+        
+        Returns:
+            (success, url_or_error_message, etag, status, md5)，
+            status 为 skipped（OSS已有相同文件）、changed（内容变化重新上传）、
+            copied（与本次运行中已上传的文件内容相同，服务端复制）或 uploaded（新上传）
+        """
+        if self.cancel_event.is_set():
+            return False, str(UploadCancelled()), None, None, None
+        
+        with span('upload', 'file', file=local_path) as file_span:
+            result = self._compare_and_upload(local_path, oss_path, remote_index)
+            file_span.set(status=result[3])
+            return result
+    
+    def _compare_and_upload(self, local_path, oss_path, remote_index=None):
+        """_sync_file 的实现：与远端索引比较，不同或不存在时上传（或去重复制）"""
+        status = 'uploaded'
+        md5 = None
+        full_oss_path = self.get_full_oss_path(oss_path)
+        if remote_index is not None:
+            remote = remote_index.get(full_oss_path)
+            if remote is not None:
+                status = 'changed'
+                size, etag = remote
+                try:
+                    # 分片上传的ETag不是内容MD5（包含“-”），无法比较，按变化处理
+                    if size == os.path.getsize(local_path) and '-' not in etag:
+                        md5 = file_md5(local_path)
+                        if md5.upper() == etag:
+                            if self.content_index is not None:
+                                self.content_index.add(md5, size, full_oss_path, etag)
+                            return True, self.config.get_oss_url(full_oss_path), etag, 'skipped', md5
+                except OSError as e:
+                    return False, str(e), None, status, None
+        
+        if self.content_index is not None:
+            return self._dedup_file(local_path, oss_path, full_oss_path, status, md5)
+        
+        success, result, etag = self._put_file(local_path, oss_path)
+        return success, result, etag, status, md5
+    
+    def _dedup_file(self, local_path, oss_path, full_oss_path, status, md5=None):
+        """
+        去重上传：相同内容第一次出现时上传，之后的副本从已上传的对象服务端复制
+        
+        Returns:
+            与 _sync_file 相同
+        """
+        index = self.content_index
+        try:
+            stat = os.stat(local_path)
+        except OSError as e:
+            return False, str(e), None, status, None
+        if not 0 < stat.st_size <= COPY_MAX_SIZE:
+            # 空文件没有可节省的流量，超过CopyObject上限的文件无法复制
+            index.forget(full_oss_path)
+            success, result, etag = self._put_file(local_path, oss_path)
+            return success, result, etag, status, md5
+        try:
+            md5 = md5 or index.hash(local_path, stat.st_size, stat.st_mtime_ns)
+        except OSError as e:
+            return False, str(e), None, status, None
+        
+        source, source_etag, owner = index.acquire(md5, stat.st_size, full_oss_path)
+        if source is not None:
+            if self.cancel_event.is_set():
+                return False, str(UploadCancelled()), None, status, md5
+            try:
+                result = self._request(self._copy_object, source, full_oss_path, source_etag)
+                index.record_copy(stat.st_size)
+                return True, self.config.get_oss_url(full_oss_path), getattr(result, 'etag', None), 'copied', md5
+            except Exception:
+                # 来源对象已被删除或内容已变化（ETag不符）：改为上传，之后的副本从本次上传的对象复制
+                success, result, etag = self._put_file(local_path, oss_path)
+                if success:
+                    index.add(md5, stat.st_size, full_oss_path, etag, replace=True)
+                return success, result, etag, status, md5
+        
+        success, result, etag = False, "上传失败", None
+        try:
+            success, result, etag = self._put_file(local_path, oss_path)
+        finally:
+            if owner:
+                index.release(md5, stat.st_size, full_oss_path if success else None, etag)
+        return success, result, etag, status, md5
+    
+    def upload_file(self, local_path, oss_path, callback=None, manifest=None, remote_index=None):
+        """
+        上传单个文件到OSS
+        
+        Args:
+            local_path: 本地文件路径
+            oss_path: OSS对象路径
+            callback: 进度回调函数
+            manifest: 可选，增量处理清单，文件未变化且已上传时直接返回记录的URL
+            remote_index: 可选，list_remote_objects() 的结果，OSS上已有相同文件时跳过上传
+            
+        Returns:
+            (success, url_or_error_message)
+        """
+        if manifest is not None:
+            url = manifest.lookup_upload(local_path, self.get_full_oss_path(oss_path))
+            if url:
+                return True, url
+        
+        success, result, etag, _, md5 = self._sync_file(local_path, oss_path, remote_index)
+        
+        if success and manifest is not None:
+            manifest.record_upload(local_path, self.get_full_oss_path(oss_path), etag, result, md5)
+        
+        if success and callback:
+            callback(local_path, result)
+        
+        return success, result
+    
+    def upload_directory(self, local_dir, oss_dir_prefix, image_extensions=None, callback=None,
+                         concurrency=None, manifest=None, files=None, remote_index=None, source_files=None):
+        """
+        上传目录中的所有图片文件（多线程并发上传）
         
         Args:
             local_dir: 本地目录路径
             oss_dir_prefix: OSS目录前缀
             image_extensions: 图片扩展名集合
-            callback: 进度回调函数 (file_path, success, url_or_error)
+            callback: 进度回调函数 (file_path, success, url_or_error)，在调用线程中按完成顺序触发
+            concurrency: 并发上传数，默认使用配置中的 upload_concurrency
+            manifest: 可选，增量处理清单（Manifest），内容未变化且已上传的文件将被跳过
+            files: 可选，预先扫描好的图片列表（具有 name/path/size/mtime_ns 属性，
+                   例如 scanner.ImageFile），提供时不再读取目录
+            remote_index: 可选，list_remote_objects() 的结果；大小和MD5与OSS上已有对象
+                          一致的文件不再上传
+            source_files: 可选，与 files 一一对应的原始文件（例如压缩前的图片）；提供时
+                          回调函数收到原始文件的路径（多个上传文件可能共用同一个本地缓存文件）
             
         Returns:
-            (成功数量, 失败数量, 文件列表)
+            (成功数量, 失败数量, 文件列表)，文件列表顺序与目录扫描顺序一致；
+            因未变化而跳过的文件计入成功数量，并在文件信息中标记 skipped；
+            每个文件的 status 为 skipped、changed 或 uploaded
         """
-        if image_extensions is None:
-            image_extensions = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.webp'}
+        if concurrency is None:
+            concurrency = self.config.upload_concurrency
+        concurrency = max(1, int(concurrency))
         
         success_count = 0
         fail_count = 0
-        uploaded_files = []
         
-        try:
-            for item in os.listdir(local_dir):
-                item_path = os.path.join(local_dir, item)
-                
-                # 只处理文件，且是图片文件
-                if not os.path.isfile(item_path):
-                    continue
-                
-                _, ext = os.path.splitext(item)
-                if ext.lower() not in image_extensions:
-                    continue
-                
-                # 跳过生成的二维码文件
-                if item.endswith('_qr.png'):
-                    continue
-                
-                # 构建OSS路径
-                oss_path = f"{oss_dir_prefix}/{item}"
-                
-                # 上传文件
-                success, result = self.upload_file(item_path, oss_path)
+        # 未提供扫描结果时读取目录（跳过生成的二维码文件）
+        if files is None:
+            try:
+                files = scan_directory(local_dir, image_extensions=image_extensions)[0].images
+            except Exception as e:
+                if callback:
+                    callback(local_dir, False, str(e))
+                return 0, 0, []
+        
+        # 构建OSS路径
+        tasks = [(f.path, f"{oss_dir_prefix}/{f.name}") for f in files]
+        
+        # 按扫描顺序保存结果，保证返回列表的顺序稳定
+        results = [None] * len(tasks)
+        
+        # 根据清单跳过未变化的文件
+        pending = []
+        for index, (item_path, oss_path) in enumerate(tasks):
+            url = None
+            if manifest is not None:
+                # 扫描时已得到大小和修改时间，清单无需再次stat
+                url = manifest.lookup_upload(item_path, self.get_full_oss_path(oss_path),
+                                             files[index].size, files[index].mtime_ns)
+            if url:
+                success_count += 1
+                results[index] = {
+                    'local_path': item_path,
+                    'oss_path': oss_path,
+                    'url': url,
+                    'skipped': True,
+                    'status': 'skipped'
+                }
+                if callback:
+                    callback(source_files[index].path if source_files else item_path, True, url)
+            else:
+                pending.append(index)
+        
+        with ThreadPoolExecutor(max_workers=min(concurrency, max(1, len(pending)))) as executor:
+            futures = {
+                executor.submit(self._sync_file, *tasks[index], remote_index): index
+                for index in pending
+            }
+            
+            for future in as_completed(futures):
+                index = futures[future]
+                item_path, oss_path = tasks[index]
+                try:
+                    success, result, etag, status, md5 = future.result()
+                except Exception as e:
+                    success, result, etag, status, md5 = False, str(e), None, None, None
                 
                 if success:
                     success_count += 1
-                    uploaded_files.append({
+                    results[index] = {
                         'local_path': item_path,
                         'oss_path': oss_path,
-                        'url': result
-                    })
-                    if callback:
-                        callback(item_path, True, result)
+                        'url': result,
+                        'status': status
+                    }
+                    if status == 'skipped':
+                        results[index]['skipped'] = True
+                    if manifest is not None:
+                        manifest.record_upload(item_path, self.get_full_oss_path(oss_path), etag, result, md5)
                 else:
                     fail_count += 1
-                    if callback:
-                        callback(item_path, False, result)
-        
-        except Exception as e:
-            if callback:
-                callback(local_dir, False, str(e))
+                
+                if callback:
+                    callback(source_files[index].path if source_files else item_path, success, result)
         
+        uploaded_files = [item for item in results if item is not None]
         return success_count, fail_count, uploaded_files
     
     def test_connection(self):
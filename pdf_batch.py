@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+合并PDF模块
+把一次运行中所有目录的二维码写入同一个PDF，便于统一打印：
+- single: 每页一个二维码，位置与单目录PDF相同
+- tile: 按页面大小拼版，每个二维码下方标注目录名
+
+ReportLab画布在保存前把所有页面保留在内存中，因此二维码较多时按数量分成几个文件：
+每写满 codes_per_file 个二维码（在页面边界处）保存当前文件并开始下一个，
+例如 根目录名_qr_all.pdf、根目录名_qr_all_2.pdf。已写满的文件立即落盘，
+内存占用只与单个文件的二维码数量有关，与目录数量无关。
+"""
+
+import os
+import threading
+from reportlab.lib.units import mm
+from qr_render import DEFAULT_ERROR_CORRECTION, draw_qr_vector
+
+
+# 标注使用的中文字体（ReportLab内置CID字体，无需字体文件）
+LABEL_FONT = 'STSong-Light'
+LABEL_FONT_SIZE = 9
+# 标注区域高度（毫米）
+LABEL_HEIGHT_MM = 6
+
+LAYOUTS = ('single', 'tile')
+
+# 每个合并PDF文件最多包含的二维码数量（约占用10MB内存）
+CODES_PER_FILE = 500
+
+
+def _register_label_font():
+    """注册中文标注字体"""
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.cidfonts import UnicodeCIDFont
+    if LABEL_FONT not in pdfmetrics.getRegisteredFontNames():
+        pdfmetrics.registerFont(UnicodeCIDFont(LABEL_FONT))
+
+
+class BatchPDFWriter:
+    """合并PDF写入器"""
+
+    def __init__(self, pdf_path, page_size, qr_size_mm, x_mm=10, y_mm=10, layout='single',
+                 margin_mm=10, gap_mm=8, labels=True, qr_vector=True,
+                 error_correction=DEFAULT_ERROR_CORRECTION, codes_per_file=CODES_PER_FILE):
+        """
+        Args:
+            pdf_path: 输出PDF路径
+            page_size: 页面尺寸（点）
+            qr_size_mm: 二维码大小（毫米）
+            x_mm: single布局下二维码X坐标（毫米）
+            y_mm: single布局下二维码Y坐标（毫米）
+            layout: 布局，single（每页一个）或 tile（拼版）
+            margin_mm: tile布局的页边距（毫米）
+            gap_mm: tile布局中二维码之间的间距（毫米）
+            labels: 是否在二维码下方标注目录名
+            qr_vector: 是否以矢量绘制二维码（否则插入二维码PNG图片）
+            error_correction: 二维码纠错级别
+            codes_per_file: 每个文件最多包含的二维码数量，超过时在页面边界处开始下一个文件
+                            （pdf_path 加 _2、_3 等序号）；0为不拆分
+        """
+        if layout not in LAYOUTS:
+            raise ValueError(f"未知的合并PDF布局: {layout}")
+
+        self.pdf_path = pdf_path
+        self.page_width, self.page_height = page_size
+        self.qr_size = qr_size_mm * mm
+        self.x_pos = x_mm * mm
+        self.y_pos = y_mm * mm
+        self.layout = layout
+        self.margin = margin_mm * mm
+        self.gap = gap_mm * mm
+        self.labels = labels
+        self.qr_vector = qr_vector
+        self.error_correction = error_correction
+        self.page_size = page_size
+
+        if labels:
+            _register_label_font()
+
+        # 拼版网格
+        label_height = LABEL_HEIGHT_MM * mm if labels else 0
+        self.cell_width = self.qr_size + self.gap
+        self.cell_height = self.qr_size + label_height + self.gap
+        self.columns = max(1, int((self.page_width - 2 * self.margin + self.gap) // self.cell_width))
+        self.rows = max(1, int((self.page_height - 2 * self.margin + self.gap) // self.cell_height))
+
+        # 每个文件的页数：按二维码数量换算，至少一页
+        self.pages_per_file = max(1, codes_per_file // self.per_page) if codes_per_file else 0
+        # 已写入的文件路径（按顺序）
+        self.paths = []
+        self.canvas = None
+        self._file_pages = 0
+
+        self.count = 0
+        self.page_count = 0
+        self._slot = 0
+        self._page_open = False
+        self._open_file()
+
+        # 按序号写入：先完成的目录暂存，等待前面的目录
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._next_index = 0
+
+    @property
+    def per_page(self):
+        """每页二维码数量"""
+        return 1 if self.layout == 'single' else self.columns * self.rows
+
+    def part_path(self, number):
+        """第 number 个文件的路径（从1开始，第一个文件即 pdf_path）"""
+        if number == 1:
+            return self.pdf_path
+        stem, ext = os.path.splitext(self.pdf_path)
+        return f"{stem}_{number}{ext}"
+
+    def _open_file(self):
+        """开始下一个文件"""
+        from reportlab.pdfgen import canvas
+        path = self.part_path(len(self.paths) + 1)
+        self.canvas = canvas.Canvas(path, pagesize=self.page_size, pageCompression=1)
+        self.paths.append(path)
+        self._file_pages = 0
+
+    def _end_page(self):
+        """结束当前页；当前文件已写满时保存到磁盘，释放其页面占用的内存"""
+        self.canvas.showPage()
+        self._slot = 0
+        self._page_open = False
+        self._file_pages += 1
+        if self.pages_per_file and self._file_pages >= self.pages_per_file:
+            self.canvas.save()
+            self.canvas = None
+
+    def _draw(self, url, label, qr_image_path):
+        """在当前页的下一个位置绘制二维码"""
+        if self.canvas is None:
+            self._open_file()
+        if self._slot == 0:
+            self._page_open = True
+            self.page_count += 1
+
+        if self.layout == 'single':
+            x, y = self.x_pos, self.y_pos
+        else:
+            column = self._slot % self.columns
+            row = self._slot // self.columns
+            x = self.margin + column * self.cell_width
+            # 从页面顶部开始排列
+            y = self.page_height - self.margin - (row + 1) * self.cell_height + self.gap
+            if self.labels:
+                y += LABEL_HEIGHT_MM * mm
+
+        if self.qr_vector or not qr_image_path:
+            draw_qr_vector(self.canvas, url, x, y, self.qr_size, self.error_correction)
+        else:
+            self.canvas.drawImage(qr_image_path, x, y, width=self.qr_size, height=self.qr_size)
+
+        if self.labels and label:
+            self.canvas.setFont(LABEL_FONT, LABEL_FONT_SIZE)
+            label_y = y - LABEL_HEIGHT_MM * mm + 2 * mm
+            if label_y < 0:
+                label_y = y + self.qr_size + 2 * mm
+            self.canvas.drawCentredString(x + self.qr_size / 2, label_y, label)
+
+        self.count += 1
+        self._slot += 1
+        if self._slot >= self.per_page:
+            # 当前页已满，结束该页
+            self._end_page()
+
+    def _flush_pending(self):
+        """写出已经轮到的暂存条目（调用方需持有锁）"""
+        while self._next_index in self._pending:
+            entry = self._pending.pop(self._next_index)
+            if entry is not None:
+                self._draw(*entry)
+            self._next_index += 1
+
+    def add(self, url, label=None, qr_image_path=None, index=None):
+        """
+        添加一个二维码（线程安全）
+
+        Args:
+            url: 二维码内容
+            label: 标注文字（通常为目录名）
+            qr_image_path: 二维码PNG路径（位图模式使用）
+            index: 可选，条目序号；提供时按序号顺序写入，保证输出稳定
+        """
+        with self._lock:
+            if index is None:
+                self._draw(url, label, qr_image_path)
+            else:
+                self._pending[index] = (url, label, qr_image_path)
+                self._flush_pending()
+
+    def skip(self, index):
+        """标记序号对应的条目不会被添加（例如目录被跳过），使后续条目可以写出"""
+        with self._lock:
+            self._pending[index] = None
+            self._flush_pending()
+
+    def close(self):
+        """
+        写出剩余条目并保存PDF
+
+        Returns:
+            写入的二维码数量
+        """
+        with self._lock:
+            for index in sorted(self._pending):
+                entry = self._pending.pop(index)
+                if entry is not None:
+                    self._draw(*entry)
+            if self.canvas is not None:
+                if self._page_open or self.count == 0:
+                    self.canvas.showPage()
+                self.canvas.save()
+                self.canvas = None
+            # 删除上次运行留下的多余分卷，避免与本次的文件混在一起打印
+            number = len(self.paths) + 1
+            while os.path.exists(self.part_path(number)):
+                try:
+                    os.remove(self.part_path(number))
+                except OSError:
+                    break
+                number += 1
+        return self.count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
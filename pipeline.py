@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+分阶段流水线模块
+每个阶段拥有独立的线程池，目录在各阶段之间独立流动，
+上传阶段占用网络时，二维码/PDF阶段可以同时处理其他目录。
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Stage:
+    """流水线阶段"""
+
+    def __init__(self, name, func, workers=1):
+        """
+        Args:
+            name: 阶段名称
+            func: 处理函数，接收上一阶段的输出，返回交给下一阶段的对象；
+                  返回None表示该条目到此结束（例如目录中没有图片）
+            workers: 该阶段的线程数
+        """
+        self.name = name
+        self.func = func
+        self.workers = max(1, int(workers))
+
+
+class StagedPipeline:
+    """分阶段并行流水线"""
+
+    def __init__(self, stages, max_in_flight=8, on_error=None, on_done=None, should_stop=None):
+        """
+        Args:
+            stages: Stage列表，按执行顺序排列
+            max_in_flight: 同时处于流水线中的最大条目数
+            on_error: 出错回调 (stage_name, item, exception)
+            on_done: 条目结束回调 (input_item, status)，status为 completed/dropped/failed/cancelled，
+                     input_item 为交给第一个阶段的原始条目
+            should_stop: 可选，返回True时停止：不再读取新条目，进行中的条目在当前阶段结束后
+                         以 cancelled 状态结束（计入中途结束数量）
+        """
+        self.stages = list(stages)
+        self.max_in_flight = max(1, int(max_in_flight))
+        self.on_error = on_error
+        self.on_done = on_done
+        self.should_stop = should_stop
+
+    def run(self, items):
+        """
+        运行流水线，阻塞直到所有条目处理完毕
+
+        Args:
+            items: 输入条目的可迭代对象（交给第一个阶段）
+
+        Returns:
+            (完成数量, 中途结束数量, 出错数量)
+        """
+        executors = [
+            ThreadPoolExecutor(max_workers=stage.workers, thread_name_prefix=f"pipeline-{stage.name}")
+            for stage in self.stages
+        ]
+        slots = threading.BoundedSemaphore(self.max_in_flight)
+        condition = threading.Condition()
+        counters = {'pending': 0, 'completed': 0, 'dropped': 0, 'failed': 0}
+
+        def stopping():
+            return self.should_stop is not None and self.should_stop()
+
+        def finish(origin, key):
+            if self.on_done:
+                try:
+                    self.on_done(origin, key)
+                except Exception:
+                    pass
+            slots.release()
+            with condition:
+                counters['dropped' if key == 'cancelled' else key] += 1
+                counters['pending'] -= 1
+                condition.notify_all()
+
+        def advance(index, item, origin):
+            if index == len(self.stages):
+                finish(origin, 'completed')
+                return
+            if stopping():
+                finish(origin, 'cancelled')
+                return
+            stage = self.stages[index]
+            future = executors[index].submit(stage.func, item)
+            future.add_done_callback(lambda f: stage_done(index, item, origin, f))
+
+        def stage_done(index, item, origin, future):
+            try:
+                result = future.result()
+            except Exception as e:
+                if self.on_error:
+                    try:
+                        self.on_error(self.stages[index].name, item, e)
+                    except Exception:
+                        pass
+                finish(origin, 'failed')
+                return
+
+            if result is None:
+                finish(origin, 'dropped')
+            else:
+                advance(index + 1, result, origin)
+
+        try:
+            for item in items:
+                slots.acquire()
+                if stopping():
+                    slots.release()
+                    break
+                with condition:
+                    counters['pending'] += 1
+                advance(0, item, item)
+
+            with condition:
+                condition.wait_for(lambda: counters['pending'] == 0)
+        finally:
+            for executor in executors:
+                executor.shutdown(wait=True)
+
+        return counters['completed'], counters['dropped'], counters['failed']
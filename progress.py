@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+处理进度模块
+扫描阶段得到目录数、图片数和总字节数，各阶段（上传、index.html、二维码、PDF）
+完成时向同一个线程安全的 ProgressTracker 报告，由此计算完成百分比、处理速度和剩余时间。
+图形界面定时读取快照显示进度条，命令行可定时输出JSON行。
+"""
+
+import json
+import time
+import threading
+
+
+def format_duration(seconds):
+    """把秒数格式化为 H:MM:SS"""
+    seconds = int(max(0, seconds))
+    return f"{seconds // 3600}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+
+def format_progress(snapshot):
+    """
+    进度快照的简短说明，用于界面显示
+
+    Args:
+        snapshot: ProgressTracker.snapshot() 的结果
+    """
+    parts = [f"{snapshot['percent']:.1f}%",
+             f"目录 {snapshot['directories_done']}/{snapshot['directories_total']}"]
+    if snapshot['files_total']:
+        parts.append(f"图片 {snapshot['files_done']}/{snapshot['files_total']}")
+    if snapshot['bytes_done']:
+        parts.append(f"{snapshot['bytes_per_sec'] / 1024 / 1024:.2f} MB/s")
+        parts.append(f"{snapshot['files_per_sec']:.1f} 张/秒")
+    if snapshot['eta_seconds'] is not None and snapshot['running']:
+        parts.append(f"剩余 {format_duration(snapshot['eta_seconds'])}")
+    parts.append(f"已用 {format_duration(snapshot['elapsed'])}")
+    return " · ".join(parts)
+
+
+class ProgressTracker:
+    """一次运行的进度统计（线程安全）"""
+
+    def __init__(self, clock=time.monotonic):
+        """
+        Args:
+            clock: 时钟函数（测试时可替换）
+        """
+        self.clock = clock
+        self._lock = threading.Lock()
+        self.start(0)
+        self.running = False
+
+    def start(self, directories, files=0, total_bytes=0, stages=(), upload=False):
+        """
+        开始一次运行，重置全部计数
+
+        Args:
+            directories: 目录总数
+            files: 图片总数
+            total_bytes: 图片总字节数
+            stages: 需要统计完成目录数的阶段名，例如 ('upload', 'qrcode', 'pdf')
+            upload: 是否上传图片；上传时完成百分比同时考虑已上传的字节数
+        """
+        with self._lock:
+            self.directories_total = directories
+            self.files_total = files
+            self.bytes_total = total_bytes
+            self.upload = upload
+            self.directories_done = 0
+            self.files_done = 0
+            self.files_failed = 0
+            self.bytes_done = 0
+            self.stages = {name: 0 for name in stages}
+            self.started = self.clock()
+            self.finished = None
+            self.completed = False
+            self.running = True
+
+    def add_file(self, size, success=True):
+        """一张图片上传完成（包括因未变化而跳过的图片）"""
+        with self._lock:
+            self.files_done += 1
+            self.bytes_done += size
+            if not success:
+                self.files_failed += 1
+
+    def stage_done(self, stage):
+        """某个阶段处理完一个目录"""
+        with self._lock:
+            self.stages[stage] = self.stages.get(stage, 0) + 1
+
+    def directory_done(self):
+        """一个目录的全部阶段结束（包括跳过和出错的目录）"""
+        with self._lock:
+            self.directories_done += 1
+
+    def finish(self, completed=True):
+        """
+        运行结束
+
+        Args:
+            completed: 是否全部处理完（被取消时为False，完成比例保持实际值）
+        """
+        with self._lock:
+            self.finished = self.clock()
+            self.completed = completed
+            self.running = False
+
+    def fraction(self):
+        """完成比例 0-1：目录进度；上传时与字节进度取平均"""
+        with self._lock:
+            return self._fraction()
+
+    def _fraction(self):
+        if self.completed:
+            return 1.0
+        parts = []
+        if self.directories_total:
+            parts.append(min(1.0, self.directories_done / self.directories_total))
+        if self.upload and self.bytes_total:
+            parts.append(min(1.0, self.bytes_done / self.bytes_total))
+        return sum(parts) / len(parts) if parts else 0.0
+
+    def snapshot(self):
+        """
+        当前进度
+
+        Returns:
+            字典：percent、elapsed、eta_seconds（未知时为None）、目录/图片/字节的完成数和总数、
+            bytes_per_sec、files_per_sec、各阶段完成的目录数 stages、running
+        """
+        with self._lock:
+            now = self.finished if self.finished is not None else self.clock()
+            elapsed = max(0.0, now - self.started)
+            fraction = self._fraction()
+            eta = None
+            if self.running and 0 < fraction < 1:
+                eta = elapsed * (1 - fraction) / fraction
+            elif fraction >= 1:
+                eta = 0.0
+            return {
+                'percent': round(fraction * 100, 2),
+                'elapsed': round(elapsed, 3),
+                'eta_seconds': round(eta, 1) if eta is not None else None,
+                'directories_done': self.directories_done,
+                'directories_total': self.directories_total,
+                'files_done': self.files_done,
+                'files_failed': self.files_failed,
+                'files_total': self.files_total,
+                'bytes_done': self.bytes_done,
+                'bytes_total': self.bytes_total,
+                'bytes_per_sec': round(self.bytes_done / elapsed, 1) if elapsed > 0 else 0.0,
+                'files_per_sec': round(self.files_done / elapsed, 2) if elapsed > 0 else 0.0,
+                'stages': dict(self.stages),
+                'running': self.running,
+            }
+
+
+class ProgressReporter:
+    """后台线程，定时把进度快照以JSON行输出（无界面运行时使用）"""
+
+    def __init__(self, tracker, write, interval=5.0):
+        """
+        Args:
+            tracker: ProgressTracker
+            write: 输出函数，接收一行文本（不含换行）
+            interval: 输出间隔（秒）
+        """
+        self.tracker = tracker
+        self.write = write
+        self.interval = max(0.1, float(interval))
+        self._stop = threading.Event()
+        self._thread = None
+
+    def emit(self):
+        """输出一行当前进度"""
+        self.write(json.dumps(self.tracker.snapshot(), ensure_ascii=False))
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.emit()
+
+    def stop(self):
+        """停止输出，并输出最后一行"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.emit()
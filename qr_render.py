@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+二维码渲染模块
+- 二维码矩阵和PNG渲染结果按 (URL, 纠错级别, 尺寸) 缓存在内存中，重复渲染不再计算
+- 支持把二维码矩阵直接以矢量矩形绘制到PDF中，无需中间PNG和缩放
+"""
+
+import io
+from functools import lru_cache
+
+
+# 纠错级别（取值与 qrcode.constants 相同；qrcode和PIL在第一次渲染时才导入，加快程序启动）
+ERROR_CORRECTION_LEVELS = {
+    'L': 1,
+    'M': 0,
+    'Q': 3,
+    'H': 2,
+}
+DEFAULT_ERROR_CORRECTION = 'H'
+
+# 缓存条目上限：同一目录的二维码图片、单目录PDF和合并PDF在短时间内先后使用同一URL，
+# 只需覆盖流水线中同时处理的目录；合并PDF一次写入几千个目录时缓存不随目录数增长
+CACHE_SIZE = 256
+
+
+def _make_qr(url, error_correction):
+    """构建二维码对象"""
+    import qrcode
+    qr = qrcode.QRCode(
+        version=1,
+        error_correction=ERROR_CORRECTION_LEVELS[error_correction],
+        box_size=10,
+        border=4,
+    )
+    qr.add_data(url)
+    qr.make(fit=True)
+    return qr
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def get_qr_matrix(url, error_correction=DEFAULT_ERROR_CORRECTION):
+    """
+    获取二维码模块矩阵（包含静区）
+
+    Args:
+        url: 二维码内容
+        error_correction: 纠错级别 L/M/Q/H
+
+    Returns:
+        由布尔值元组组成的元组，True表示黑色模块
+    """
+    qr = _make_qr(url, error_correction)
+    return tuple(tuple(row) for row in qr.get_matrix())
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def render_qr_png(url, size_px, error_correction=DEFAULT_ERROR_CORRECTION):
+    """
+    渲染指定像素尺寸的二维码PNG
+
+    Args:
+        url: 二维码内容
+        size_px: 输出边长（像素）
+        error_correction: 纠错级别 L/M/Q/H
+
+    Returns:
+        PNG文件内容（bytes）
+    """
+    from PIL import Image
+    qr = _make_qr(url, error_correction)
+    img = qr.make_image(fill_color="black", back_color="white")
+    img = img.resize((size_px, size_px), Image.Resampling.LANCZOS)
+
+    buffer = io.BytesIO()
+    img.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def draw_qr_vector(c, url, x, y, size, error_correction=DEFAULT_ERROR_CORRECTION):
+    """
+    在ReportLab画布上以矢量矩形绘制二维码
+
+    同一行中相邻的黑色模块合并为一个矩形，减少PDF中的绘图指令。
+
+    Args:
+        c: reportlab canvas对象
+        url: 二维码内容
+        x: 左下角X坐标（点）
+        y: 左下角Y坐标（点）
+        size: 二维码边长（点，包含静区）
+        error_correction: 纠错级别 L/M/Q/H
+    """
+    matrix = get_qr_matrix(url, error_correction)
+    count = len(matrix)
+    module = size / count
+
+    c.saveState()
+
+    # 白色底（静区）
+    c.setFillColorRGB(1, 1, 1)
+    c.rect(x, y, size, size, stroke=0, fill=1)
+
+    c.setFillColorRGB(0, 0, 0)
+    path = c.beginPath()
+    for row_index, row in enumerate(matrix):
+        # PDF坐标原点在左下角，矩阵第一行在最上方
+        row_y = y + (count - row_index - 1) * module
+        col = 0
+        while col < count:
+            if not row[col]:
+                col += 1
+                continue
+            start = col
+            while col < count and row[col]:
+                col += 1
+            path.rect(x + start * module, row_y, (col - start) * module, module)
+    c.drawPath(path, stroke=0, fill=1)
+
+    c.restoreState()
+
+
+def clear_cache():
+    """清空渲染缓存"""
+    get_qr_matrix.cache_clear()
+    render_qr_png.cache_clear()
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+上传重试与自适应并发模块
+- 网络错误、限流和服务端5xx错误按指数退避（带随机抖动）重试
+- 出现限流/5xx时把同时进行的请求数减半，持续成功后逐步恢复
+"""
+
+import random
+import threading
+import time
+
+
+# 视为限流的错误码
+THROTTLE_CODES = {'Throttling', 'SlowDown', 'RequestTimeout', 'ServiceUnavailable'}
+
+
+def is_throttle_error(error):
+    """是否为限流或服务端错误（需要降低并发）"""
+    status = getattr(error, 'status', None)
+    if not isinstance(status, int):
+        return False
+    return status == 429 or status >= 500 or getattr(error, 'code', None) in THROTTLE_CODES
+
+
+def is_retryable_error(error):
+    """
+    是否值得重试：网络错误（oss2的status为负数）、超时、限流和5xx错误可以重试；
+    权限不足、对象不存在等4xx错误以及本地文件错误重试也不会成功
+    """
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    status = getattr(error, 'status', None)
+    if not isinstance(status, int):
+        return False
+    return status < 0 or is_throttle_error(error)
+
+
+class RetryPolicy:
+    """指数退避重试策略（full jitter）"""
+
+    def __init__(self, max_retries=3, base_delay=0.5, max_delay=30.0, sleep=time.sleep):
+        """
+        Args:
+            max_retries: 首次请求失败后的最大重试次数
+            base_delay: 第一次重试的最大等待时间（秒），之后每次翻倍
+            max_delay: 单次等待时间上限（秒）
+            sleep: 等待函数（测试时可替换）
+        """
+        self.max_retries = max(0, int(max_retries))
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.sleep = sleep
+
+    def delay(self, attempt):
+        """第 attempt 次重试（从0开始）前的等待时间：0 到 base*2^attempt 之间的随机值"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def call(self, func, *args, cancel_event=None, **kwargs):
+        """
+        执行请求，可重试的错误按退避时间等待后重试
+
+        Args:
+            func: 请求函数
+            cancel_event: 可选，取消事件；等待重试期间被设置时立即停止重试（代替 sleep 等待）
+
+        Returns:
+            请求结果；不可重试、重试次数用完或已取消时抛出最后一次的异常
+        """
+        attempt = 0
+        while True:
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable_error(e):
+                    raise
+                error = e
+            delay = self.delay(attempt)
+            if cancel_event is None:
+                self.sleep(delay)
+            elif cancel_event.wait(delay):
+                raise error
+            attempt += 1
+
+
+class AdaptiveLimiter:
+    """
+    自适应并发限制（加性增、乘性减）
+
+    出现限流/5xx时同时进行的请求数减半（冷却时间内只减一次），
+    连续成功 increase_after 次后加一，直到初始上限。
+    """
+
+    def __init__(self, limit, min_limit=1, increase_after=20, cooldown=2.0):
+        """
+        Args:
+            limit: 并发上限
+            min_limit: 并发下限
+            increase_after: 连续成功多少次后并发加一
+            cooldown: 两次减半之间的最短间隔（秒）
+        """
+        self.max_limit = max(1, int(limit))
+        self.min_limit = max(1, min(int(min_limit), self.max_limit))
+        self.limit = self.max_limit
+        self.increase_after = max(1, int(increase_after))
+        self.cooldown = cooldown
+        self.active = 0
+        self.throttle_count = 0
+        self._successes = 0
+        self._last_decrease = 0.0
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        """等待直到可以发起请求"""
+        with self._condition:
+            self._condition.wait_for(lambda: self.active < self.limit)
+            self.active += 1
+
+    def release(self):
+        """请求结束"""
+        with self._condition:
+            self.active -= 1
+            self._condition.notify_all()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+        return False
+
+    def on_success(self):
+        """记录一次成功请求"""
+        with self._condition:
+            self._successes += 1
+            if self._successes >= self.increase_after and self.limit < self.max_limit:
+                self.limit += 1
+                self._successes = 0
+                self._condition.notify_all()
+
+    def on_throttle(self):
+        """记录一次限流/5xx错误，降低并发"""
+        with self._condition:
+            self.throttle_count += 1
+            self._successes = 0
+            now = time.monotonic()
+            if now - self._last_decrease >= self.cooldown:
+                self.limit = max(self.min_limit, self.limit // 2)
+                self._last_decrease = now
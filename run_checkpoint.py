@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+运行断点模块
+长时间运行（整个乡镇的上传）被取消或意外中断后，再次以相同参数运行时从中断处继续：
+- 根目录下的 .wendang_run.jsonl 记录本次运行的参数指纹，以及每个目录已完成的阶段
+  （upload 附带index.html的URL，done 表示全部阶段完成）
+- 已上传的文件和已生成的二维码/PDF记录在清单中；全量处理（不使用增量清单）时，
+  使用只属于本次运行的 .wendang_run_manifest.jsonl，运行完成后删除
+"""
+
+import os
+import json
+import threading
+from manifest import Manifest
+
+
+class RunCheckpoint:
+    """根目录级别的运行断点"""
+
+    FILE_NAME = ".wendang_run.jsonl"
+    MANIFEST_NAME = ".wendang_run_manifest.jsonl"
+
+    def __init__(self, root_dir):
+        """
+        Args:
+            root_dir: 根目录路径，断点文件保存在该目录下
+        """
+        self.root_dir = os.path.abspath(root_dir)
+        self.path = os.path.join(self.root_dir, self.FILE_NAME)
+        self.manifest_path = os.path.join(self.root_dir, self.MANIFEST_NAME)
+        self.fingerprint = None
+        self.directories = {}
+        self._lock = threading.Lock()
+
+    def _load(self):
+        """读取断点文件，返回 (参数指纹, {目录: {阶段: 附加信息}})"""
+        fingerprint = None
+        directories = {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # 中断写入产生的半行，忽略
+                        continue
+                    if record.get('type') == 'run':
+                        fingerprint = record.get('fingerprint')
+                    elif record.get('type') == 'stage':
+                        directories.setdefault(record['path'], {})[record['stage']] = record.get('url')
+        except OSError:
+            pass
+        return fingerprint, directories
+
+    def begin(self, fingerprint, resume=True):
+        """
+        开始一次运行
+
+        Args:
+            fingerprint: 运行参数指纹，参数不同的旧断点不会被沿用
+            resume: 是否从上次中断处继续；False时丢弃旧断点
+
+        Returns:
+            是否从上次中断处继续
+        """
+        with self._lock:
+            old_fingerprint, directories = self._load() if resume else (None, {})
+            self.fingerprint = fingerprint
+            if old_fingerprint == fingerprint:
+                self.directories = directories
+                return True
+
+            self.directories = {}
+            self._remove_files()
+            self._append({'type': 'run', 'fingerprint': fingerprint})
+            return False
+
+    def run_manifest(self):
+        """全量处理时使用的本次运行清单"""
+        return Manifest(self.root_dir, self.MANIFEST_NAME)
+
+    def _key(self, directory):
+        """使用相对根目录的路径作为键"""
+        return os.path.relpath(os.path.abspath(directory), self.root_dir).replace(os.sep, '/')
+
+    def _append(self, record):
+        """追加一条记录（调用方需持有锁）"""
+        try:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        except Exception as e:
+            print(f"写入运行断点失败: {e}")
+
+    def mark(self, directory, stage, url=None):
+        """
+        记录一个目录完成了某个阶段
+
+        Args:
+            directory: 目录路径
+            stage: 阶段名 upload/done
+            url: 可选，二维码使用的URL
+        """
+        key = self._key(directory)
+        with self._lock:
+            self.directories.setdefault(key, {})[stage] = url
+            self._append({'type': 'stage', 'path': key, 'stage': stage, 'url': url})
+
+    def get(self, directory, stage):
+        """
+        目录是否已完成某个阶段
+
+        Returns:
+            (是否完成, 记录的URL)
+        """
+        with self._lock:
+            stages = self.directories.get(self._key(directory), {})
+            return stage in stages, stages.get(stage)
+
+    def completed_count(self):
+        """已完成全部阶段的目录数"""
+        with self._lock:
+            return sum(1 for stages in self.directories.values() if 'done' in stages)
+
+    def _remove_files(self):
+        for path in (self.path, self.manifest_path):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def finish(self):
+        """运行正常结束，删除断点文件和本次运行清单"""
+        with self._lock:
+            self.directories = {}
+            self._remove_files()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+目录扫描模块
+使用 os.scandir 单次遍历目录树，直接利用 DirEntry 缓存的文件类型判断目录/文件，
+只对图片文件读取一次大小和修改时间，生成“目录 → 图片列表”的索引，供上传、
+二维码、PDF等各阶段共用，避免重复 listdir 和逐个 stat。
+"""
+
+import os
+from collections import namedtuple
+
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.webp'}
+
+# 目录类型对应的目标深度（根目录为第0层）；“自动”表示任意深度的最深一级目录
+DIR_TYPE_DEPTHS = {
+    "村": 1,
+    "乡": 2,
+    "自动": None,
+}
+
+# 图片文件：文件名、完整路径、大小（字节）、修改时间（纳秒）
+ImageFile = namedtuple('ImageFile', ['name', 'path', 'size', 'mtime_ns'])
+
+# 目录索引：完整路径、目录名、深度、图片列表、是否包含子目录
+DirectoryIndex = namedtuple('DirectoryIndex', ['path', 'name', 'depth', 'images', 'has_subdirs'])
+
+
+def is_generated_file(name):
+    """是否为程序生成的文件（二维码图片），这类文件不作为原始图片处理"""
+    return name.endswith('_qr.png')
+
+
+def scan_directory(directory, depth=0, image_extensions=None):
+    """
+    扫描单个目录（不递归）
+
+    Args:
+        directory: 目录路径
+        depth: 目录深度，仅用于填充结果
+        image_extensions: 图片扩展名集合，默认 IMAGE_EXTENSIONS
+
+    Returns:
+        (DirectoryIndex, 子目录路径列表)
+    """
+    if image_extensions is None:
+        image_extensions = IMAGE_EXTENSIONS
+
+    images = []
+    subdirs = []
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            try:
+                if entry.is_dir():
+                    if not entry.name.startswith('.'):
+                        subdirs.append(entry.path)
+                    continue
+                if not entry.is_file():
+                    continue
+            except OSError:
+                continue
+
+            _, ext = os.path.splitext(entry.name)
+            if ext.lower() not in image_extensions or is_generated_file(entry.name):
+                continue
+
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            images.append(ImageFile(entry.name, entry.path, stat.st_size, stat.st_mtime_ns))
+
+    index = DirectoryIndex(directory, os.path.basename(directory), depth, images, bool(subdirs))
+    return index, subdirs
+
+
+def scan_tree(root_dir, dir_type="村", image_extensions=None, on_error=None):
+    """
+    遍历目录树，逐个生成目标目录的索引
+
+    Args:
+        root_dir: 根目录路径
+        dir_type: "村"（二级）、"乡"（三级）、"自动"（任意深度的最深一级目录），
+                  也可以直接传入目标深度（整数，根目录为0）
+        image_extensions: 图片扩展名集合
+        on_error: 读取目录出错时的回调 (directory, exception)
+
+    Yields:
+        DirectoryIndex，目标目录按遍历顺序给出
+    """
+    target_depth = dir_type if isinstance(dir_type, int) else DIR_TYPE_DEPTHS[dir_type]
+
+    # 深度优先遍历，保持与 os.listdir 相同的目录顺序
+    stack = [(root_dir, 0)]
+    while stack:
+        directory, depth = stack.pop()
+        try:
+            index, subdirs = scan_directory(directory, depth, image_extensions)
+        except OSError as e:
+            if on_error:
+                on_error(directory, e)
+            continue
+
+        if depth > 0:
+            if target_depth is not None and depth == target_depth:
+                yield index
+                continue
+            if target_depth is None and not subdirs:
+                yield index
+                continue
+
+        for subdir in reversed(subdirs):
+            stack.append((subdir, depth + 1))
+
+
+def scan_directories(root_dir, dir_type="村", image_extensions=None, on_error=None):
+    """
+    扫描目录树，返回目标目录索引列表
+
+    Returns:
+        DirectoryIndex列表
+    """
+    return list(scan_tree(root_dir, dir_type, image_extensions, on_error))
+
+
+def count_images(indexes):
+    """
+    统计索引中的图片数量和总字节数
+
+    Returns:
+        (图片数量, 总字节数)
+    """
+    total_files = 0
+    total_bytes = 0
+    for index in indexes:
+        total_files += len(index.images)
+        total_bytes += sum(image.size for image in index.images)
+    return total_files, total_bytes
@@ -6,12 +6,172 @@
 
 import os
 import sys
+import shutil
+import tempfile
+import threading
+import time
+import hashlib
+from types import SimpleNamespace
 
 # 添加项目根目录到路径
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from main import DocumentProcessorApp
-import tkinter as tk
+from engine import DocumentProcessor
+from oss_helper import OSSConfig, OSSUploader
+from pipeline import Stage, StagedPipeline
+from manifest import Manifest
+from dead_letter import DeadLetterList
+from log_sink import LogSink
+from dedup import ContentIndex
+import qr_render
+from pdf_batch import BatchPDFWriter
+import cli
+import scanner
+import benchmark
+import derivatives
+import gallery
+import bandwidth
+import normalize
+import progress
+
+
+class FakeBucket:
+    """本地替身Bucket：模拟put_object_from_file并注入延迟"""
+    
+    def __init__(self, latency=0.05):
+        self.latency = latency
+        self.objects = {}
+        self.active = 0
+        self.max_active = 0
+        self.put_count = 0
+        self.uploads = {}
+        self.uploaded_parts = []
+        self.fail_parts = set()
+        self.list_count = 0
+        self.put_errors = {}
+        self.copy_count = 0
+        # 分片上传的对象的ETag（“哈希-分片数”），普通对象的ETag为内容MD5
+        self.etags = {}
+        self._lock = threading.Lock()
+    
+    def put_object_from_file(self, key, filename):
+        with self._lock:
+            errors = self.put_errors.get(key)
+            if errors:
+                self.put_count += 1
+                raise errors.pop(0)
+            self.active += 1
+            self.put_count += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            time.sleep(self.latency)
+            with open(filename, 'rb') as f:
+                self.objects[key] = f.read()
+            self.etags.pop(key, None)
+            return SimpleNamespace(etag=hashlib.md5(self.objects[key]).hexdigest().upper())
+        finally:
+            with self._lock:
+                self.active -= 1
+    
+    def put_object(self, key, data, headers=None):
+        with self._lock:
+            self.put_count += 1
+        self.objects[key] = data.read()
+        self.etags.pop(key, None)
+        return SimpleNamespace(etag=hashlib.md5(self.objects[key]).hexdigest().upper())
+    
+    def copy_object(self, source_bucket_name, source_key, target_key, headers=None):
+        with self._lock:
+            if_match = (headers or {}).get('x-oss-copy-source-if-match')
+            if if_match is not None and if_match.strip('"') != self._etag(source_key):
+                raise Exception("412 PreconditionFailed")
+            self.copy_count += 1
+            self.objects[target_key] = self.objects[source_key]
+            self.etags.pop(target_key, None)
+            if source_key in self.etags:
+                self.etags[target_key] = self.etags[source_key]
+        return SimpleNamespace(etag=self._etag(target_key))
+    
+    def init_multipart_upload(self, key):
+        with self._lock:
+            upload_id = f"upload-{len(self.uploads) + 1}"
+            self.uploads[upload_id] = {}
+        return SimpleNamespace(upload_id=upload_id)
+    
+    def upload_part(self, key, upload_id, part_number, data):
+        if part_number in self.fail_parts:
+            self.fail_parts.discard(part_number)
+            raise IOError(f"分片 {part_number} 连接中断")
+        if hasattr(data, 'read'):
+            data = data.read()
+        with self._lock:
+            self.uploaded_parts.append(part_number)
+            self.uploads[upload_id][part_number] = bytes(data)
+        return SimpleNamespace(etag=hashlib.md5(data).hexdigest().upper())
+    
+    def list_parts(self, key, upload_id):
+        if upload_id not in self.uploads:
+            raise KeyError(upload_id)
+        return SimpleNamespace(parts=sorted(self.uploads[upload_id]))
+    
+    def complete_multipart_upload(self, key, upload_id, parts):
+        chunks = self.uploads.pop(upload_id)
+        self.objects[key] = b"".join(chunks[p.part_number] for p in parts)
+        self.etags[key] = f"MULTIPART-{len(parts)}"
+        return SimpleNamespace(etag=self.etags[key])
+    
+    def _etag(self, key):
+        if key in self.etags:
+            return self.etags[key]
+        data = self.objects[key]
+        return hashlib.md5(data).hexdigest().upper()
+    
+    def list_objects(self, prefix='', delimiter='', marker='', max_keys=100):
+        with self._lock:
+            self.list_count += 1
+            keys = sorted(k for k in self.objects if k.startswith(prefix) and k > marker)
+        page = keys[:max_keys]
+        return SimpleNamespace(
+            object_list=[SimpleNamespace(key=k, size=len(self.objects[k]), etag=f'"{self._etag(k)}"') for k in page],
+            is_truncated=len(keys) > max_keys,
+            next_marker=page[-1] if page else ''
+        )
+    
+    def abort_multipart_upload(self, key, upload_id):
+        self.uploads.pop(upload_id, None)
+
+
+def make_fake_config():
+    """构造一个不读取本地配置文件的OSS配置"""
+    config = OSSConfig.__new__(OSSConfig)
+    config.access_key_id = "test"
+    config.access_key_secret = "test"
+    config.endpoint = "oss-cn-beijing.aliyuncs.com"
+    config.bucket_name = "test-bucket"
+    config.base_path = ""
+    config.upload_concurrency = 4
+    config.multipart_threshold_mb = OSSConfig.DEFAULT_MULTIPART_THRESHOLD_MB
+    config.part_size_mb = OSSConfig.DEFAULT_PART_SIZE_MB
+    config.part_concurrency = OSSConfig.DEFAULT_PART_CONCURRENCY
+    config.checkpoint_dir = os.path.join(tempfile.gettempdir(), "oss_checkpoints_test")
+    config.connection_pool_size = OSSConfig.DEFAULT_CONNECTION_POOL_SIZE
+    config.connect_timeout = OSSConfig.DEFAULT_CONNECT_TIMEOUT
+    config.read_timeout = OSSConfig.DEFAULT_READ_TIMEOUT
+    config.max_retries = OSSConfig.DEFAULT_MAX_RETRIES
+    config.retry_base_delay = 0
+    config.bandwidth_limit_kb = 0
+    config.upload_window = ""
+    config.upload_window_min_mb = 0
+    return config
+
+
+class FakeServerError(Exception):
+    """模拟oss2的ServerError：带HTTP状态码和错误码"""
+    
+    def __init__(self, status, code=''):
+        super().__init__(f"HTTP {status} {code}")
+        self.status = status
+        self.code = code
 
 
 def test_basic_functions():
@@ -25,27 +185,19 @@ def test_basic_functions():
     os.makedirs(test_dir, exist_ok=True)
     print(f"✓ 创建测试目录: {test_dir}")
     
-    # 创建应用实例（不显示GUI）
-    root = tk.Tk()
-    root.withdraw()  # 隐藏主窗口
-    app = DocumentProcessorApp(root)
+    # 创建处理引擎（无界面）
+    app = DocumentProcessor(log=print)
     
     # 测试二维码生成
     print("\n测试二维码生成...")
     test_url = "https://example.com/test"
     qr_path = os.path.join(test_dir, "test_qr.png")
     
-    if app.generate_qrcode(test_url, qr_path, 50):
-        if os.path.exists(qr_path):
-            print(f"✓ 二维码生成成功: {qr_path}")
-            file_size = os.path.getsize(qr_path)
-            print(f"  文件大小: {file_size} 字节")
-        else:
-            print("✗ 二维码文件未找到")
-            return False
-    else:
-        print("✗ 二维码生成失败")
-        return False
+    assert app.generate_qrcode(test_url, qr_path, 50), "二维码生成失败"
+    assert os.path.exists(qr_path), "二维码文件未找到"
+    print(f"✓ 二维码生成成功: {qr_path}")
+    file_size = os.path.getsize(qr_path)
+    print(f"  文件大小: {file_size} 字节")
     
     # 测试PDF生成
     print("\n测试PDF生成...")
@@ -53,17 +205,11 @@ def test_basic_functions():
     
     pdf_path = os.path.join(test_dir, "test_qr.pdf")
     
-    if app.create_pdf_with_qrcode(qr_path, pdf_path, A4, 50, 10, 10):
-        if os.path.exists(pdf_path):
-            print(f"✓ PDF生成成功: {pdf_path}")
-            file_size = os.path.getsize(pdf_path)
-            print(f"  文件大小: {file_size} 字节")
-        else:
-            print("✗ PDF文件未找到")
-            return False
-    else:
-        print("✗ PDF生成失败")
-        return False
+    assert app.create_pdf_with_qrcode(qr_path, pdf_path, A4, 50, 10, 10), "PDF生成失败"
+    assert os.path.exists(pdf_path), "PDF文件未找到"
+    print(f"✓ PDF生成成功: {pdf_path}")
+    file_size = os.path.getsize(pdf_path)
+    print(f"  文件大小: {file_size} 字节")
     
     # 测试目录扫描
     print("\n测试目录扫描...")
@@ -87,13 +233,1434 @@ def test_basic_functions():
     print("=" * 60)
     print(f"\n测试文件保存在: {test_dir}")
     print("你可以打开查看生成的二维码和PDF文件")
+
+
+def test_concurrent_upload():
+    """测试并发上传：结果顺序与回调约定"""
+    print("\n测试并发上传...")
+    test_dir = tempfile.mkdtemp()
+    try:
+        names = [f"img{i:02d}.jpg" for i in range(12)]
+        for name in names:
+            with open(os.path.join(test_dir, name), 'wb') as f:
+                f.write(name.encode())
+        # 二维码文件不应上传
+        with open(os.path.join(test_dir, "dir_qr.png"), 'wb') as f:
+            f.write(b"qr")
+        
+        bucket = FakeBucket(latency=0.05)
+        uploader = OSSUploader(make_fake_config(), bucket=bucket)
+        
+        callbacks = []
+        start = time.perf_counter()
+        success_count, fail_count, uploaded_files = uploader.upload_directory(
+            test_dir, "root/dir", callback=lambda path, ok, url: callbacks.append((path, ok))
+        )
+        elapsed = time.perf_counter() - start
+        
+        expected_order = [item for item in os.listdir(test_dir) if item in names]
+        assert success_count == 12 and fail_count == 0
+        assert [os.path.basename(f['local_path']) for f in uploaded_files] == expected_order
+        assert len(callbacks) == 12 and all(ok for _, ok in callbacks)
+        assert "root/dir/dir_qr.png" not in bucket.objects
+        assert bucket.max_active > 1
+        print(f"✓ 并发上传 12 个文件耗时 {elapsed:.2f}s（最大并发 {bucket.max_active}）")
+    finally:
+        shutil.rmtree(test_dir)
+
+
+def test_staged_pipeline():
+    """测试分阶段流水线：并行、最大在途数、跳过与出错"""
+    print("\n测试分阶段流水线...")
+    lock = threading.Lock()
+    state = {'in_flight': 0, 'max_in_flight': 0}
+    finished = []
+    
+    def scan(item):
+        with lock:
+            state['in_flight'] += 1
+            state['max_in_flight'] = max(state['max_in_flight'], state['in_flight'])
+        if item % 5 == 0:
+            with lock:
+                state['in_flight'] -= 1
+            return None
+        return item
+    
+    def upload(item):
+        time.sleep(0.02)
+        if item == 7:
+            with lock:
+                state['in_flight'] -= 1
+            raise RuntimeError("上传失败")
+        return item
+    
+    def render(item):
+        with lock:
+            state['in_flight'] -= 1
+            finished.append(item)
+        return item
+    
+    errors = []
+    pipeline = StagedPipeline([
+        Stage('scan', scan, 2),
+        Stage('upload', upload, 4),
+        Stage('render', render, 1),
+    ], max_in_flight=3, on_error=lambda stage, item, e: errors.append((stage, item)))
+    
+    completed, dropped, failed = pipeline.run(range(20))
+    
+    assert (completed, dropped, failed) == (15, 4, 1)
+    assert errors == [('upload', 7)]
+    assert sorted(finished) == [i for i in range(20) if i % 5 != 0 and i != 7]
+    assert state['max_in_flight'] <= 3
+    print(f"✓ 流水线完成 {completed} 个，跳过 {dropped} 个，出错 {failed} 个")
+
+
+def test_incremental_manifest():
+    """测试增量清单：未变化的文件和生成物在再次运行时被跳过"""
+    print("\n测试增量清单...")
+    test_dir = tempfile.mkdtemp()
+    try:
+        household = os.path.join(test_dir, "家庭1")
+        os.makedirs(household)
+        for i in range(5):
+            with open(os.path.join(household, f"img{i}.jpg"), 'wb') as f:
+                f.write(f"image-{i}".encode())
+        
+        bucket = FakeBucket(latency=0)
+        uploader = OSSUploader(make_fake_config(), bucket=bucket)
+        
+        manifest = Manifest(test_dir)
+        success_count, _, files = uploader.upload_directory(household, "root/家庭1", manifest=manifest)
+        assert success_count == 5 and bucket.put_count == 5
+        assert not any(f.get('skipped') for f in files)
+        manifest.compact()
+        
+        # 重新加载清单，模拟再次运行
+        manifest = Manifest(test_dir)
+        success_count, _, files = uploader.upload_directory(household, "root/家庭1", manifest=manifest)
+        assert success_count == 5 and bucket.put_count == 5
+        assert all(f.get('skipped') for f in files)
+        
+        # 只有内容变化的文件会重新上传
+        with open(os.path.join(household, "img3.jpg"), 'wb') as f:
+            f.write(b"changed")
+        success_count, _, files = uploader.upload_directory(household, "root/家庭1", manifest=manifest)
+        assert bucket.put_count == 6
+        assert [f['local_path'] for f in files if not f.get('skipped')] == [os.path.join(household, "img3.jpg")]
+        
+        # 生成物指纹
+        output_path = os.path.join(household, "家庭1_qr.png")
+        fingerprint = Manifest.fingerprint('qrcode', "https://example.com", 50)
+        assert not manifest.is_output_current(output_path, fingerprint)
+        with open(output_path, 'wb') as f:
+            f.write(b"qr")
+        manifest.record_output(output_path, fingerprint)
+        assert Manifest(test_dir).is_output_current(output_path, fingerprint)
+        assert not manifest.is_output_current(output_path, Manifest.fingerprint('qrcode', "https://example.com", 60))
+        print("✓ 再次运行时未变化的文件全部跳过，仅重新上传变化的文件")
+    finally:
+        shutil.rmtree(test_dir)
+
+
+def test_multipart_resume():
+    """测试分片上传：中断后从已完成的分片继续"""
+    print("\n测试分片断点续传...")
+    test_dir = tempfile.mkdtemp()
+    try:
+        local_path = os.path.join(test_dir, "scan.tiff")
+        data = os.urandom(1024 * 1024)
+        with open(local_path, 'wb') as f:
+            f.write(data)
+        
+        config = make_fake_config()
+        config.multipart_threshold_mb = 0.5
+        config.part_size_mb = 0.1
+        config.part_concurrency = 1
+        config.checkpoint_dir = os.path.join(test_dir, "checkpoints")
+        
+        bucket = FakeBucket(latency=0)
+        bucket.fail_parts = {6}
+        uploader = OSSUploader(config, bucket=bucket)
+        
+        # 第一次上传在第6片中断
+        success, _ = uploader.upload_file(local_path, "root/scan.tiff")
+        assert not success
+        first_parts = set(bucket.uploaded_parts)
+        assert {1, 2, 3, 4, 5} <= first_parts and 6 not in first_parts
+        assert len(os.listdir(config.checkpoint_dir)) == 1
+        
+        # 第二次只上传剩余分片
+        bucket.uploaded_parts = []
+        success, _ = uploader.upload_file(local_path, "root/scan.tiff")
+        assert success
+        assert sorted(bucket.uploaded_parts) == sorted(set(range(1, 12)) - first_parts)
+        assert bucket.objects["root/scan.tiff"] == data
+        assert bucket.put_count == 0
+        assert os.listdir(config.checkpoint_dir) == []
+        print(f"✓ 中断后续传成功，仅重传未完成的 {len(bucket.uploaded_parts)} 个分片")
+    finally:
+        shutil.rmtree(test_dir)
+
+
+def test_cli_headless():
+    """测试命令行入口：无界面批处理"""
+    print("\n测试命令行入口...")
+    sample_root = os.path.join(os.path.dirname(os.path.abspath(__file__)), "西沟乡麻地沟村（资料扫描）")
+    test_dir = tempfile.mkdtemp()
+    try:
+        root_dir = os.path.join(test_dir, "麻地沟村")
+        os.makedirs(root_dir)
+        households = sorted(os.listdir(sample_root))[:2]
+        for name in households:
+            shutil.copytree(os.path.join(sample_root, name), os.path.join(root_dir, name))
+        
+        exit_code = cli.main([root_dir, "--type", "村", "--page-size", "A5", "--landscape",
+                              "--qr-size", "40", "--batch-pdf", "tile",
+                              "--config", os.path.join(test_dir, "none.json")])
+        assert exit_code == 0
+        assert os.path.exists(os.path.join(root_dir, "麻地沟村_qr_all.pdf"))
+        for name in households:
+            assert os.path.exists(os.path.join(root_dir, name, f"{name}_qr.png"))
+            assert os.path.exists(os.path.join(root_dir, name, f"{name}_qr.pdf"))
+        
+        # 未配置OSS时要求上传应返回参数错误
+        assert cli.main([root_dir, "--upload", "--config", os.path.join(test_dir, "none.json")]) == 2
+        print(f"✓ 命令行处理 {len(households)} 个目录成功")
+    finally:
+        shutil.rmtree(test_dir)
+
+
+def test_log_sink():
+    """测试日志缓冲：多线程写入、批量取出、写入日志文件"""
+    print("\n测试日志缓冲...")
+    test_dir = tempfile.mkdtemp()
+    try:
+        log_file = os.path.join(test_dir, "logs", "processing.log")
+        sink = LogSink(log_file)
+        
+        def writer(worker):
+            for i in range(250):
+                sink.write(f"worker{worker}-{i}")
+        
+        threads = [threading.Thread(target=writer, args=(n,)) for n in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        
+        first_batch = sink.drain(600)
+        rest = sink.drain()
+        assert len(first_batch) == 600 and len(rest) == 400
+        assert sink.drain() == []
+        sink.close()
+        
+        with open(log_file, 'r', encoding='utf-8') as f:
+            assert len(f.readlines()) == 1000
+        print("✓ 1000 条日志分批取出，日志文件完整")
+    finally:
+        shutil.rmtree(test_dir)
+
+
+def test_qr_cache_and_vector_pdf():
+    """测试二维码渲染缓存和矢量二维码PDF"""
+    print("\n测试二维码缓存与矢量PDF...")
+    from reportlab.lib.pagesizes import A4
+    
+    test_dir = tempfile.mkdtemp()
+    try:
+        app = DocumentProcessor(log=print)
+        url = "https://example.com/%E4%BD%95/index.html"
+        qr_render.clear_cache()
+        
+        for i in range(3):
+            assert app.generate_qrcode(url, os.path.join(test_dir, f"qr{i}.png"), 50)
+        info = qr_render.render_qr_png.cache_info()
+        assert info.misses == 1 and info.hits == 2
+        
+        matrix = qr_render.get_qr_matrix(url)
+        assert len(matrix) == len(matrix[0]) and any(any(row) for row in matrix)
+        
+        raster_pdf = os.path.join(test_dir, "raster.pdf")
+        vector_pdf = os.path.join(test_dir, "vector.pdf")
+        assert app.create_pdf_with_qrcode(os.path.join(test_dir, "qr0.png"), raster_pdf, A4, 50, 10, 10)
+        # 矢量模式不读取二维码图片
+        assert app.create_pdf_with_qrcode(None, vector_pdf, A4, 50, 10, 10, qr_url=url)
+        raster_size = os.path.getsize(raster_pdf)
+        vector_size = os.path.getsize(vector_pdf)
+        assert vector_size < raster_size
+        print(f"✓ 渲染缓存命中 {info.hits} 次；矢量PDF {vector_size} 字节，位图PDF {raster_size} 字节")
+    finally:
+        shutil.rmtree(test_dir)
+
+
+def test_batch_pdf():
+    """测试合并PDF：按序号写入、拼版分页"""
+    print("\n测试合并PDF...")
+    from reportlab.lib.pagesizes import A4
+    
+    test_dir = tempfile.mkdtemp()
+    try:
+        single_path = os.path.join(test_dir, "single.pdf")
+        writer = BatchPDFWriter(single_path, A4, 50, 10, 10, layout='single')
+        # 乱序添加，其中序号2被跳过
+        writer.add("https://example.com/3", "丁", index=3)
+        writer.add("https://example.com/1", "乙", index=1)
+        assert writer.count == 0
+        writer.add("https://example.com/0", "甲", index=0)
+        assert writer.count == 2
+        writer.skip(2)
+        assert writer.count == 3
+        assert writer.close() == 3 and writer.page_count == 3
+        
+        tile_path = os.path.join(test_dir, "tile.pdf")
+        with BatchPDFWriter(tile_path, A4, 40, layout='tile') as writer:
+            per_page = writer.per_page
+            for i in range(per_page + 1):
+                writer.add(f"https://example.com/{i}", f"家庭{i}")
+        assert per_page > 1 and writer.page_count == 2
+        
+        with open(tile_path, 'rb') as f:
+            assert f.read().count(b"/Type /Page\n") == 2
+        
+        # 分卷写入：写满的文件立即落盘，内存峰值不随二维码数量增长
+        import tracemalloc
+        parts_path = os.path.join(test_dir, "parts.pdf")
+        # 上次运行留下的多余分卷
+        for number in (6, 7):
+            open(os.path.join(test_dir, f"parts_{number}.pdf"), 'wb').close()
+        writer = BatchPDFWriter(parts_path, A4, 50, layout='single', codes_per_file=40)
+        peaks = []
+        tracemalloc.start()
+        try:
+            for i in range(200):
+                # URL在二维码缓存范围内循环，内存变化只来自PDF页面
+                writer.add(f"https://example.com/村/家庭{i % 40}/index.html", f"家庭{i}")
+                if i % 40 == 39:
+                    peaks.append(tracemalloc.get_traced_memory()[1])
+                    tracemalloc.reset_peak()
+                    assert os.path.getsize(writer.paths[-1]) > 0
+        finally:
+            tracemalloc.stop()
+        assert writer.close() == 200 and len(writer.paths) == 5
+        assert writer.paths[1] == os.path.join(test_dir, "parts_2.pdf")
+        assert not os.path.exists(os.path.join(test_dir, "parts_6.pdf"))
+        assert not os.path.exists(os.path.join(test_dir, "parts_7.pdf"))
+        assert max(peaks[1:]) < peaks[1] * 1.5, peaks
+        for path in writer.paths:
+            with open(path, 'rb') as f:
+                assert f.read().count(b"/Type /Page\n") == 40
+        print(f"✓ 单页布局 3 页；拼版布局每页 {per_page} 个二维码；200 个二维码分 5 个文件写入，"
+              f"内存峰值 {max(peaks) // 1024}KB")
+    finally:
+        shutil.rmtree(test_dir)
+
+
+def test_scanner():
+    """测试单次遍历扫描：村/乡/自动目录类型、排除生成文件、记录大小"""
+    print("\n测试目录扫描...")
+    
+    test_dir = tempfile.mkdtemp()
+    try:
+        layout = {
+            os.path.join("甲村", "户1"): ["a.jpg", "b.PNG", "户1_qr.png", "说明.txt"],
+            os.path.join("甲村", "户2"): ["c.jpeg"],
+            os.path.join("乙村", "组1", "户3"): ["d.jpg"],
+            "丙户": ["e.jpg"],
+        }
+        for rel_dir, names in layout.items():
+            os.makedirs(os.path.join(test_dir, rel_dir))
+            for name in names:
+                with open(os.path.join(test_dir, rel_dir, name), 'wb') as f:
+                    f.write(b"x" * 10)
+        os.makedirs(os.path.join(test_dir, ".oss_checkpoints", "tmp"))
+        
+        village = scanner.scan_directories(test_dir, "村")
+        assert sorted(d.name for d in village) == ["丙户", "乙村", "甲村"]
+        
+        town = scanner.scan_directories(test_dir, "乡")
+        assert sorted(d.name for d in town) == ["户1", "户2", "组1"]
+        households = {d.name: d for d in town}
+        assert sorted(f.name for f in households["户1"].images) == ["a.jpg", "b.PNG"]
+        assert all(f.size == 10 and f.mtime_ns > 0 for f in households["户1"].images)
+        assert households["组1"].has_subdirs and not households["组1"].images
+        
+        auto = scanner.scan_directories(test_dir, "自动")
+        assert sorted(d.name for d in auto) == ["丙户", "户1", "户2", "户3"]
+        assert {d.name: d.depth for d in auto}["户3"] == 3
+        assert scanner.count_images(auto) == (5, 50)
+        
+        # 处理器与上传使用同一份扫描结果
+        processor = DocumentProcessor(log=lambda message: None)
+        assert processor.get_target_directories(test_dir, "自动") == [d.path for d in auto]
+        
+        bucket = FakeBucket()
+        uploader = OSSUploader(make_fake_config(), bucket=bucket)
+        success, fail, _ = uploader.upload_directory(
+            households["户1"].path, "测试/户1", files=households["户1"].images
+        )
+        assert (success, fail) == (2, 0) and bucket.put_count == 2
+        print(f"✓ 村 {len(village)} 个、乡 {len(town)} 个、自动 {len(auto)} 个目标目录")
+    finally:
+        shutil.rmtree(test_dir)
+
+
+def test_benchmark_report():
+    """测试基准测试：合成目录树并输出包含各项测量的JSON报告"""
+    print("\n测试基准测试...")
+    import json
+    
+    test_dir = tempfile.mkdtemp()
+    try:
+        report_path = os.path.join(test_dir, "bench.json")
+        exit_code = benchmark.main([
+            "--households", "3", "--villages", "2", "--latency-ms", "1", "--scan-repeat", "2",
+            "--work-dir", os.path.join(test_dir, "trees"), "--output", report_path,
+        ])
+        assert exit_code == 0
+        with open(report_path, 'r', encoding='utf-8') as f:
+            report = json.load(f)
+        
+        stages = {'get_target_directories', 'upload_directory', 'generate_index_html',
+                  'generate_qrcode', 'create_pdf_with_qrcode', 'create_pdf_with_qrcode_raster'}
+        for dir_type in ("村", "乡"):
+            assert set(report['results'][dir_type]) == stages
+            upload = report['results'][dir_type]['upload_directory']
+            assert upload['units'] == report['trees'][dir_type]['files']
+            assert upload['p50_ms'] <= upload['p95_ms']
+        assert report['results']['乡']['generate_qrcode']['calls'] == 6
+        
+        # 与自身对比不应报告退化
+        lines, regressed = benchmark.compare_reports(report, report)
+        assert lines and not regressed
+        print(f"✓ 报告包含 {len(stages)} 项测量，村 {report['trees']['村']['files']} 个文件")
+    finally:
+        shutil.rmtree(test_dir)
+
+
+def test_derivatives():
+    """测试缩略图：进程池生成、尺寸限制、上传到原图旁边并用于图片浏览页面"""
+    print("\n测试缩略图生成...")
+    from PIL import Image
+    
+    test_dir = tempfile.mkdtemp()
+    try:
+        source = os.path.join(os.path.dirname(os.path.abspath(__file__)), "西沟乡麻地沟村（资料扫描）", "何皂皂")
+        household = os.path.join(test_dir, "何皂皂")
+        shutil.copytree(source, household)
+        images = scanner.scan_directory(household)[0].images
+        
+        generator = derivatives.DerivativeGenerator('webp', workers=2)
+        try:
+            generated = generator.generate(household, images)
+            for kind, max_px in derivatives.DERIVATIVE_SIZES.items():
+                assert len(generated[kind]) == len(images)
+                for item in generated[kind]:
+                    with Image.open(item.path) as img:
+                        assert img.format == 'WEBP' and max(img.size) <= max_px
+            
+            # 派生图片在隐藏目录中，不会被当作原图扫描
+            assert len(scanner.scan_directory(household)[0].images) == len(images)
+            
+            # 原图未变化时沿用已有派生图片
+            mtimes = [os.stat(item.path).st_mtime_ns for item in generated['thumb']]
+            again = generator.generate(household, images)
+            assert [os.stat(item.path).st_mtime_ns for item in again['thumb']] == mtimes
+        finally:
+            generator.close()
+        
+        bucket = FakeBucket(latency=0)
+        processor = DocumentProcessor(make_fake_config(), oss_uploader=OSSUploader(make_fake_config(), bucket=bucket),
+                                      log=lambda message: None, process_workers=1)
+        success, url = processor.upload_directory_to_oss(household, test_dir, images=images)
+        assert success and url.endswith("index.html")
+        prefix = f"{os.path.basename(test_dir)}/何皂皂"
+        assert sum(1 for key in bucket.objects if key.startswith(f"{prefix}/_thumb/")) == len(images)
+        assert sum(1 for key in bucket.objects if key.startswith(f"{prefix}/_medium/")) == len(images)
+        
+        with open(os.path.join(household, "index.html"), 'r', encoding='utf-8') as f:
+            html = f.read()
+        assert html.count("srcset=") == len(images) and "400w" in html and "1280w" in html
+        print(f"✓ {len(images)} 张图片生成缩略图和中等尺寸图片，并上传 {bucket.put_count} 个对象")
+    finally:
+        shutil.rmtree(test_dir)
+
+
+def test_process_pool():
+    """测试进程池模式：二维码和PDF在工作进程中生成，结果与线程模式一致"""
+    print("\n测试进程池模式...")
+    from reportlab.lib.pagesizes import A4
     
-    root.destroy()
-    return True
+    test_dir = tempfile.mkdtemp()
+    try:
+        source = os.path.join(os.path.dirname(os.path.abspath(__file__)), "西沟乡麻地沟村（资料扫描）")
+        outputs = {}
+        for mode in ("thread", "process"):
+            root_dir = os.path.join(test_dir, mode, "测试村")
+            for name in ("何皂皂", "刘彩统", "刘来有"):
+                shutil.copytree(os.path.join(source, name), os.path.join(root_dir, name))
+            
+            processor = DocumentProcessor(make_fake_config(), log=lambda message: None,
+                                          process_pool=(mode == "process"), process_workers=2)
+            completed, _, failed = processor.process_all_directories(
+                root_dir, "村", A4, 50, 10, 10, incremental=False
+            )
+            assert (completed, failed) == (3, 0)
+            # 运行结束后进程池已关闭
+            assert processor.cpu_pool._executor is None
+            
+            with open(os.path.join(root_dir, "刘来有", "刘来有_qr.png"), 'rb') as f:
+                outputs[mode] = f.read()
+            assert os.path.exists(os.path.join(root_dir, "刘来有", "刘来有_qr.pdf"))
+        
+        assert outputs["thread"] == outputs["process"]
+        
+        # 工作进程中的异常传回主进程
+        processor = DocumentProcessor(make_fake_config(), log=lambda message: None,
+                                      process_pool=True, process_workers=2)
+        try:
+            assert not processor.generate_qrcode("https://example.com", os.path.join(test_dir, "不存在", "qr.png"))
+        finally:
+            processor.close()
+        print("✓ 进程池模式处理 3 个目录，二维码与线程模式一致")
+    finally:
+        shutil.rmtree(test_dir)
+
+
+def test_gallery_pagination():
+    """测试图片浏览页面：第一页直接输出，其余图片写入内嵌JSON分批加载"""
+    print("\n测试图片浏览页面分页...")
+    import json
+    import re
+    
+    test_dir = tempfile.mkdtemp()
+    try:
+        uploaded_files = []
+        for i in range(150):
+            name = f"图片{i}.jpg" if i != 100 else "a<!--<script>.jpg"
+            file_info = {
+                'local_path': os.path.join(test_dir, name),
+                'url': f"https://bucket.oss-cn-beijing.aliyuncs.com/村/户/{name}",
+            }
+            if i % 2 == 0:
+                file_info['derivatives'] = {
+                    'thumb': f"https://bucket.oss-cn-beijing.aliyuncs.com/村/户/_thumb/{name}.webp",
+                    'medium': f"https://bucket.oss-cn-beijing.aliyuncs.com/村/户/_medium/{name}.webp",
+                }
+            uploaded_files.append(file_info)
+        
+        index_path = os.path.join(test_dir, "index.html")
+        count = gallery.write_index_html(index_path, "测试户", uploaded_files, derivatives.DERIVATIVE_SIZES)
+        assert count == 150 and not os.path.exists(index_path + ".tmp")
+        
+        with open(index_path, 'r', encoding='utf-8') as f:
+            html = f.read()
+        assert "共 150 张图片" in html
+        assert html.count('<div class="image-item"') == gallery.PAGE_SIZE
+        
+        match = re.search(r'<script type="application/json" id="gallery-data">(.*?)</script>', html, re.S)
+        items = json.loads(match.group(1))
+        assert len(items) == 150 - gallery.PAGE_SIZE
+        assert items[100 - gallery.PAGE_SIZE]['name'] == "a<!--<script>.jpg"
+        assert items[0]['srcset'].endswith("1280w") and "/_thumb/" in items[0]['src']
+        assert items[1]['srcset'] == "" and items[1]['src'] == items[1]['url']
+        
+        # 图片不多时不输出JSON清单
+        gallery.write_index_html(index_path, "测试户", uploaded_files[:5])
+        with open(index_path, 'r', encoding='utf-8') as f:
+            assert 'id="gallery-data"' not in f.read()
+        print(f"✓ 第一页 {gallery.PAGE_SIZE} 张直接输出，其余 {len(items)} 张分批加载")
+    finally:
+        shutil.rmtree(test_dir)
+
+
+def test_skip_existing():
+    """测试上传前对比OSS已有文件：分页列举一次，相同文件跳过，变化文件重新上传"""
+    print("\n测试对比OSS已有文件...")
+    test_dir = tempfile.mkdtemp()
+    try:
+        household = os.path.join(test_dir, "家庭1")
+        os.makedirs(household)
+        for i in range(6):
+            with open(os.path.join(household, f"img{i}.jpg"), 'wb') as f:
+                f.write(f"image-{i}".encode())
+        
+        bucket = FakeBucket(latency=0)
+        uploader = OSSUploader(make_fake_config(), bucket=bucket)
+        uploader.upload_directory(household, "root/家庭1")
+        assert bucket.put_count == 6
+        
+        # 修改一个文件，新增一个文件
+        with open(os.path.join(household, "img2.jpg"), 'wb') as f:
+            f.write(b"changed-2")
+        with open(os.path.join(household, "img9.jpg"), 'wb') as f:
+            f.write(b"image-9")
+        
+        uploader.LIST_PAGE_SIZE = 4
+        remote_index = uploader.list_remote_objects("root/家庭1/")
+        assert len(remote_index) == 6 and bucket.list_count == 2
+        
+        success, fail, files = uploader.upload_directory(household, "root/家庭1", remote_index=remote_index)
+        statuses = {os.path.basename(f['local_path']): f['status'] for f in files}
+        assert (success, fail) == (7, 0) and bucket.put_count == 8
+        assert statuses["img2.jpg"] == "changed" and statuses["img9.jpg"] == "uploaded"
+        assert sum(1 for status in statuses.values() if status == "skipped") == 5
+        assert bucket.objects["root/家庭1/img2.jpg"] == b"changed-2"
+        print("✓ 列举 2 页，跳过 5 个相同文件，重新上传 1 个变化文件，新上传 1 个文件")
+    finally:
+        shutil.rmtree(test_dir)
+
+
+def test_shared_session():
+    """测试HTTP会话复用：多个上传器共用同一连接池，超时和连接池大小来自配置"""
+    print("\n测试连接池复用...")
+    config = make_fake_config()
+    config.upload_concurrency = 16
+    assert config.get_pool_size() == 32
+    config.connection_pool_size = 12
+    assert config.get_pool_size() == 12
+    config.connect_timeout = 5
+    config.read_timeout = 30
+    
+    first = OSSUploader(config)
+    second = OSSUploader(config)
+    assert first.bucket.session is second.bucket.session
+    assert first.bucket.timeout == (5, 30)
+    adapter = first.bucket.session.session.get_adapter("https://example.com")
+    assert adapter._pool_maxsize == 12
+    
+    # 配置保存后重新加载
+    test_dir = tempfile.mkdtemp()
+    try:
+        config.config_file = os.path.join(test_dir, "oss_config.json")
+        assert config.save_config()
+        loaded = OSSConfig(config.config_file)
+        assert (loaded.connection_pool_size, loaded.connect_timeout, loaded.read_timeout) == (12, 5, 30)
+    finally:
+        shutil.rmtree(test_dir)
+    print("✓ 两个上传器共用一个会话，连接池 12，超时 (5, 30)")
+
+
+def test_retry_and_dead_letter():
+    """测试重试与失败列表：5xx重试并降低并发，4xx不重试，失败文件可单独重传"""
+    print("\n测试上传重试与失败列表...")
+    import local_oss
+    
+    test_dir = tempfile.mkdtemp()
+    try:
+        household = os.path.join(test_dir, "家庭1")
+        os.makedirs(household)
+        for i in range(4):
+            with open(os.path.join(household, f"img{i}.jpg"), 'wb') as f:
+                f.write(f"image-{i}".encode())
+        
+        prefix = os.path.basename(test_dir) + "/家庭1"
+        config = make_fake_config()
+        config.max_retries = 2
+        bucket = FakeBucket(latency=0)
+        bucket.put_errors = {
+            f"{prefix}/img1.jpg": [FakeServerError(503, 'ServiceUnavailable'), FakeServerError(503)],
+            f"{prefix}/img2.jpg": [FakeServerError(403, 'AccessDenied')],
+            # 生成的 index.html 上传失败不加入失败列表
+            f"{prefix}/index.html": [FakeServerError(403, 'AccessDenied')],
+        }
+        uploader = OSSUploader(config, bucket=bucket)
+        processor = DocumentProcessor(config, oss_uploader=uploader, log=lambda message: None,
+                                      derivatives=False)
+        
+        success, fail = processor.upload_all_directories(test_dir, "村")
+        assert (success, fail) == (1, 0)
+        # img1 重试2次后成功，img2 的403不重试；index.html 只包含上传成功的图片
+        assert bucket.put_count == 4 + 2 + 1
+        assert f"{prefix}/img1.jpg" in bucket.objects and f"{prefix}/img2.jpg" not in bucket.objects
+        assert uploader.limiter.throttle_count == 2
+        assert uploader.limiter.limit == uploader.limiter.max_limit // 2
+        
+        dead_letter = DeadLetterList(test_dir)
+        assert list(dead_letter.entries) == ["家庭1/img2.jpg"]
+        assert dead_letter.entries["家庭1/img2.jpg"]['oss_path'] == f"{prefix}/img2.jpg"
+        
+        # 重试失败文件：只重新上传img2和更新后的index.html
+        put_count = bucket.put_count
+        success, fail = processor.retry_failed_uploads(test_dir)
+        assert (success, fail) == (1, 0)
+        assert bucket.put_count - put_count == 2
+        assert f"{prefix}/img2.jpg" in bucket.objects and f"{prefix}/index.html" in bucket.objects
+        assert not os.path.exists(dead_letter.path)
+        
+        # 并发上限按实际同时进行的请求数计算，一次限流后同时进行的请求数随即下降
+        config = make_fake_config()
+        config.upload_concurrency = 4
+        config.part_concurrency = 2
+        config.retry_base_delay = 0.01
+        bucket = local_oss.LocalBucket(os.path.join(test_dir, "oss"), latency=0.05)
+        uploader = OSSUploader(config, bucket=bucket)
+        assert uploader.limiter.limit == 6
+        for i in range(12):
+            with open(os.path.join(household, f"page{i}.jpg"), 'wb') as f:
+                f.write(f"page-{i}".encode())
+        uploader.upload_directory(household, "村/家庭1")
+        assert bucket.max_active == 4
+        bucket.inject(local_oss.throttled_error(), key="村/家庭1/throttled.jpg")
+        assert uploader.upload_file(os.path.join(household, "img0.jpg"), "村/家庭1/throttled.jpg")[0]
+        assert uploader.limiter.limit == 3
+        bucket.max_active = 0
+        uploader.upload_directory(household, "村/家庭2")
+        assert bucket.max_active == 3
+        
+        # 取消后不再等待退避时间：正在等待重试的上传立即结束
+        config.max_retries = 5
+        config.retry_base_delay = 30
+        uploader = OSSUploader(config, bucket=bucket)
+        bucket.inject(local_oss.server_error(), key="村/家庭3/img0.jpg", count=10)
+        threading.Timer(0.2, uploader.cancel_event.set).start()
+        started = time.monotonic()
+        assert not uploader.upload_file(os.path.join(household, "img0.jpg"), "村/家庭3/img0.jpg")[0]
+        assert time.monotonic() - started < 5
+        print("✓ 5xx重试后成功并将并发减半，403不重试，重试失败文件只上传了失败的图片；限流后同时进行的请求减少；"
+              "取消时不再等待重试")
+    finally:
+        shutil.rmtree(test_dir)
+
+
+def test_bandwidth_limit():
+    """测试带宽限制和上传时段：多线程总速度受令牌桶限制，大文件等到时段内上传"""
+    print("\n测试带宽限制与上传时段...")
+    # 令牌桶：初始有1秒的令牌，透支部分按速度等待
+    clock = [0.0]
+    waits = []
+    token_bucket = bandwidth.TokenBucket(1000, clock=lambda: clock[0], sleep=waits.append)
+    token_bucket.consume(1000)
+    token_bucket.consume(500)
+    clock[0] += 0.25
+    token_bucket.consume(250)
+    assert waits == [0.5, 0.5]
+    
+    # 上传时段跨越午夜
+    now = [time.struct_time((2025, 1, 1, 12, 0, 0, 0, 1, 0))]
+    window = bandwidth.UploadWindow("22:00-06:00", now=lambda: now[0])
+    assert not window.is_open() and window.seconds_until_open() == 10 * 3600
+    now[0] = time.struct_time((2025, 1, 2, 5, 59, 0, 0, 1, 0))
+    assert window.is_open()
+    
+    test_dir = tempfile.mkdtemp()
+    try:
+        household = os.path.join(test_dir, "家庭1")
+        os.makedirs(household)
+        contents = {}
+        for i in range(6):
+            contents[f"img{i}.jpg"] = os.urandom(50 * 1024)
+        contents["scan.tiff"] = os.urandom(300 * 1024)
+        for name, data in contents.items():
+            with open(os.path.join(household, name), 'wb') as f:
+                f.write(data)
+        
+        # 600KB，限速400KB/s：除去1秒的初始令牌，至少需要0.5秒
+        config = make_fake_config()
+        config.bandwidth_limit_kb = 400
+        config.multipart_threshold_mb = 0.2
+        config.part_size_mb = 0.1
+        config.checkpoint_dir = os.path.join(test_dir, "checkpoints")
+        bucket = FakeBucket(latency=0)
+        uploader = OSSUploader(config, bucket=bucket)
+        start = time.perf_counter()
+        success, fail, _ = uploader.upload_directory(household, "root/家庭1")
+        elapsed = time.perf_counter() - start
+        assert (success, fail) == (7, 0) and elapsed >= 0.45
+        assert all(bucket.objects[f"root/家庭1/{name}"] == data for name, data in contents.items())
+        
+        # 上传时段外：小文件直接上传，大文件等待
+        config = make_fake_config()
+        config.upload_window = "22:00-06:00"
+        config.upload_window_min_mb = 0.1
+        bucket = FakeBucket(latency=0)
+        uploader = OSSUploader(config, bucket=bucket)
+        now[0] = time.struct_time((2025, 1, 2, 21, 0, 0, 0, 1, 0))
+        slept = []
+        
+        def fake_sleep(seconds):
+            slept.append(seconds)
+            now[0] = time.struct_time((2025, 1, 2, 22, 0, 0, 0, 1, 0))
+        
+        uploader.window = bandwidth.UploadWindow(config.upload_window, now=lambda: now[0], sleep=fake_sleep)
+        assert uploader.upload_file(os.path.join(household, "img0.jpg"), "root/家庭1/img0.jpg")[0]
+        assert slept == []
+        assert uploader.upload_file(os.path.join(household, "scan.tiff"), "root/家庭1/scan.tiff")[0]
+        assert slept == [bandwidth.UploadWindow.POLL_INTERVAL]
+        print(f"✓ 600KB 限速 400KB/s 用时 {elapsed:.2f}s，大文件等到上传时段才上传")
+    finally:
+        shutil.rmtree(test_dir)
+
+
+def test_normalize_images():
+    """测试上传前压缩：旋转、缩小、去除元数据，按内容哈希缓存，不比原图小时上传原图"""
+    print("\n测试上传前图片压缩...")
+    from PIL import Image
+    from cpu_pool import CPUPool
+    
+    test_dir = tempfile.mkdtemp()
+    try:
+        household = os.path.join(test_dir, "家庭1")
+        os.makedirs(household)
+        # 无损扫描件（带噪点的灰度页面），以及一份内容相同的副本
+        Image.effect_noise((1200, 1600), 30).convert('RGB').save(os.path.join(household, "page.png"))
+        shutil.copy(os.path.join(household, "page.png"), os.path.join(household, "copy.png"))
+        # 带EXIF方向（顺时针旋转90度）的高质量JPEG，与 page.png 换扩展名后重名
+        exif = Image.Exif()
+        exif[0x0112] = 6
+        Image.effect_noise((800, 600), 30).convert('RGB').save(
+            os.path.join(household, "page.jpg"), quality=100, exif=exif)
+        # 已经很小的JPEG，压缩后不会更小
+        Image.effect_noise((64, 64), 60).convert('RGB').save(os.path.join(household, "small.jpg"), quality=30)
+        images = scanner.scan_directory(household)[0].images
+        
+        normalizer = normalize.ImageNormalizer(CPUPool(1), max_dimension=1000)
+        uploads = normalizer.normalize(household, images)
+        by_name = {image.name: upload for image, upload in zip(images, uploads)}
+        assert by_name["page.png"].name == "page.png.jpg" and by_name["copy.png"].name == "copy.jpg"
+        assert by_name["page.png"].path == by_name["copy.png"].path
+        assert by_name["small.jpg"].path == os.path.join(household, "small.jpg")
+        with Image.open(by_name["page.jpg"].path) as img:
+            assert img.size == (600, 800) and not img.getexif()
+        with Image.open(by_name["page.png"].path) as img:
+            assert max(img.size) == 1000
+        cache_dir = os.path.join(household, normalize.NORMALIZED_DIR)
+        assert sorted(os.listdir(cache_dir)).count(normalize.INDEX_FILE) == 1 and len(os.listdir(cache_dir)) == 3
+        
+        # 再次处理时沿用缓存
+        mtimes = [upload.mtime_ns for upload in uploads]
+        assert [upload.mtime_ns for upload in normalizer.normalize(household, images)] == mtimes
+        
+        bucket = FakeBucket(latency=0)
+        config = make_fake_config()
+        messages = []
+        processor = DocumentProcessor(config, oss_uploader=OSSUploader(config, bucket=bucket),
+                                      log=messages.append, process_workers=1, normalize=True,
+                                      normalize_max_dimension=1000)
+        assert processor.upload_directory_to_oss(household, test_dir)[0]
+        # 内容相同的两张图片共用一个缓存文件，日志仍分别记录各自的文件名
+        assert "    ✓ 已上传: page.png.jpg" in messages and "    ✓ 已上传: copy.jpg" in messages
+        prefix = f"{os.path.basename(test_dir)}/家庭1"
+        assert {"page.png.jpg", "copy.jpg", "page.jpg", "small.jpg"} <= {
+            key.rsplit('/', 1)[1] for key in bucket.objects if key.startswith(prefix + "/")}
+        assert len(bucket.objects[f"{prefix}/page.png.jpg"]) < os.path.getsize(os.path.join(household, "page.png"))
+        with open(os.path.join(household, "index.html"), 'r', encoding='utf-8') as f:
+            html = f.read()
+        assert "page.png.jpg" in html and html.count("srcset=") == 4
+        original = sum(image.size for image in images)
+        uploaded = sum(upload.size for upload in uploads)
+        
+        # 主文件名相同、扩展名不同的两张图片转换后不能重名
+        household = os.path.join(test_dir, "家庭2")
+        os.makedirs(household)
+        Image.effect_noise((400, 400), 30).convert('RGB').save(os.path.join(household, "x.png"))
+        Image.effect_noise((400, 400), 40).convert('RGB').save(os.path.join(household, "x.bmp"))
+        images = scanner.scan_directory(household)[0].images
+        names = sorted(upload.name for upload in normalizer.normalize(household, images))
+        assert len(set(names)) == 2 and "x.jpg" in names, names
+        print(f"✓ 4 张图片压缩前 {original // 1024}KB，上传 {uploaded // 1024}KB，相同内容只处理一次，转换后不重名")
+    finally:
+        shutil.rmtree(test_dir)
+
+
+def test_progress_tracking():
+    """测试进度统计：完成百分比、速度、剩余时间，各阶段计数，命令行JSON行输出"""
+    print("\n测试进度统计...")
+    import io
+    import json
+    import contextlib
+    from reportlab.lib.pagesizes import A4
+    
+    clock = [0.0]
+    tracker = progress.ProgressTracker(clock=lambda: clock[0])
+    tracker.start(4, 10, 1000, ('upload', 'qrcode'), upload=True)
+    tracker.add_file(500)
+    tracker.stage_done('upload')
+    tracker.directory_done()
+    clock[0] = 30.0
+    snapshot = tracker.snapshot()
+    # 目录 1/4 与字节 500/1000 取平均
+    assert snapshot['percent'] == 37.5 and snapshot['eta_seconds'] == 50.0
+    assert snapshot['bytes_per_sec'] == round(500 / 30, 1) and snapshot['stages'] == {'upload': 1, 'qrcode': 0}
+    assert "剩余 0:00:50" in progress.format_progress(snapshot)
+    
+    test_dir = tempfile.mkdtemp()
+    try:
+        source = os.path.join(os.path.dirname(os.path.abspath(__file__)), "西沟乡麻地沟村（资料扫描）")
+        root_dir = os.path.join(test_dir, "测试村")
+        for name in ("何皂皂", "刘彩统", "刘来有"):
+            shutil.copytree(os.path.join(source, name), os.path.join(root_dir, name))
+        os.makedirs(os.path.join(root_dir, "空目录"))
+        
+        bucket = FakeBucket(latency=0)
+        config = make_fake_config()
+        processor = DocumentProcessor(config, oss_uploader=OSSUploader(config, bucket=bucket),
+                                      log=lambda message: None, derivatives=False)
+        processor.process_all_directories(root_dir, "村", A4, 50, 10, 10, auto_upload=True, incremental=False)
+        snapshot = processor.progress.snapshot()
+        images = scanner.count_images(scanner.scan_directories(root_dir, "村"))
+        assert snapshot['percent'] == 100 and not snapshot['running']
+        assert (snapshot['files_done'], snapshot['bytes_done']) == images
+        assert (snapshot['files_total'], snapshot['bytes_total']) == images
+        assert snapshot['directories_done'] == snapshot['directories_total'] == 4
+        assert snapshot['stages'] == {'upload': 3, 'index': 3, 'qrcode': 3, 'pdf': 3}
+        
+        # 命令行定时输出JSON行，最后一行为结束时的进度
+        stderr = io.StringIO()
+        with contextlib.redirect_stderr(stderr), contextlib.redirect_stdout(io.StringIO()):
+            assert cli.main([root_dir, "--progress-json", "0.05", "--full",
+                             "--config", os.path.join(test_dir, "none.json")]) == 0
+        lines = [json.loads(line) for line in stderr.getvalue().splitlines()]
+        assert lines and lines[-1]['percent'] == 100 and lines[-1]['stages'] == {'qrcode': 3, 'pdf': 3}
+        print(f"✓ {images[0]} 张图片、4 个目录，进度达到100%，命令行输出 {len(lines)} 行进度")
+    finally:
+        shutil.rmtree(test_dir)
+
+
+def test_cancel_and_resume():
+    """测试取消与断点续传：取消后保留运行断点，再次运行只处理未完成的目录"""
+    print("\n测试取消与断点续传...")
+    from reportlab.lib.pagesizes import A4
+    from run_checkpoint import RunCheckpoint
+    
+    class CancellingBucket(FakeBucket):
+        """上传指定数量的文件后取消运行，并记录上传过的对象"""
+        
+        def __init__(self):
+            super().__init__(latency=0)
+            self.cancel_after = None
+            self.processor = None
+            self.keys = []
+        
+        def put_object_from_file(self, key, filename):
+            result = super().put_object_from_file(key, filename)
+            self.keys.append(key)
+            if len(self.keys) == self.cancel_after:
+                self.processor.cancel()
+            return result
+    
+    test_dir = tempfile.mkdtemp()
+    try:
+        for i in range(1, 5):
+            household = os.path.join(test_dir, f"家庭{i}")
+            os.makedirs(household)
+            for j in range(2):
+                with open(os.path.join(household, f"img{j}.jpg"), 'wb') as f:
+                    f.write(f"image-{i}-{j}".encode())
+        checkpoint_path = os.path.join(test_dir, RunCheckpoint.FILE_NAME)
+        
+        for mode in ('upload', 'process'):
+            config = make_fake_config()
+            config.upload_concurrency = 1
+            bucket = CancellingBucket()
+            processor = DocumentProcessor(config, oss_uploader=OSSUploader(config, bucket=bucket),
+                                          log=lambda message: None, derivatives=False, max_in_flight=1)
+            bucket.processor = processor
+            # 第一个目录的2张图片和index.html上传完成后，在第二个目录上传第1张图片时取消
+            bucket.cancel_after = 4
+            
+            def run():
+                if mode == 'upload':
+                    return processor.upload_all_directories(test_dir, "村", incremental=False)
+                return processor.process_all_directories(test_dir, "村", A4, 50, 10, 10,
+                                                         auto_upload=True, incremental=False)
+            
+            run()
+            assert processor.cancelled and os.path.exists(checkpoint_path)
+            assert len(bucket.keys) == 4 and bucket.keys[2].endswith("/index.html")
+            assert processor.progress.snapshot()['percent'] < 100
+            first_dir = bucket.keys[0].rsplit('/', 1)[0]
+            interrupted = bucket.keys[3]
+            
+            # 再次运行：完成的目录不再上传，中断目录中已上传的图片记录在本次运行清单中，不重复上传
+            bucket.keys = []
+            bucket.cancel_after = None
+            result = run()
+            assert result == ((4, 0) if mode == 'upload' else (4, 0, 0))
+            assert not any(key.startswith(first_dir + '/') for key in bucket.keys)
+            assert interrupted not in bucket.keys
+            assert sum(key.endswith("/index.html") for key in bucket.keys) == 3
+            assert not os.path.exists(checkpoint_path)
+            assert not os.path.exists(os.path.join(test_dir, RunCheckpoint.MANIFEST_NAME))
+            if mode == 'process':
+                assert all(os.path.exists(os.path.join(test_dir, f"家庭{i}", f"家庭{i}_qr.pdf"))
+                           for i in range(1, 5))
+            
+            # 参数不同或 resume=False 时不沿用旧断点
+            assert not RunCheckpoint(test_dir).begin("other")
+            RunCheckpoint(test_dir).finish()
+        print("✓ 取消后保留断点，再次运行跳过已完成的目录和已上传的图片，完成后删除断点")
+    finally:
+        shutil.rmtree(test_dir)
+
+
+def test_local_oss_emulator():
+    """测试本地OSS模拟器：对象存储与列举、故障注入下的重试、限流、分片续传和带宽限制"""
+    print("\n测试本地OSS模拟器...")
+    import json
+    import local_oss
+    
+    test_dir = tempfile.mkdtemp()
+    try:
+        household = os.path.join(test_dir, "村", "家庭1")
+        os.makedirs(household)
+        for i in range(6):
+            with open(os.path.join(household, f"img{i}.jpg"), 'wb') as f:
+                f.write(os.urandom(2000 + i))
+        
+        # endpoint 为 file:// 时上传器使用本地模拟器，不需要AccessKey
+        config = make_fake_config()
+        config.access_key_id = config.access_key_secret = ""
+        config.endpoint = "file://" + os.path.join(test_dir, "oss")
+        assert config.is_valid()
+        uploader = OSSUploader(config)
+        bucket = uploader.bucket
+        assert isinstance(bucket, local_oss.LocalBucket) and uploader.test_connection()[0]
+        
+        bucket.inject(local_oss.server_error(), operation='put_object', key="村/家庭1/img1.jpg", count=2)
+        bucket.inject(local_oss.LocalOSSError(403, 'AccessDenied'), operation='put_object', key="村/家庭1/img2.jpg")
+        success, fail, _ = uploader.upload_directory(household, "村/家庭1")
+        assert (success, fail) == (5, 1) and bucket.errors == {'InternalError': 2, 'AccessDenied': 1}
+        with open(os.path.join(household, "img1.jpg"), 'rb') as f:
+            content = f.read()
+        head = bucket.head_object("村/家庭1/img1.jpg")
+        assert head.etag == hashlib.md5(content).hexdigest().upper() and head.content_type == 'image/jpeg'
+        assert not bucket.object_exists("村/家庭1/img2.jpg")
+        
+        # 分页和公共前缀
+        page = bucket.list_objects("村/", '', '', 2)
+        assert [obj.key for obj in page.object_list] == ["村/家庭1/img0.jpg", "村/家庭1/img1.jpg"]
+        assert page.is_truncated and len(uploader.list_remote_objects("村/家庭1/")) == 5
+        assert bucket.list_objects("村/", '/').prefix_list == ["村/家庭1/"]
+        
+        # 限流：同时处理的请求数超过上限时返回503，上传器降低并发后全部成功
+        throttled = local_oss.LocalBucket(os.path.join(test_dir, "throttled"), latency=0.02, max_concurrency=2)
+        config = make_fake_config()
+        config.upload_concurrency = 6
+        config.max_retries = 10
+        uploader = OSSUploader(config, bucket=throttled)
+        success, fail, _ = uploader.upload_directory(household, "村/家庭1")
+        assert (success, fail) == (6, 0) and throttled.max_active <= 2
+        assert throttled.errors.get('SlowDown') and uploader.limiter.throttle_count > 0
+        
+        # 分片上传：第3个分片连接中断后，再次上传只传输剩余分片
+        big_file = os.path.join(test_dir, "big.tif")
+        with open(big_file, 'wb') as f:
+            f.write(os.urandom(5 * OSSUploader.MIN_PART_SIZE))
+        multipart = local_oss.LocalBucket(os.path.join(test_dir, "multipart"))
+        config = make_fake_config()
+        config.max_retries = 0
+        config.multipart_threshold_mb = 0.2
+        config.part_size_mb = OSSUploader.MIN_PART_SIZE / 1024 / 1024
+        config.part_concurrency = 1
+        config.checkpoint_dir = os.path.join(test_dir, "checkpoints")
+        uploader = OSSUploader(config, bucket=multipart)
+        multipart.inject(local_oss.network_error(), operation='upload_part', after=2)
+        assert not uploader.upload_file(big_file, "big.tif")[0]
+        uploaded_parts = multipart.requests['upload_part'] - 1
+        assert uploaded_parts >= 2
+        multipart.requests.clear()
+        assert uploader.upload_file(big_file, "big.tif")[0]
+        assert multipart.requests['upload_part'] == 5 - uploaded_parts and multipart.requests['list_parts'] == 1
+        with open(big_file, 'rb') as f:
+            content = f.read()
+        with open(os.path.join(multipart.objects_dir, "big.tif"), 'rb') as f:
+            assert f.read() == content
+        head = multipart.head_object("big.tif")
+        assert head.etag.endswith("-5") and head.content_length == len(content)
+        assert not os.listdir(multipart.uploads_dir)
+        
+        # 带宽：所有请求共用上行带宽，超出1秒突发量的数据按带宽等待（等待时间按累计欠量计算）
+        sleeps = []
+        limited = local_oss.LocalBucket(os.path.join(test_dir, "limited"), bandwidth=100 * 1024,
+                                        sleep=sleeps.append)
+        limited.put_object("a.bin", b"x" * 300 * 1024)
+        assert abs(max(sleeps) - 2.0) < 0.1 and limited.bytes_received == 300 * 1024
+        
+        # 基准测试可使用本地模拟器并注入随机故障
+        report_path = os.path.join(test_dir, "bench.json")
+        assert benchmark.main(["--type", "村", "--households", "2", "--latency-ms", "1", "--scan-repeat", "1",
+                               "--local-oss", "--failure-rate", "0.3", "--work-dir", os.path.join(test_dir, "bench"),
+                               "--output", report_path]) == 0
+        with open(report_path, 'r', encoding='utf-8') as f:
+            upload = json.load(f)['results']['村']['upload_directory']
+        assert upload['failed_files'] == 0 and upload['injected_errors'].get('InternalError')
+        print(f"✓ 重试、限流（最多 {throttled.max_active} 个并发）、分片续传和带宽限制均可在本地重现")
+    finally:
+        shutil.rmtree(test_dir)
+
+
+def test_cross_directory_dedup():
+    """测试跨目录去重：相同内容只上传一次，其余副本服务端复制，统计节省的字节数"""
+    print("\n测试跨目录去重...")
+    import local_oss
+    
+    test_dir = tempfile.mkdtemp()
+    try:
+        root_dir = os.path.join(test_dir, "测试村")
+        id_card = os.urandom(50000)
+        for i in range(1, 4):
+            household = os.path.join(root_dir, f"家庭{i}")
+            os.makedirs(household)
+            # 同一张身份证扫描进每个家庭，家庭1中还有一份重复
+            for name in ["身份证.jpg"] + (["身份证副本.jpg"] if i == 1 else []):
+                with open(os.path.join(household, name), 'wb') as f:
+                    f.write(id_card)
+            with open(os.path.join(household, "户口本.jpg"), 'wb') as f:
+                f.write(os.urandom(30000))
+        
+        bucket = local_oss.LocalBucket(os.path.join(test_dir, "oss"), latency=0.01)
+        config = make_fake_config()
+        messages = []
+        processor = DocumentProcessor(config, oss_uploader=OSSUploader(config, bucket=bucket),
+                                      log=messages.append, derivatives=False)
+        assert processor.upload_all_directories(root_dir, "村") == (3, 0)
+        # 身份证只上传一次，其余3份服务端复制；每个家庭的户口本和index.html正常上传
+        assert bucket.requests['copy_object'] == 3 and bucket.requests['put_object'] == 1 + 3 + 3
+        assert processor.content_index.bytes_saved == 3 * len(id_card)
+        assert bucket.bytes_received < 2 * len(id_card) + 3 * 30000 + 3 * 10000
+        for i in range(1, 4):
+            with open(os.path.join(bucket.objects_dir, "测试村", f"家庭{i}", "身份证.jpg"), 'rb') as f:
+                assert f.read() == id_card
+        assert any("节省上传 0.1MB" in message for message in messages)
+        assert processor.oss_uploader.content_index is None
+        
+        # 新增的家庭：清单中已上传的内容作为复制来源；来源对象被删除时改为上传
+        household = os.path.join(root_dir, "家庭4")
+        os.makedirs(household)
+        with open(os.path.join(household, "身份证.jpg"), 'wb') as f:
+            f.write(id_card)
+        bucket.requests.clear()
+        assert processor.upload_all_directories(root_dir, "村") == (4, 0)
+        assert bucket.requests['copy_object'] == 1 and bucket.requests['put_object'] == 1
+        
+        shutil.rmtree(os.path.join(bucket.objects_dir, "测试村"))
+        shutil.rmtree(os.path.join(root_dir, "家庭4"))
+        household = os.path.join(root_dir, "家庭5")
+        os.makedirs(household)
+        with open(os.path.join(household, "身份证.jpg"), 'wb') as f:
+            f.write(id_card)
+        bucket.requests.clear()
+        processor.upload_all_directories(root_dir, "村")
+        assert os.path.exists(os.path.join(bucket.objects_dir, "测试村", "家庭5", "身份证.jpg"))
+        
+        # 关闭去重时全部正常上传
+        bucket.requests.clear()
+        processor.dedup = False
+        processor.upload_all_directories(root_dir, "村", incremental=False)
+        assert 'copy_object' not in bucket.requests and processor.content_index is None
+        
+        # 已上传的文件被改写后，相同的旧内容不能再从该对象复制
+        rewrite_root = os.path.join(test_dir, "改写村")
+        os.makedirs(os.path.join(rewrite_root, "家庭1"))
+        content_a, content_b = os.urandom(5000), os.urandom(6000)
+        with open(os.path.join(rewrite_root, "家庭1", "a.jpg"), 'wb') as f:
+            f.write(content_a)
+        config = make_fake_config()
+        config.upload_concurrency = 1
+        bucket = local_oss.LocalBucket(os.path.join(test_dir, "oss2"))
+        processor = DocumentProcessor(config, oss_uploader=OSSUploader(config, bucket=bucket),
+                                      log=lambda message: None, derivatives=False)
+        assert processor.upload_all_directories(rewrite_root, "村") == (1, 0)
+        with open(os.path.join(rewrite_root, "家庭1", "a.jpg"), 'wb') as f:
+            f.write(content_b)
+        os.makedirs(os.path.join(rewrite_root, "家庭2"))
+        with open(os.path.join(rewrite_root, "家庭2", "c.jpg"), 'wb') as f:
+            f.write(content_a)
+        assert processor.upload_all_directories(rewrite_root, "村") == (2, 0)
+        for name, content in (("家庭1/a.jpg", content_b), ("家庭2/c.jpg", content_a)):
+            with open(os.path.join(bucket.objects_dir, "改写村", *name.split('/')), 'rb') as f:
+                assert f.read() == content, name
+        
+        # 同一运行中来源对象被其他内容覆盖：按ETag条件复制失败，改为上传
+        index = ContentIndex()
+        uploader = processor.oss_uploader
+        uploader.content_index = index
+        index.add(hashlib.md5(content_a).hexdigest(), len(content_a), "改写村/家庭2/c.jpg")
+        bucket.put_object("改写村/家庭2/c.jpg", content_b)
+        with open(os.path.join(rewrite_root, "家庭1", "d.jpg"), 'wb') as f:
+            f.write(content_a)
+        success, _ = uploader.upload_file(os.path.join(rewrite_root, "家庭1", "d.jpg"), "改写村/家庭1/d.jpg")
+        assert success and index.copied_files == 0
+        with open(os.path.join(bucket.objects_dir, "改写村", "家庭1", "d.jpg"), 'rb') as f:
+            assert f.read() == content_a
+        uploader.content_index = None
+        
+        # 分片上传的大文件：按OSS返回的ETag（哈希-分片数）作为复制条件，副本直接复制
+        large_root = os.path.join(test_dir, "大文件村")
+        scan = os.urandom(3 * 1024 * 1024)
+        for household in ("家庭1", "家庭2"):
+            os.makedirs(os.path.join(large_root, household))
+            with open(os.path.join(large_root, household, "scan.jpg"), 'wb') as f:
+                f.write(scan)
+        config = make_fake_config()
+        config.upload_concurrency = 1
+        config.multipart_threshold_mb = 1
+        config.part_size_mb = 1
+        config.checkpoint_dir = os.path.join(test_dir, "checkpoints")
+        bucket = local_oss.LocalBucket(os.path.join(test_dir, "oss3"))
+        processor = DocumentProcessor(config, oss_uploader=OSSUploader(config, bucket=bucket),
+                                      log=lambda message: None, derivatives=False)
+        assert processor.upload_all_directories(large_root, "村") == (2, 0)
+        assert bucket.requests['copy_object'] == 1 and bucket.requests['upload_part'] == 3
+        assert processor.content_index.copied_files == 1 and processor.content_index.bytes_saved == len(scan)
+        with open(os.path.join(bucket.objects_dir, "大文件村", "家庭2", "scan.jpg"), 'rb') as f:
+            assert f.read() == scan
+        print("✓ 4 份相同的身份证只上传1次，节省 {:.0f}KB；来源对象被改写后不再从其复制；"
+              "分片上传的大文件也可复制".format(3 * len(id_card) / 1024))
+    finally:
+        shutil.rmtree(test_dir)
+
+
+def test_tracing():
+    """测试运行跟踪：各阶段和文件操作的span、Chrome跟踪文件、最慢目录汇总、cProfile和tracemalloc"""
+    print("\n测试运行跟踪...")
+    import json
+    import local_oss
+    import tracing
+    from reportlab.lib.pagesizes import A4
+    
+    # 未开启跟踪时返回共用的空span，不记录任何内容
+    assert not tracing.is_enabled()
+    assert tracing.span('qrcode', 'file', file='a.png') is tracing.span('pdf')
+    
+    test_dir = tempfile.mkdtemp()
+    try:
+        root_dir = os.path.join(test_dir, "测试村")
+        for i in range(1, 4):
+            household = os.path.join(root_dir, f"家庭{i}")
+            os.makedirs(household)
+            for j in range(i):
+                with open(os.path.join(household, f"图片{j}.jpg"), 'wb') as f:
+                    f.write(os.urandom(20000))
+        
+        bucket = local_oss.LocalBucket(os.path.join(test_dir, "oss"), latency=0.01)
+        config = make_fake_config()
+        processor = DocumentProcessor(config, oss_uploader=OSSUploader(config, bucket=bucket),
+                                      log=lambda message: None, derivatives=False)
+        tracer = tracing.start_tracing(profile=True, memory=True)
+        try:
+            processor.process_all_directories(root_dir, "村", A4, 50, 10, 10, auto_upload=True, incremental=False)
+        finally:
+            assert tracing.stop_tracing() is tracer
+        assert not tracing.is_enabled()
+        
+        names = {(name, category) for name, category, _, _, _, _ in tracer.events}
+        for expected in [('scan_directories', 'scan'), ('scan', 'stage'), ('upload', 'stage'),
+                         ('qrcode', 'stage'), ('pdf', 'stage'), ('upload', 'file'), ('qrcode', 'file'),
+                         ('pdf', 'file'), ('index.html', 'file'), ('put_object', 'oss')]:
+            assert expected in names, expected
+        uploads = [args for name, category, _, _, _, args in tracer.events if (name, category) == ('upload', 'file')]
+        # 6 张图片和 3 个 index.html
+        assert len(uploads) == 9 and all(args['status'] == 'uploaded' for args in uploads)
+        
+        trace_path = os.path.join(test_dir, "trace.json")
+        tracer.write_chrome_trace(trace_path)
+        with open(trace_path, 'r', encoding='utf-8') as f:
+            trace = json.load(f)
+        spans = [event for event in trace['traceEvents'] if event['ph'] == 'X']
+        assert len(spans) == len(tracer.events)
+        assert all(event['dur'] >= 0 and event['ts'] >= 0 for event in spans)
+        assert any(event['ph'] == 'M' for event in trace['traceEvents'])
+        
+        summary = tracer.summary(top_n=2)
+        assert "最慢的 2 个目录" in summary and "最慢的 2 个文件操作" in summary
+        assert "cProfile" in summary and "内存分配峰值" in summary
+        profile_path = os.path.join(test_dir, "run.prof")
+        tracer.write_profile(profile_path)
+        assert os.path.getsize(profile_path) > 0
+        
+        # 命令行：--trace 保存跟踪文件
+        cli_trace = os.path.join(test_dir, "cli_trace.json")
+        assert cli.main([root_dir, "--type", "村", "--full", "--no-resume", "--trace", cli_trace, "--trace-top", "3",
+                         "--config", os.path.join(test_dir, "none.json")]) == 0
+        with open(cli_trace, 'r', encoding='utf-8') as f:
+            assert any(event.get('cat') == 'stage' for event in json.load(f)['traceEvents'])
+        assert not tracing.is_enabled()
+        print(f"✓ 记录 {len(tracer.events)} 个操作，Chrome跟踪文件和汇总正确")
+    finally:
+        shutil.rmtree(test_dir)
+
+
+def test_lazy_startup():
+    """测试快速启动：导入界面模块时不导入oss2/qrcode/PIL/reportlab画布，OSS上传器延迟创建"""
+    print("\n测试快速启动...")
+    import json
+    import subprocess
+    
+    heavy = ['oss2', 'qrcode', 'PIL.Image', 'reportlab.pdfgen.canvas']
+    code = ("import sys, json, main; "
+            f"print(json.dumps([name for name in {heavy!r} if name in sys.modules]))")
+    output = subprocess.run([sys.executable, "-c", code], cwd=os.path.dirname(os.path.abspath(__file__)),
+                            capture_output=True, text=True, check=True).stdout
+    assert json.loads(output.strip().splitlines()[-1]) == []
+    
+    test_dir = tempfile.mkdtemp()
+    try:
+        # 延迟创建：初始化时没有上传器，预热或开始运行时创建并关联取消事件
+        config = make_fake_config()
+        config.endpoint = "file://" + os.path.join(test_dir, "oss")
+        processor = DocumentProcessor(config, log=lambda message: None, defer_oss=True)
+        assert processor.oss_uploader is None
+        uploader = processor.prepare_oss_uploader()
+        assert uploader is not None and processor.prepare_oss_uploader() is uploader
+        assert uploader.cancel_event is processor.cancel_event
+        
+        # 修改配置后重新创建：等待进行中的预热结束，预热创建的旧上传器不会留下
+        processor.oss_uploader = None
+        with processor._uploader_lock:
+            reset = threading.Thread(target=processor.reset_oss_uploader)
+            reset.start()
+            time.sleep(0.05)
+            processor.oss_uploader = uploader
+        reset.join()
+        assert processor.oss_uploader is not None and processor.oss_uploader is not uploader
+        assert processor.oss_uploader.cancel_event is processor.cancel_event
+        
+        processor = DocumentProcessor(config, log=lambda message: None, defer_oss=True)
+        processor.reset_cancel()
+        assert processor.oss_uploader is not None
+        
+        # 启动计时：各阶段毫秒数追加到记录文件
+        import main
+        timer = main.StartupTimer(time.perf_counter() - 0.5)
+        timer.mark('window')
+        timer.mark('window')
+        record_path = os.path.join(test_dir, "logs", "startup.jsonl")
+        timer.save(record_path)
+        timer.save(record_path)
+        with open(record_path, 'r', encoding='utf-8') as f:
+            records = [json.loads(line) for line in f]
+        assert len(records) == 2 and records[0]['window_ms'] >= 500
+        print(f"✓ 界面模块导入时不加载 {len(heavy)} 个重量级模块，OSS上传器延迟创建")
+    finally:
+        shutil.rmtree(test_dir)
+
+
+def test_watch_folder():
+    """测试监视模式：防抖、按目录合并事件、只处理变化的目录（inotify和定时扫描）"""
+    print("\n测试监视模式...")
+    import watch
+    from reportlab.lib.pagesizes import A4
+    
+    # 防抖：持续有事件的目录在静默后就绪，最迟在 max_delay 后就绪
+    now = [0.0]
+    coalescer = watch.ChangeCoalescer(debounce=2, max_delay=5, clock=lambda: now[0])
+    coalescer.add("a")
+    coalescer.add("b")
+    now[0] = 1.5
+    coalescer.add("a")
+    assert coalescer.ready() == [] and coalescer.next_ready_in() == 0.5
+    now[0] = 2.0
+    assert coalescer.ready() == ["b"] and len(coalescer) == 1
+    for t in (3.0, 4.5):
+        now[0] = t
+        coalescer.add("a")
+    now[0] = 5.0
+    assert coalescer.ready() == ["a"] and coalescer.next_ready_in() is None
+    
+    def write_image(path):
+        with open(path, 'wb') as f:
+            f.write(os.urandom(2000))
+    
+    def wait_for(condition, timeout=10):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if condition():
+                return True
+            time.sleep(0.05)
+        return False
+    
+    test_dir = tempfile.mkdtemp()
+    try:
+        backends = ['poll']
+        try:
+            watch.InotifyWatcher(test_dir).close()
+            backends.insert(0, 'inotify')
+        except OSError:
+            pass
+        
+        for backend in backends:
+            root_dir = os.path.join(test_dir, backend, "测试村")
+            for name in ("家庭1", "家庭2"):
+                os.makedirs(os.path.join(root_dir, name))
+                write_image(os.path.join(root_dir, name, "户口本.jpg"))
+            
+            batches = []
+            config = make_fake_config()
+            processor = DocumentProcessor(config, oss_uploader=OSSUploader(config, bucket=FakeBucket(latency=0)),
+                                          log=lambda message: None, derivatives=False)
+            
+            def process(directories):
+                batches.append(list(directories))
+                processor.process_all_directories(root_dir, "村", A4, 50, 10, 10, directories=directories)
+            
+            daemon = watch.WatchDaemon(root_dir, "村", process, debounce=0.3, backend=backend,
+                                       poll_interval=0.2, log=lambda message: None)
+            daemon.start()
+            thread = threading.Thread(target=daemon.run)
+            thread.start()
+            try:
+                # 连续放入多张图片，并复制进一个新的家庭目录
+                for i in range(3):
+                    write_image(os.path.join(root_dir, "家庭1", f"身份证{i}.jpg"))
+                    time.sleep(0.05)
+                new_household = os.path.join(test_dir, backend, "家庭3")
+                os.makedirs(new_household)
+                write_image(os.path.join(new_household, "土地证.jpg"))
+                os.rename(new_household, os.path.join(root_dir, "家庭3"))
+                assert wait_for(lambda: sum(len(batch) for batch in batches) >= 2), batches
+                time.sleep(0.8)
+                
+                # 每个变化的目录只处理一次，未变化的家庭2不处理
+                processed = [os.path.basename(d) for batch in batches for d in batch]
+                assert sorted(processed) == ["家庭1", "家庭3"], (backend, batches)
+                assert os.path.exists(os.path.join(root_dir, "家庭3", "家庭3_qr.pdf"))
+                assert not os.path.exists(os.path.join(root_dir, "家庭2", "家庭2_qr.pdf"))
+                
+                # 生成的文件和非图片文件不触发处理
+                processed_count = len(batches)
+                with open(os.path.join(root_dir, "家庭2", "说明.txt"), 'w', encoding='utf-8') as f:
+                    f.write("备注")
+                write_image(os.path.join(root_dir, "家庭2", "家庭2_qr.png"))
+                time.sleep(1.0)
+                assert len(batches) == processed_count
+            finally:
+                daemon.stop()
+                thread.join(timeout=10)
+            assert not thread.is_alive()
+        print(f"✓ {'、'.join(backends)}：连续放入的图片合并为一次处理，未变化的目录和生成的文件不触发处理")
+    finally:
+        shutil.rmtree(test_dir)
 
 
 if __name__ == "__main__":
     try:
+        test_concurrent_upload()
+        test_staged_pipeline()
+        test_incremental_manifest()
+        test_multipart_resume()
+        test_cli_headless()
+        test_log_sink()
+        test_qr_cache_and_vector_pdf()
+        test_batch_pdf()
+        test_scanner()
+        test_benchmark_report()
+        test_derivatives()
+        test_process_pool()
+        test_gallery_pagination()
+        test_skip_existing()
+        test_shared_session()
+        test_retry_and_dead_letter()
+        test_bandwidth_limit()
+        test_normalize_images()
+        test_progress_tracking()
+        test_cancel_and_resume()
+        test_local_oss_emulator()
+        test_cross_directory_dedup()
+        test_tracing()
+        test_lazy_startup()
+        test_watch_folder()
         test_basic_functions()
     except Exception as e:
         print(f"\n✗ 测试失败: {str(e)}")
@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+运行跟踪与性能分析模块
+处理引擎在每个阶段和每个文件操作外包一层 span()，开启跟踪时记录耗时：
+- 导出为 Chrome 跟踪格式（trace event JSON，可在 chrome://tracing 或 Perfetto 中打开）
+- 文字汇总：各阶段总耗时，最慢的目录和文件
+- 可选 cProfile（所有线程）和 tracemalloc（内存分配最多的代码行）
+
+未开启跟踪时 span() 直接返回一个空操作的上下文管理器，几乎没有开销。
+"""
+
+import os
+import io
+import json
+import time
+import threading
+
+
+class _NullSpan:
+    """未开启跟踪时使用的空span"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+    def set(self, **args):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+# 当前启用的Tracer，None表示未开启跟踪
+_tracer = None
+
+
+def span(name, category='stage', **args):
+    """
+    记录一段操作的耗时
+
+    用法：
+        with span('qrcode', 'file', file=qr_path):
+            ...
+
+    Args:
+        name: 操作名称
+        category: 分类：stage（流水线阶段，args中的directory用于统计目录耗时）、
+                  file（单个文件操作，args中的file用于统计文件耗时）、oss（OSS请求）、scan 等
+        args: 附加信息，写入跟踪文件
+    """
+    tracer = _tracer
+    if tracer is None:
+        return _NULL_SPAN
+    return _Span(tracer, name, category, args)
+
+
+def is_enabled():
+    """是否正在跟踪"""
+    return _tracer is not None
+
+
+class _Span:
+    __slots__ = ('tracer', 'name', 'category', 'args', 'start')
+
+    def __init__(self, tracer, name, category, args):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        end = time.perf_counter_ns()
+        if exc_type is not None:
+            self.args['error'] = exc_type.__name__
+        self.tracer.record(self.name, self.category, self.start, end - self.start, self.args)
+        return False
+
+    def set(self, **args):
+        """补充span的附加信息（例如操作结果）"""
+        self.args.update(args)
+
+
+class Tracer:
+    """一次运行的跟踪记录"""
+
+    def __init__(self, profile=False, memory=False):
+        """
+        Args:
+            profile: 是否同时使用 cProfile 分析所有线程的函数耗时
+            memory: 是否使用 tracemalloc 统计内存分配
+        """
+        self.profile = profile
+        self.memory = memory
+        self.events = []
+        self.thread_names = {}
+        self.origin = time.perf_counter_ns()
+        self.elapsed_ns = 0
+        self._profilers = []
+        self._profile_lock = threading.Lock()
+        self.profile_stats = None
+        self.memory_snapshot = None
+        self.memory_peak = 0
+
+    def record(self, name, category, start_ns, duration_ns, args):
+        """记录一个span（可在任意线程调用）"""
+        tid = threading.get_ident()
+        if tid not in self.thread_names:
+            self.thread_names[tid] = threading.current_thread().name
+        self.events.append((name, category, start_ns, duration_ns, tid, args))
+
+    # ---- 开始和结束 ----
+
+    def _bootstrap_profiler(self, frame, event, arg):
+        """新线程第一次触发profile事件时为该线程启动一个cProfile"""
+        import cProfile
+        profiler = cProfile.Profile()
+        with self._profile_lock:
+            self._profilers.append(profiler)
+        profiler.enable()
+
+    def start(self):
+        # 性能分析模块只在开启对应选项时导入
+        import cProfile
+        import tracemalloc
+        self.origin = time.perf_counter_ns()
+        if self.memory:
+            tracemalloc.start()
+        if self.profile:
+            # cProfile 只分析启用它的线程：之后创建的线程各自启动一个，结束时合并
+            threading.setprofile(self._bootstrap_profiler)
+            profiler = cProfile.Profile()
+            self._profilers.append(profiler)
+            profiler.enable()
+
+    def stop(self):
+        import pstats
+        import tracemalloc
+        self.elapsed_ns = time.perf_counter_ns() - self.origin
+        if self.profile:
+            threading.setprofile(None)
+            with self._profile_lock:
+                profilers = list(self._profilers)
+            profilers[0].disable()
+            self.profile_stats = pstats.Stats(*profilers, stream=io.StringIO())
+        if self.memory:
+            self.memory_snapshot = tracemalloc.take_snapshot()
+            self.memory_peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+    # ---- 导出 ----
+
+    def chrome_trace(self):
+        """
+        Chrome 跟踪格式
+
+        Returns:
+            可直接 json.dump 的字典
+        """
+        pid = os.getpid()
+        trace_events = [
+            {'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': name}}
+            for tid, name in self.thread_names.items()
+        ]
+        for name, category, start_ns, duration_ns, tid, args in list(self.events):
+            trace_events.append({
+                'name': name,
+                'cat': category,
+                'ph': 'X',
+                'ts': (start_ns - self.origin) / 1000,
+                'dur': duration_ns / 1000,
+                'pid': pid,
+                'tid': tid,
+                'args': {key: str(value) for key, value in args.items()},
+            })
+        return {'traceEvents': trace_events, 'displayTimeUnit': 'ms'}
+
+    def write_chrome_trace(self, path):
+        """写入 Chrome 跟踪文件（先写临时文件再替换）"""
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.chrome_trace(), f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def write_profile(self, path):
+        """保存 cProfile 结果（可用 pstats 或 snakeviz 查看）"""
+        if self.profile_stats is not None:
+            self.profile_stats.dump_stats(path)
+
+    def summary(self, top_n=10):
+        """
+        文字汇总：各类操作的次数和耗时、最慢的目录和文件，以及性能分析结果
+
+        Args:
+            top_n: 最慢的目录/文件、函数和内存分配各列出的数量
+        """
+        totals = {}
+        directories = {}
+        files = []
+        for name, category, _, duration_ns, _, args in list(self.events):
+            total = totals.setdefault((category, name), [0, 0, 0])
+            total[0] += 1
+            total[1] += duration_ns
+            total[2] = max(total[2], duration_ns)
+            if category == 'stage' and 'directory' in args:
+                directories[args['directory']] = directories.get(args['directory'], 0) + duration_ns
+            elif category == 'file' and 'file' in args:
+                files.append((duration_ns, name, args['file']))
+
+        lines = [f"跟踪汇总：总耗时 {self.elapsed_ns / 1e9:.2f} 秒，记录 {len(self.events)} 个操作"]
+        lines.append(f"{'分类':<8}{'操作':<28}{'次数':>8}{'总耗时(秒)':>12}{'平均(毫秒)':>12}{'最长(毫秒)':>12}")
+        for (category, name), (count, total_ns, max_ns) in sorted(totals.items(), key=lambda item: -item[1][1]):
+            lines.append(f"{category:<8}{name:<28}{count:>8}{total_ns / 1e9:>12.3f}"
+                         f"{total_ns / count / 1e6:>12.1f}{max_ns / 1e6:>12.1f}")
+
+        if directories:
+            lines.append(f"最慢的 {min(top_n, len(directories))} 个目录（各阶段耗时之和）：")
+            for directory, total_ns in sorted(directories.items(), key=lambda item: -item[1])[:top_n]:
+                lines.append(f"  {total_ns / 1e6:10.1f} ms  {directory}")
+        if files:
+            lines.append(f"最慢的 {min(top_n, len(files))} 个文件操作：")
+            for duration_ns, name, path in sorted(files, key=lambda item: -item[0])[:top_n]:
+                lines.append(f"  {duration_ns / 1e6:10.1f} ms  {name:<12} {path}")
+
+        if self.profile_stats is not None:
+            stream = io.StringIO()
+            self.profile_stats.stream = stream
+            self.profile_stats.sort_stats('cumulative').print_stats(top_n)
+            lines.append("cProfile（按累计耗时排序）：")
+            lines.extend("  " + line for line in stream.getvalue().strip().splitlines())
+
+        if self.memory_snapshot is not None:
+            lines.append(f"内存分配峰值 {self.memory_peak / 1024 / 1024:.1f}MB，分配最多的代码行：")
+            for stat in self.memory_snapshot.statistics('lineno')[:top_n]:
+                lines.append(f"  {stat}")
+
+        return "\n".join(lines)
+
+
+def start_tracing(profile=False, memory=False):
+    """
+    开始跟踪（同一时间只能有一个跟踪）
+
+    Returns:
+        Tracer
+    """
+    global _tracer
+    tracer = Tracer(profile, memory)
+    tracer.start()
+    _tracer = tracer
+    return tracer
+
+
+def stop_tracing():
+    """
+    结束跟踪
+
+    Returns:
+        结束的 Tracer，未开启跟踪时为None
+    """
+    global _tracer
+    tracer = _tracer
+    _tracer = None
+    if tracer is not None:
+        tracer.stop()
+    return tracer
@@ -0,0 +1,440 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+监视目录模块（持续增量处理）
+扫描人员全天把新的家庭扫描件放进目录树。监视模式常驻运行：
+- Linux 上使用 inotify 监视整个目录树，其他系统或 inotify 不可用时定时扫描比较
+- 文件事件归并到所属的目标目录（家庭目录），同一目录的多次事件合并为一次
+- 目录在一段时间内（debounce）没有新事件后才处理，一批扫描件只处理一次
+- 处理前比较目录中图片的名称、大小和修改时间，未变化的目录不再处理
+"""
+
+import os
+import sys
+import time
+import errno
+import select
+import struct
+import threading
+from scanner import (DIR_TYPE_DEPTHS, IMAGE_EXTENSIONS, scan_directory, scan_tree, is_generated_file)
+
+
+# 默认的静默时间（秒）：目录在此时间内没有新事件才开始处理
+DEFAULT_DEBOUNCE = 5.0
+# 定时扫描的默认间隔（秒）
+DEFAULT_POLL_INTERVAL = 10.0
+
+
+def directory_signature(index):
+    """目录的图片签名：名称、大小、修改时间，任一图片变化时签名不同"""
+    return tuple(sorted((image.name, image.size, image.mtime_ns) for image in index.images))
+
+
+def is_relevant_file(name):
+    """文件事件是否需要处理：只关心原始图片（不包括生成的二维码）"""
+    _, ext = os.path.splitext(name)
+    return ext.lower() in IMAGE_EXTENSIONS and not is_generated_file(name)
+
+
+class ChangeCoalescer:
+    """
+    按目录合并变化事件并防抖（线程安全）
+
+    目录在 debounce 秒内没有新事件后就绪；持续有事件的目录最迟在 max_delay 秒后就绪，
+    避免一直在复制文件的目录永远得不到处理。
+    """
+
+    def __init__(self, debounce=DEFAULT_DEBOUNCE, max_delay=None, clock=time.monotonic):
+        """
+        Args:
+            debounce: 静默时间（秒）
+            max_delay: 第一次事件后最长等待时间（秒），默认为静默时间的10倍
+            clock: 时钟函数（测试时可替换）
+        """
+        self.debounce = max(0.0, float(debounce))
+        self.max_delay = max_delay if max_delay is not None else self.debounce * 10
+        self.clock = clock
+        self._lock = threading.Lock()
+        # 目录 → [第一次事件时间, 最近一次事件时间]
+        self._pending = {}
+
+    def add(self, directory):
+        """记录一次目录变化"""
+        now = self.clock()
+        with self._lock:
+            times = self._pending.get(directory)
+            if times is None:
+                self._pending[directory] = [now, now]
+            else:
+                times[1] = now
+
+    def ready(self):
+        """
+        取出已就绪的目录
+
+        Returns:
+            目录列表（按路径排序）
+        """
+        now = self.clock()
+        with self._lock:
+            ready = [directory for directory, (first, last) in self._pending.items()
+                     if now - last >= self.debounce or now - first >= self.max_delay]
+            for directory in ready:
+                del self._pending[directory]
+        return sorted(ready)
+
+    def next_ready_in(self):
+        """距下一个目录就绪的秒数，没有等待中的目录时为None"""
+        now = self.clock()
+        with self._lock:
+            if not self._pending:
+                return None
+            return max(0.0, min(min(last + self.debounce, first + self.max_delay) - now
+                                for first, last in self._pending.values()))
+
+    def __len__(self):
+        with self._lock:
+            return len(self._pending)
+
+
+class PollingWatcher:
+    """定时扫描整个目录树，比较各目标目录的图片签名"""
+
+    def __init__(self, root_dir, dir_type, interval=DEFAULT_POLL_INTERVAL):
+        self.root_dir = root_dir
+        self.dir_type = dir_type
+        self.interval = max(0.1, float(interval))
+        self._signatures = self._scan()
+        self._next_poll = time.monotonic() + self.interval
+
+    def _scan(self):
+        return {index.path: directory_signature(index) for index in scan_tree(self.root_dir, self.dir_type)}
+
+    def poll(self, timeout):
+        """
+        等待变化
+
+        Args:
+            timeout: 最长等待秒数
+
+        Returns:
+            [(路径, 是否为目录), ...]，这里给出的都是签名变化的目标目录
+        """
+        wait = self._next_poll - time.monotonic()
+        if wait > timeout:
+            time.sleep(max(0.0, timeout))
+            return []
+        time.sleep(max(0.0, wait))
+        self._next_poll = time.monotonic() + self.interval
+        signatures = self._scan()
+        changed = [path for path, signature in signatures.items() if self._signatures.get(path) != signature]
+        self._signatures = signatures
+        return [(path, True) for path in changed]
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher:
+    """使用 Linux inotify 监视整个目录树（新建的子目录自动加入监视）"""
+
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_DELETE_SELF = 0x00000400
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+    IN_ONLYDIR = 0x01000000
+    IN_ISDIR = 0x40000000
+
+    WATCH_MASK = (IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+                  | IN_DELETE_SELF | IN_ONLYDIR)
+    EVENT_HEADER = struct.Struct('iIII')
+
+    def __init__(self, root_dir):
+        """
+        Raises:
+            OSError: 当前系统不支持 inotify
+        """
+        import ctypes
+        import ctypes.util
+
+        if not sys.platform.startswith('linux'):
+            raise OSError(errno.ENOSYS, "inotify 仅在 Linux 上可用")
+        self._libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self._fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            code = ctypes.get_errno()
+            raise OSError(code, os.strerror(code))
+        self.root_dir = root_dir
+        # 监视描述符 → 目录路径
+        self._watches = {}
+        try:
+            self._add_tree(root_dir)
+        except OSError:
+            self.close()
+            raise
+
+    def _add_watch(self, directory):
+        import ctypes
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(directory), self.WATCH_MASK)
+        if wd < 0:
+            code = ctypes.get_errno()
+            if code == errno.ENOSPC:
+                raise OSError(code, "inotify 监视数量已达系统上限（fs.inotify.max_user_watches）")
+            return False
+        self._watches[wd] = directory
+        return True
+
+    def _add_tree(self, directory):
+        """监视目录及其全部子目录（跳过以“.”开头的目录，例如缩略图缓存）"""
+        stack = [directory]
+        while stack:
+            current = stack.pop()
+            if not self._add_watch(current):
+                continue
+            try:
+                with os.scandir(current) as entries:
+                    for entry in entries:
+                        if not entry.name.startswith('.') and entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+            except OSError:
+                continue
+
+    def poll(self, timeout):
+        """
+        等待变化
+
+        Args:
+            timeout: 最长等待秒数
+
+        Returns:
+            [(路径, 是否为目录), ...]；事件队列溢出时返回根目录，由调用方重新比较全部目录
+        """
+        readable, _, _ = select.select([self._fd], [], [], max(0.0, timeout))
+        if not readable:
+            return []
+
+        changes = []
+        while True:
+            try:
+                data = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            if not data:
+                break
+            offset = 0
+            while offset + self.EVENT_HEADER.size <= len(data):
+                wd, mask, _, length = self.EVENT_HEADER.unpack_from(data, offset)
+                offset += self.EVENT_HEADER.size
+                name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+                offset += length
+                self._handle(wd, mask, name, changes)
+        return changes
+
+    def _handle(self, wd, mask, name, changes):
+        if mask & self.IN_Q_OVERFLOW:
+            changes.append((self.root_dir, True))
+            return
+        directory = self._watches.get(wd)
+        if directory is None:
+            return
+        if mask & self.IN_IGNORED:
+            # 目录已删除或移走
+            del self._watches[wd]
+            return
+        if mask & self.IN_DELETE_SELF:
+            return
+
+        path = os.path.join(directory, name)
+        if mask & self.IN_ISDIR:
+            if name.startswith('.'):
+                return
+            if mask & (self.IN_CREATE | self.IN_MOVED_TO):
+                # 新目录（可能是整个家庭目录被复制或移入）：加入监视，其中已有的图片一并处理
+                self._add_tree(path)
+            changes.append((path, True))
+        elif is_relevant_file(name):
+            changes.append((path, False))
+
+    def close(self):
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+
+def create_watcher(root_dir, dir_type, backend='auto', poll_interval=DEFAULT_POLL_INTERVAL):
+    """
+    创建目录监视器
+
+    Args:
+        root_dir: 根目录
+        dir_type: 目录类型
+        backend: auto（优先 inotify）、inotify 或 poll
+        poll_interval: 定时扫描间隔（秒）
+
+    Returns:
+        (监视器, 实际使用的方式 inotify/poll)
+    """
+    if backend in ('auto', 'inotify'):
+        try:
+            return InotifyWatcher(root_dir), 'inotify'
+        except (OSError, AttributeError):
+            if backend == 'inotify':
+                raise
+    return PollingWatcher(root_dir, dir_type, poll_interval), 'poll'
+
+
+class WatchDaemon:
+    """监视根目录，把变化的目标目录分批交给处理函数"""
+
+    def __init__(self, root_dir, dir_type, process, debounce=DEFAULT_DEBOUNCE, max_delay=None,
+                 backend='auto', poll_interval=DEFAULT_POLL_INTERVAL, log=None):
+        """
+        Args:
+            root_dir: 根目录路径
+            dir_type: 目录类型，"村"、"乡"或"自动"
+            process: 处理函数，参数为本批需要处理的目标目录列表（按路径排序）
+            debounce: 静默时间（秒）
+            max_delay: 目录第一次变化后最长等待时间（秒），默认为静默时间的10倍
+            backend: auto、inotify 或 poll
+            poll_interval: 定时扫描间隔（秒）
+            log: 日志函数
+        """
+        self.root_dir = os.path.abspath(root_dir)
+        self.dir_type = dir_type
+        self.target_depth = DIR_TYPE_DEPTHS[dir_type]
+        self.process = process
+        self.backend = backend
+        self.poll_interval = poll_interval
+        self.coalescer = ChangeCoalescer(debounce, max_delay)
+        self._log = log or print
+        self._stop = threading.Event()
+        self.watcher = None
+        # 目标目录 → 上次处理时的图片签名
+        self.signatures = {}
+        self.batches = 0
+
+    def log(self, message):
+        self._log(message)
+
+    def start(self):
+        """开始监视（之后发生的变化都会被处理），记录各目录当前的签名"""
+        self.watcher, backend = create_watcher(self.root_dir, self.dir_type, self.backend, self.poll_interval)
+        self.signatures = {index.path: directory_signature(index)
+                           for index in scan_tree(self.root_dir, self.dir_type)}
+        self.log(f"开始监视 {self.root_dir}（{'inotify' if backend == 'inotify' else '定时扫描'}，"
+                 f"{len(self.signatures)} 个目标目录，静默 {self.coalescer.debounce:g} 秒后处理）")
+
+    def stop(self):
+        """停止监视（可从其他线程或信号处理函数调用）"""
+        self._stop.set()
+
+    @property
+    def stopped(self):
+        return self._stop.is_set()
+
+    def target_directories(self, path, is_dir):
+        """
+        变化的路径所属的目标目录
+
+        Args:
+            path: 变化的文件或目录
+            is_dir: 是否为目录
+
+        Returns:
+            目标目录列表
+        """
+        path = os.path.abspath(path)
+        directory = path if is_dir else os.path.dirname(path)
+        relative = os.path.relpath(directory, self.root_dir)
+        if relative.startswith('..'):
+            return []
+        parts = [] if relative == '.' else relative.split(os.sep)
+        if any(part.startswith('.') for part in parts):
+            return []
+
+        if self.target_depth is None:
+            # “自动”：最深一级目录；文件所在目录即目标目录，新增的目录取其中最深的各级目录
+            if not is_dir:
+                return [directory] if parts else []
+            if parts:
+                try:
+                    _, subdirs = scan_directory(directory)
+                except OSError:
+                    return []
+                if not subdirs:
+                    return [directory]
+            return [index.path for index in scan_tree(directory, self.dir_type)]
+
+        if len(parts) >= self.target_depth:
+            return [os.path.join(self.root_dir, *parts[:self.target_depth])]
+        if not is_dir:
+            # 目标目录之上的文件（例如根目录中的文件）不属于任何目标目录
+            return []
+        # 新增的上级目录（例如整个村被复制进来）：其中的全部目标目录
+        return [index.path for index in scan_tree(directory, self.target_depth - len(parts))]
+
+    def changed_directories(self, directories):
+        """
+        过滤出图片确实变化的目录，并更新签名
+
+        Returns:
+            需要处理的目录列表
+        """
+        changed = []
+        for directory in directories:
+            try:
+                index, subdirs = scan_directory(directory)
+            except OSError:
+                # 目录已被删除或移走
+                self.signatures.pop(directory, None)
+                continue
+            if self.target_depth is None and subdirs:
+                continue
+            signature = directory_signature(index)
+            if self.signatures.get(directory) == signature:
+                continue
+            self.signatures[directory] = signature
+            # 新建的空目录（图片还没复制进来）或图片已全部删除的目录无需处理
+            if index.images:
+                changed.append(directory)
+        return changed
+
+    def run_once(self, timeout=1.0):
+        """
+        处理一轮事件：等待变化、合并，处理已就绪的目录
+
+        Returns:
+            本轮处理的目录列表
+        """
+        wait = self.coalescer.next_ready_in()
+        wait = timeout if wait is None else min(timeout, wait)
+        for path, is_dir in self.watcher.poll(wait):
+            for directory in self.target_directories(path, is_dir):
+                self.coalescer.add(directory)
+
+        directories = self.changed_directories(self.coalescer.ready())
+        if directories and not self.stopped:
+            self.batches += 1
+            self.log(f"检测到 {len(directories)} 个目录有变化：{', '.join(os.path.basename(d) for d in directories)}")
+            self.process(directories)
+        return directories
+
+    def run(self):
+        """持续监视直到 stop() 被调用"""
+        if self.watcher is None:
+            self.start()
+        try:
+            while not self.stopped:
+                self.run_once()
+        finally:
+            self.close()
+            self.log("已停止监视")
+
+    def close(self):
+        """释放监视器（可重复调用）"""
+        if self.watcher is not None:
+            self.watcher.close()